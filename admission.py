@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+
+from aws_clients import AWS_REGION
+from metrics import registry
+
+# Admission configuration
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+# Token bucket for InvokeDataAutomationAsync calls: sustained calls/second and burst size
+ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', '10'))
+ADMISSION_BURST = float(os.environ.get('ADMISSION_BURST', '20'))
+# Concurrent BDA jobs. The limit starts at the initial value, grows by about one per `limit`
+# accepted invocations and is cut by ADMISSION_DECREASE on every throttle (AIMD).
+ADMISSION_INITIAL_CONCURRENCY = float(os.environ.get('ADMISSION_INITIAL_CONCURRENCY', '20'))
+ADMISSION_MIN_CONCURRENCY = float(os.environ.get('ADMISSION_MIN_CONCURRENCY', '1'))
+ADMISSION_MAX_CONCURRENCY = float(os.environ.get('ADMISSION_MAX_CONCURRENCY', '100'))
+ADMISSION_DECREASE = float(os.environ.get('ADMISSION_DECREASE', '0.5'))
+# Throttled invocations are re-queued (keeping their lane) this many times before failing
+ADMISSION_MAX_RETRIES = int(os.environ.get('ADMISSION_MAX_RETRIES', '8'))
+ADMISSION_RETRY_DELAY = float(os.environ.get('ADMISSION_RETRY_DELAY', '0.5'))
+
+# Lanes, highest priority first: a waiting interactive request is always admitted before any batch one
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+LANES = (INTERACTIVE, BATCH)
+
+THROTTLING_ERROR_CODES = (
+    'ThrottlingException',
+    'ServiceQuotaExceededException',
+    'TooManyRequestsException',
+    'LimitExceededException',
+)
+
+QUEUE_DEPTH = registry.gauge('admission_queue_depth', 'Invocations waiting for admission', ('lane', 'region'))
+IN_FLIGHT = registry.gauge('admission_in_flight', 'Admitted invocations whose BDA job has not finished', ('region',))
+CONCURRENCY_LIMIT = registry.gauge('admission_concurrency_limit', 'Current AIMD concurrency limit', ('region',))
+
+
+def is_throttling_error(error):
+    code = (getattr(error, 'response', None) or {}).get('Error', {}).get('Code')
+    return code in THROTTLING_ERROR_CODES
+
+
+def retry_delay(attempt, base=ADMISSION_RETRY_DELAY):
+    # Exponential backoff with full jitter, capped at 30 seconds
+    return random.uniform(0, min(30.0, base * (2 ** attempt)))
+
+
+class AdmissionController:
+    # Lives on the engine's event loop; every method must be called from that loop.
+    # A slot is taken before an invocation and given back when its job finishes (or the
+    # invocation fails), so `in_flight` tracks running BDA jobs against the quota.
+    def __init__(self, rate=ADMISSION_RATE, burst=ADMISSION_BURST, initial_concurrency=ADMISSION_INITIAL_CONCURRENCY,
+                 min_concurrency=ADMISSION_MIN_CONCURRENCY, max_concurrency=ADMISSION_MAX_CONCURRENCY,
+                 decrease=ADMISSION_DECREASE, region=None):
+        # Quotas are per region, so with several regions (regions.py) each has its own controller
+        self.region = region or AWS_REGION
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.limit = initial_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.decrease = decrease
+        self.in_flight = 0
+        self.throttled = 0
+        self._running = set()
+        self._queued = {lane: 0 for lane in LANES}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._refilled_at = time.monotonic()
+        self._timer = None
+        self._publish()
+
+    def queue_depth(self, lane=None):
+        return self._queued[lane] if lane else sum(self._queued.values())
+
+    async def acquire(self, lane=INTERACTIVE):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (LANES.index(lane), next(self._sequence), future))
+        self._queued[lane] += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Admitted just as the caller gave up: hand the slot to the next waiter
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        finally:
+            self._queued[lane] -= 1
+            self._publish()
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def admitted(self, invocation_arn):
+        # The invocation was accepted: its slot is now held until finished() is called
+        self._running.add(invocation_arn)
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+        self._publish()
+
+    def finished(self, invocation_arn):
+        # Invocations started by another process (resumed jobs) were never admitted here
+        if invocation_arn in self._running:
+            self._running.discard(invocation_arn)
+            self.release()
+
+    def on_throttle(self):
+        self.throttled += 1
+        self.limit = max(self.min_concurrency, self.limit * self.decrease)
+        self.release()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _dispatch(self):
+        self._refill()
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.in_flight >= int(self.limit):
+                break
+            if self.tokens < 1:
+                self._wake_in((1 - self.tokens) / self.rate)
+                break
+            heapq.heappop(self._waiters)
+            self.tokens -= 1
+            self.in_flight += 1
+            future.set_result(None)
+        self._publish()
+
+    def _wake_in(self, delay):
+        if self._timer is None:
+            def wake():
+                self._timer = None
+                self._dispatch()
+            self._timer = asyncio.get_running_loop().call_later(delay, wake)
+
+    def _publish(self):
+        for lane in LANES:
+            QUEUE_DEPTH.set(self.queue_depth(lane), lane=lane, region=self.region)
+        IN_FLIGHT.set(self.in_flight, region=self.region)
+        CONCURRENCY_LIMIT.set(round(self.limit, 2), region=self.region)
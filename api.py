@@ -0,0 +1,500 @@
+import asyncio
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import mimetypes
+import os
+import socket
+import ssl
+import time
+import uuid
+from urllib.parse import parse_qs, urlsplit
+
+from blueprint_registry import get_data_automation_arns
+from extraction import DATA_AUTOMATION_STAGE
+from jobs import get_job_store, JOB_SPOOL_DIR, SUCCEEDED, FAILED
+from metrics import registry, start_metrics_server
+from result_cache import get_result_cache, compute_cache_key
+from worker import start_embedded_worker
+
+# HTTP API configuration
+API_HOST = os.environ.get('API_HOST', '0.0.0.0')
+API_PORT = int(os.environ.get('API_PORT', '8080'))
+API_MAX_UPLOAD_BYTES = int(os.environ.get('API_MAX_UPLOAD_MB', '100')) * 1024 * 1024
+# How often the job store is read for jobs that clients are waiting on (SSE and webhooks)
+API_EVENT_INTERVAL = float(os.environ.get('API_EVENT_INTERVAL', '0.5'))
+# Comment lines sent on idle event streams so proxies and the ALB do not drop them
+API_SSE_KEEPALIVE = float(os.environ.get('API_SSE_KEEPALIVE', '15'))
+API_WEBHOOK_TIMEOUT = float(os.environ.get('API_WEBHOOK_TIMEOUT', '10'))
+API_WEBHOOK_RETRIES = int(os.environ.get('API_WEBHOOK_RETRIES', '3'))
+# Comma-separated keys clients send as `Authorization: Bearer <key>` or `X-Api-Key`; every route but
+# /health is refused while none are set
+API_KEYS = tuple(key.strip() for key in os.environ.get('API_KEYS', '').split(',') if key.strip())
+# Webhooks are only sent to these hosts (`hooks.example.com`, or `.example.com` for its subdomains),
+# and each payload is signed with API_WEBHOOK_SECRET; webhooks are refused until both are set
+API_WEBHOOK_ALLOWED_HOSTS = tuple(
+    host.strip().lower() for host in os.environ.get('API_WEBHOOK_ALLOWED_HOSTS', '').split(',') if host.strip()
+)
+API_WEBHOOK_SECRET = os.environ.get('API_WEBHOOK_SECRET', '')
+# Private, loopback and link-local addresses (VPC hosts, the instance metadata service) are refused
+# even for allowed hosts unless this is set
+API_WEBHOOK_ALLOW_PRIVATE = os.environ.get('API_WEBHOOK_ALLOW_PRIVATE', 'false').lower() == 'true'
+# Run a worker inside the API process unless a separate worker service drains the job store
+EMBEDDED_WORKER = os.environ.get('EMBEDDED_WORKER', 'true').lower() == 'true'
+
+SUPPORTED_CONTENT_TYPES = ('application/pdf', 'image/png')
+
+REQUEST_SECONDS = registry.histogram('api_request_seconds', 'HTTP API request handling time', ('route', 'status'))
+WEBHOOK_SECONDS = registry.histogram(
+    'api_webhook_seconds', 'Time from job completion to webhook delivery or giving up', ('outcome',)
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def job_document(job):
+    body = {
+        'job_id': job.id,
+        'status': job.status,
+        'filename': job.filename,
+        'document_type': job.attributes.get('document_type'),
+        'created_at': job.created_at,
+        'updated_at': job.updated_at,
+    }
+    # Where the job's document and BDA outputs are in S3, once a worker has invoked it
+    for name in ('input_s3_uri', 'output_s3_uri'):
+        if getattr(job, name):
+            body[name] = getattr(job, name)
+    if job.status == FAILED:
+        body['error'] = job.error
+    elif job.status == SUCCEEDED:
+        body['result'] = job.result
+    return body
+
+
+class SpoolWriter:
+    # Streams a request body to the spool directory while hashing it, so an upload is never held in
+    # memory. Chunks are written on the event loop: local disk writes of one receive() chunk are
+    # far cheaper than a thread hop each.
+    def __init__(self, extension, max_bytes=API_MAX_UPLOAD_BYTES):
+        os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+        self.extension = extension
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.tmp_path = os.path.join(JOB_SPOOL_DIR, f"{uuid.uuid4().hex}.upload.tmp")
+        self.file = open(self.tmp_path, 'wb')
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise HTTPError(413, f"Document is larger than {self.max_bytes // (1024 * 1024)} MB")
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self, cache_key):
+        # Same naming as jobs.spool_document, so an identical document already spooled is reused
+        self.file.close()
+        path = os.path.join(JOB_SPOOL_DIR, f"{cache_key}{self.extension}")
+        if os.path.exists(path):
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, path)
+        return path
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+# Status placeholder for a subscriber that has not been handed any state yet
+_UNSEEN = object()
+
+
+class JobWatcher:
+    # A single task reads the job store for every job some client is waiting on, however many
+    # event streams or webhooks wait on it, and hands each state change to their queues
+    def __init__(self, interval=API_EVENT_INTERVAL):
+        self.interval = interval
+        # job id -> {queue: last status handed to it}; new subscribers get the current state once
+        self._queues = {}
+        self._task = None
+
+    def subscribe(self, job_id):
+        queue = asyncio.Queue()
+        self._queues.setdefault(job_id, {})[queue] = _UNSEEN
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, job_id, queue):
+        queues = self._queues.get(job_id, {})
+        queues.pop(queue, None)
+        if not queues:
+            self._queues.pop(job_id, None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        store = get_job_store()
+        try:
+            while self._queues:
+                job_ids = list(self._queues)
+                jobs = await loop.run_in_executor(None, lambda: [store.get(job_id) for job_id in job_ids])
+                for job_id, job in zip(job_ids, jobs):
+                    status = job.status if job else None
+                    queues = self._queues.get(job_id, {})
+                    for queue, seen in queues.items():
+                        if seen != status:
+                            queues[queue] = status
+                            queue.put_nowait(job)
+                await asyncio.sleep(self.interval)
+        finally:
+            self._task = None
+
+
+_watcher = JobWatcher()
+# Webhook deliveries in progress; the event loop only keeps weak references to tasks
+_webhook_tasks = set()
+
+
+async def send_json(send, status, body, headers=()):
+    payload = json.dumps(body).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+                   + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def submit_document(scope, receive, send):
+    # POST /documents?document_type=Payslip&filename=payslip.pdf[&webhook=https://...]
+    # The body is the raw document; Content-Type must be application/pdf or image/png.
+    query = {key: values[-1] for key, values in parse_qs(scope['query_string'].decode()).items()}
+    headers = {key.decode().lower(): value.decode() for key, value in scope['headers']}
+    data_automation_arns = get_data_automation_arns()
+    document_type = query.get('document_type') or next(iter(data_automation_arns), None)
+    if document_type not in data_automation_arns:
+        raise HTTPError(400, f"Unknown document type: {document_type}")
+    content_type = headers.get('content-type', '').split(';')[0].strip()
+    if content_type not in SUPPORTED_CONTENT_TYPES:
+        raise HTTPError(415, f"Unsupported content type {content_type or '(none)'}; send application/pdf or image/png")
+    extension = mimetypes.guess_extension(content_type)
+    filename = os.path.basename(query.get('filename') or f"document{extension}")
+    webhook = query.get('webhook') or headers.get('x-webhook-url')
+    if webhook:
+        # Resolved now to refuse bad targets up front, and again on delivery (DNS may have changed)
+        await asyncio.get_running_loop().run_in_executor(None, resolve_webhook, webhook)
+
+    writer = SpoolWriter(extension)
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, "Client disconnected during upload")
+            writer.write(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+    except BaseException:
+        writer.discard()
+        raise
+    if writer.size == 0:
+        writer.discard()
+        raise HTTPError(400, "Empty document")
+
+    data_automation_arn = data_automation_arns[document_type]
+    cache_key = compute_cache_key(writer.digest.hexdigest(), data_automation_arn, DATA_AUTOMATION_STAGE)
+    attributes = {'document_type': document_type, 'size_bytes': writer.size}
+
+    def enqueue():
+        store = get_job_store()
+        cached = get_result_cache().get(cache_key)
+        if cached is not None:
+            writer.discard()
+            return store.get(store.enqueue('', filename, content_type, data_automation_arn, cache_key,
+                                           attributes=attributes, result=cached))
+        # Join a job already running for the same document instead of invoking again
+        active = store.find_active(cache_key)
+        if active is not None:
+            writer.discard()
+            return active
+        document_path = writer.commit(cache_key)
+        return store.get(store.enqueue(document_path, filename, content_type, data_automation_arn, cache_key,
+                                       attributes=attributes))
+
+    job = await asyncio.get_running_loop().run_in_executor(None, enqueue)
+    if webhook:
+        task = asyncio.get_running_loop().create_task(deliver_webhook(job.id, webhook))
+        _webhook_tasks.add(task)
+        task.add_done_callback(_webhook_tasks.discard)
+    await send_json(send, 200 if job.done else 202, job_document(job),
+                    headers=[(b'location', f"/jobs/{job.id}".encode())])
+
+
+async def get_job(job_id, send):
+    job = await asyncio.get_running_loop().run_in_executor(None, get_job_store().get, job_id)
+    if job is None:
+        raise HTTPError(404, f"Job {job_id} not found")
+    await send_json(send, 200, job_document(job))
+
+
+async def wait_for_disconnect(receive):
+    # The request itself (an empty GET body) arrives first; the client going away comes after it
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_job_events(job_id, receive, send):
+    # Server-sent events: a `status` event for every state change and a final `done` event carrying
+    # the result (or error), after which the stream closes
+    queue = _watcher.subscribe(job_id)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    started = False
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            finished, _ = await asyncio.wait({getter, disconnected}, timeout=API_SSE_KEEPALIVE,
+                                             return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in finished:
+                getter.cancel()
+                return
+            job = getter.result() if getter in finished else None
+            if getter not in finished:
+                getter.cancel()
+            if not started:
+                if getter in finished and job is None:
+                    raise HTTPError(404, f"Job {job_id} not found")
+                await send({
+                    'type': 'http.response.start',
+                    'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')],
+                })
+                started = True
+            if getter not in finished:
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            event = 'done' if job is None or job.done else 'status'
+            body = job_document(job) if job else {'job_id': job_id, 'status': None, 'error': 'Job no longer exists'}
+            payload = f"event: {event}\ndata: {json.dumps(body)}\n\n".encode('utf-8')
+            await send({'type': 'http.response.body', 'body': payload, 'more_body': event != 'done'})
+            if event == 'done':
+                return
+    finally:
+        _watcher.unsubscribe(job_id, queue)
+        disconnected.cancel()
+
+
+def webhook_host_allowed(host):
+    host = host.lower().rstrip('.')
+    return any(
+        host == allowed or (allowed.startswith('.') and host.endswith(allowed))
+        for allowed in API_WEBHOOK_ALLOWED_HOSTS
+    )
+
+
+def resolve_webhook(url):
+    # (scheme, host, port, path, address) for a webhook URL, or raises HTTPError. The address is the
+    # one the delivery connects to, so a name cannot resolve to an internal host after this check.
+    if not API_WEBHOOK_ALLOWED_HOSTS or not API_WEBHOOK_SECRET:
+        raise HTTPError(400, "Webhooks are not enabled on this server")
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise HTTPError(400, "Webhook must be an http(s) URL")
+    if parts.username or parts.password:
+        raise HTTPError(400, "Webhook URL must not contain credentials")
+    if not webhook_host_allowed(parts.hostname):
+        raise HTTPError(400, f"Webhook host {parts.hostname} is not allowed")
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    except (ValueError, OSError) as e:
+        raise HTTPError(400, f"Cannot resolve webhook host {parts.hostname}: {e}")
+    for address in addresses:
+        ip = ipaddress.ip_address(address[4][0].split('%')[0])
+        ip = getattr(ip, 'ipv4_mapped', None) or ip
+        # Every address must be public, or the connection could be steered to one that is not
+        if not API_WEBHOOK_ALLOW_PRIVATE and not ip.is_global:
+            raise HTTPError(400, f"Webhook host {parts.hostname} resolves to a non-public address")
+    path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+    return parts.scheme, parts.hostname, port, path, addresses[0][4][0]
+
+
+def sign_webhook(payload, timestamp, secret=API_WEBHOOK_SECRET):
+    # Receivers recompute this over `<timestamp>.<body>` and reject old timestamps to stop replays
+    message = timestamp.encode('utf-8') + b'.' + payload
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+class _PinnedConnection(http.client.HTTPConnection):
+    # Connects to the address resolve_webhook checked rather than resolving the host again
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    # The certificate is still verified against the host name
+    def __init__(self, host, port, address, timeout):
+        super().__init__(host, port, timeout=timeout, context=ssl.create_default_context())
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self._context.wrap_socket(sock, server_hostname=self.host)
+
+
+def post_webhook(url, body):
+    scheme, host, port, path, address = resolve_webhook(url)
+    payload = json.dumps(body).encode('utf-8')
+    timestamp = str(int(time.time()))
+    connection_class = _PinnedHTTPSConnection if scheme == 'https' else _PinnedConnection
+    connection = connection_class(host, port, address, API_WEBHOOK_TIMEOUT)
+    try:
+        # Redirects are not followed, so a receiver cannot bounce the payload to another host
+        connection.request('POST', path, body=payload, headers={
+            'Content-Type': 'application/json',
+            'X-Webhook-Timestamp': timestamp,
+            'X-Webhook-Signature': sign_webhook(payload, timestamp),
+        })
+        response = connection.getresponse()
+        response.read()
+    finally:
+        connection.close()
+    if not 200 <= response.status < 300:
+        raise HTTPError(response.status, f"Webhook answered {response.status}")
+    return response.status
+
+
+async def deliver_webhook(job_id, url):
+    # POSTs the finished job to `url`, retrying with backoff. Deliveries are kept in memory, so a
+    # restart of the API process loses the ones still waiting; GET /jobs/<id> stays authoritative.
+    queue = _watcher.subscribe(job_id)
+    try:
+        job = await queue.get()
+        while job is not None and not job.done:
+            job = await queue.get()
+    finally:
+        _watcher.unsubscribe(job_id, queue)
+    if job is None:
+        return
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    for attempt in range(API_WEBHOOK_RETRIES + 1):
+        try:
+            await loop.run_in_executor(None, post_webhook, url, job_document(job))
+            WEBHOOK_SECONDS.observe(time.perf_counter() - started, outcome='delivered')
+            return
+        except Exception as e:
+            if attempt == API_WEBHOOK_RETRIES:
+                WEBHOOK_SECONDS.observe(time.perf_counter() - started, outcome='failed')
+                print(f"Webhook for job {job_id} to {url} failed: {e}")
+                return
+            await asyncio.sleep(2 ** attempt)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_metrics_server()
+            if EMBEDDED_WORKER:
+                start_embedded_worker()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def authorized(scope):
+    headers = {key.decode().lower(): value.decode() for key, value in scope['headers']}
+    key = headers.get('x-api-key', '')
+    authorization = headers.get('authorization', '')
+    if authorization.lower().startswith('bearer '):
+        key = authorization[len('bearer '):].strip()
+    # Every configured key is compared, in constant time, so timing reveals neither key nor match
+    matches = [hmac.compare_digest(key.encode('utf-8'), allowed.encode('utf-8')) for allowed in API_KEYS]
+    return bool(key) and any(matches)
+
+
+def route(method, path):
+    # (route name, job id) for a request, or raises HTTPError
+    parts = [part for part in path.split('/') if part]
+    if parts == ['health']:
+        name, allowed = 'health', 'GET'
+    elif parts == ['documents']:
+        name, allowed = 'submit', 'POST'
+    elif len(parts) == 2 and parts[0] == 'jobs':
+        name, allowed = 'job', 'GET'
+    elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+        name, allowed = 'events', 'GET'
+    else:
+        raise HTTPError(404, f"No route for {path}")
+    if method != allowed:
+        raise HTTPError(405, f"{method} not allowed on {path}")
+    return name, parts[1] if len(parts) > 1 else None
+
+
+async def app(scope, receive, send):
+    # Plain ASGI application; run it with `python api.py` or any ASGI server (`uvicorn api:app`)
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    started = time.perf_counter()
+    name, status = 'unknown', None
+
+    async def send_tracked(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        await send(message)
+
+    try:
+        name, job_id = route(scope['method'], scope['path'])
+        if name != 'health' and not authorized(scope):
+            raise HTTPError(401, "Missing or invalid API key")
+        if name == 'health':
+            await send_json(send_tracked, 200, {'status': 'ok'})
+        elif name == 'submit':
+            await submit_document(scope, receive, send_tracked)
+        elif name == 'job':
+            await get_job(job_id, send_tracked)
+        else:
+            await stream_job_events(job_id, receive, send_tracked)
+    except Exception as e:
+        # Errors after the response has started (a broken event stream) can only close it
+        if status is None:
+            if not isinstance(e, HTTPError):
+                print(f"API error on {scope['method']} {scope['path']}: {e}")
+            await send_json(send_tracked, getattr(e, 'status', 500), {'error': str(e) if isinstance(e, HTTPError) else 'Internal error'})
+        elif not isinstance(e, HTTPError):
+            raise
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=name, status=str(status))
+
+
+def main():
+    import uvicorn
+    from prewarm import warm_connections
+    if not API_KEYS:
+        print("API_KEYS is not set: every request except /health will be refused", flush=True)
+    if EMBEDDED_WORKER:
+        warm_connections()
+    print(f"Starting API on {API_HOST}:{API_PORT}", flush=True)
+    uvicorn.run(app, host=API_HOST, port=API_PORT, access_log=False, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,105 +1,207 @@
 import streamlit as st
-import boto3
-import json
-import time
-import pandas as pd
-from PIL import Image
-import PyPDF2
-from io import BytesIO
 import os
+from result_cache import get_result_cache, hash_document, compute_cache_key
+from preview import get_preview_cache
+from extraction import DATA_AUTOMATION_STAGE
+from jobs import get_job_store, spool_document, FAILED
+from worker import start_embedded_worker
+from metrics import Trace, start_metrics_server
+from blueprint_registry import get_blueprints, get_data_automation_arns
+from classifier import get_classifier, ROUTED
+from search_index import SEARCH_INDEX_ENABLED, get_search_index
 
-# Initialize AWS clients
-bedrock_automation_client = boto3.client('bedrock-data-automation', region_name='us-west-2')
-bedrock_runtime_client = boto3.client('bedrock-data-automation-runtime', region_name='us-west-2')
-s3_client = boto3.client('s3')
+# Run a worker inside the UI process unless a separate worker service drains the job store
+EMBEDDED_WORKER = os.environ.get('EMBEDDED_WORKER', 'true').lower() == 'true'
+JOB_STATUS_INTERVAL = float(os.environ.get('JOB_STATUS_INTERVAL', '1.0'))
 
-# bucket_name = 'bedrock-bda-us-west-2-683ac04f-fdec-4d70-8794-07acbf8b4d58'
-bucket_name = os.environ.get('S3_BUCKET_NAME')
-Payslip_Data_Automation_ARN = os.environ.get('PAYSLIP_DATA_AUTOMATION_ARN')
+@st.cache_resource
+def start_worker():
+    start_metrics_server()
+    return start_embedded_worker() if EMBEDDED_WORKER else None
 
-def upload_file_to_s3(file, filename):
+def display_inference_result(inference_result):
+    # Create DataFrame only with non-null values and sort by Field
+    filtered_results = {k: v for k, v in inference_result.items() if v is not None and v != ''}
+    if filtered_results:
+        # pandas is only imported once there is a table to render, which keeps cold start fast
+        import pandas as pd
+        df = pd.DataFrame(list(filtered_results.items()), columns=['Field', 'Value'])
+        df = df.sort_values('Field').reset_index(drop=True)  # Sort by Field name and reset index
+        
+        # Add numbered index starting from 1
+        df.index = range(1, len(df) + 1)
+        
+        # Display the DataFrame with the custom index
+        st.table(df)
+    else:
+        st.warning("No valid results found in the document.")
+
+def display_extraction_result(extraction_result):
+    segments = extraction_result['segments']
+    for segment in segments:
+        if len(segments) > 1:
+            pages = ', '.join(str(page + 1) for page in segment['page_indices'])
+            st.write(f"#### Document {segment['segment']}" + (f" (pages {pages})" if pages else ""))
+        display_inference_result(segment['inference_result'])
+
+def display_check_failures(extraction_result, document_type):
+    # The blueprint's consistency checks, run over this document's segments the same way the
+    # result store runs them over whole batches
+    definition = get_blueprints().get(document_type)
+    if definition is None or not definition.checks:
+        return
+    from result_store import check_table, to_table
+    checks = check_table(definition, to_table(definition, [(None, extraction_result)]))
+    for name, column in zip(checks.column_names, checks.columns):
+        failed = [index + 1 for index, passed in enumerate(column.to_pylist()) if not passed]
+        if failed:
+            where = f" (document {', '.join(map(str, failed))})" if len(extraction_result['segments']) > 1 else ""
+            st.warning(f"Consistency check failed: {name}{where}")
+
+def submit_extraction(uploaded_file, document_type, cache_key, trace):
+    store = get_job_store()
+    # Reattach to a job this or another session already started for the same document
+    job = store.find_active(cache_key)
+    if job:
+        return job.id
     try:
-        s3_key = f'input_data/{filename}'
-        # Read the file content into bytes
-        file_bytes = BytesIO(file.getvalue())
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=file_bytes.getvalue(),
-            ContentType=file.type
+        with trace.span('spool'):
+            document_path = spool_document(uploaded_file, uploaded_file.name, cache_key)
+        return store.enqueue(
+            document_path,
+            uploaded_file.name,
+            uploaded_file.type,
+            DATA_AUTOMATION_ARNS[document_type],
+            cache_key,
+            attributes=trace.tags
         )
-        # Verify the file exists in S3
-        try:
-            s3_client.head_object(Bucket=bucket_name, Key=s3_key)
-        except Exception as e:
-            st.error(f"File upload verification failed: {e}")
-            return None
-            
-        return f"s3://{bucket_name}/{s3_key}"
     except Exception as e:
-        st.error(f"Error uploading to S3: {e}")
+        st.error(f"Error submitting document: {e}")
         return None
 
-def invoke_data_automation(input_s3_uri, output_s3_uri, document_type):
-    try:
-        # Verify S3 access before invoking
-        input_key = input_s3_uri.split(f"{bucket_name}/")[1]
-        try:
-            s3_client.head_object(Bucket=bucket_name, Key=input_key)
-        except Exception as e:
-            st.error(f"Cannot access input file in S3: {e}")
-            return None
-
-        response = bedrock_runtime_client.invoke_data_automation_async(
-            inputConfiguration={'s3Uri': input_s3_uri},
-            outputConfiguration={'s3Uri': output_s3_uri},
-            dataAutomationConfiguration={
-                'dataAutomationArn': DATA_AUTOMATION_ARNS[document_type],
-                'stage': 'LIVE'
-            }
+def load_job(job_id):
+    # Job state lives in session state. Only unfinished jobs are read from the job store, and a
+    # finished job's result is memoized by invocation ARN, so reruns never load it again.
+    jobs = st.session_state.setdefault('jobs', {})
+    state = jobs.get(job_id)
+    if state is not None and state['done']:
+        return state
+    job = get_job_store().get(job_id)
+    if job is None:
+        state = {'done': True, 'status': None, 'error': f"Extraction job {job_id} not found."}
+    else:
+        state = {
+            'done': job.done,
+            'status': job.status,
+            'error': f"Extraction failed: {job.error}" if job.status == FAILED else None,
+            'result_key': job.invocation_arn or job.id,
+            'attributes': job.attributes,
+            'timings': job.timings,
+        }
+        if job.done and job.status != FAILED:
+            st.session_state.setdefault('results', {})[state['result_key']] = job.result
+    jobs[job_id] = state
+    return state
+
+@st.fragment(run_every=JOB_STATUS_INTERVAL)
+def job_progress(job_id):
+    # Only this fragment re-executes while the job runs; the rest of the page stays as rendered.
+    # The UI only reads job state: upload, invocation and polling happen in the workers.
+    state = load_job(job_id)
+    if state['done']:
+        # One full rerun renders the result in place of the fragment, which also stops the polling
+        st.rerun()
+    st.info(f"Extracting data from document... ({state['status']})")
+
+def show_job(job_id, trace=None):
+    state = load_job(job_id)
+    if not state['done']:
+        job_progress(job_id)
+        return
+    if state['error']:
+        st.error(state['error'])
+        return
+    result = st.session_state.results[state['result_key']]
+    show_extraction_result(result, trace or Trace(**state['attributes']), state['timings'])
+
+def display_latency_breakdown(timings):
+    # Debug panel: where the time went for the current document
+    if not timings:
+        return
+    with st.expander("Latency breakdown"):
+        import pandas as pd
+        total = sum(timings.values())
+        df = pd.DataFrame(
+            [(stage, seconds, f"{seconds / total:.0%}" if total else "-") for stage, seconds in timings.items()],
+            columns=['Stage', 'Seconds', 'Share']
         )
-        return response['invocationArn']
-    except Exception as e:
-        st.error(f"Error invoking data automation: {e}")
+        df.index = range(1, len(df) + 1)
+        st.table(df)
+
+def classify_document(uploaded_file, document_hash, document_type, trace):
+    # Checked locally before anything is uploaded; memoized so reruns don't classify again
+    classifier = get_classifier()
+    if classifier is None:
         return None
+    classifications = st.session_state.setdefault('classifications', {})
+    key = (document_hash, document_type)
+    if key not in classifications:
+        with trace.span('classify'):
+            classifications[key] = classifier.classify(uploaded_file.getvalue(), uploaded_file.type, document_type)
+    return classifications[key]
 
-def check_invocation_status(invocation_arn):
-    return bedrock_runtime_client.get_data_automation_status(invocationArn=invocation_arn)
+def display_file_content(uploaded_file, document_hash):
+    if uploaded_file.type == "image/png":
+        st.image(uploaded_file.getvalue(), caption='Uploaded Image', use_container_width=True)
+        return None
+    if uploaded_file.type != "application/pdf":
+        return None
+
+    # Only the selected page is extracted, in a worker thread, and kept for later reruns
+    preview = get_preview_cache().get(document_hash, uploaded_file.getvalue(), uploaded_file.type)
+    page_count = preview.page_count
+    page_number = 1
+    if page_count > 1:
+        page_number = st.number_input(f"Preview page (of {page_count})", min_value=1, max_value=page_count, value=1)
+    return page_number, get_preview_cache().render_async(preview, page_number - 1)
 
-def display_inference_result(custom_output_path):
+def render_page_preview(page_number, preview_future):
     try:
-        object_key = custom_output_path[len(f"s3://{bucket_name}/"):]
-        result = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-        content = json.loads(result['Body'].read())
-        inference_result = content.get('inference_result', {})
-        
-        # Create DataFrame only with non-null values and sort by Field
-        filtered_results = {k: v for k, v in inference_result.items() if v is not None and v != ''}
-        if filtered_results:
-            df = pd.DataFrame(list(filtered_results.items()), columns=['Field', 'Value'])
-            df = df.sort_values('Field').reset_index(drop=True)  # Sort by Field name and reset index
-            
-            # Add numbered index starting from 1
-            df.index = range(1, len(df) + 1)
-            
-            # Display the DataFrame with the custom index
-            st.table(df)
-        else:
-            st.warning("No valid results found in the document.")
-                
+        text, thumbnail = preview_future.result()
     except Exception as e:
-        st.error(f"Error fetching output: {e}")
+        st.warning(f"Could not preview page {page_number}: {e}")
+        return
+    st.write(f"Page {page_number}")
+    if thumbnail:
+        st.image(thumbnail)
+    st.write(text)
 
-def display_file_content(uploaded_file):
-    if uploaded_file.type == "image/png":
-        image = Image.open(uploaded_file)
-        st.image(image, caption='Uploaded Image', use_container_width=True)
-    elif uploaded_file.type == "application/pdf":
-        pdf_reader = PyPDF2.PdfReader(uploaded_file)
-        for page_num in range(len(pdf_reader.pages)):
-            st.write(f"Page {page_num + 1}")
-            st.write(pdf_reader.pages[page_num].extract_text())
+def show_extraction_result(extraction_result, trace, timings):
+    st.write("### Structured Data Extracted from Document:")
+    with trace.span('render'):
+        display_extraction_result(extraction_result)
+        display_check_failures(extraction_result, trace.tags.get('document_type'))
+    display_latency_breakdown({**timings, **trace.timings})
+
+def display_search():
+    # Full-text search over the standard output text of every document extracted so far
+    with st.sidebar:
+        st.write("### Search documents")
+        query = st.text_input("Search extracted text", placeholder="e.g. payslip ACME", key="search_query")
+        only_type = st.selectbox("Document type", ("All",) + tuple(DATA_AUTOMATION_ARNS), key="search_type")
+        if not query:
+            return
+        hits = get_search_index().search(query, None if only_type == "All" else only_type)
+        if not hits:
+            st.info("No matching pages.")
+            return
+        import pandas as pd
+        df = pd.DataFrame([
+            {'Document': hit['document'], 'Type': hit['document_type'], 'Page': hit['page'] + 1, 'Match': hit['snippet']}
+            for hit in hits
+        ])
+        df.index = range(1, len(df) + 1)
+        st.table(df)
 
 # Streamlit UI
 st.title("Turn Raw Documents into Actionable Data")
@@ -108,10 +210,16 @@ st.title("Turn Raw Documents into Actionable Data")
 if 'previous_selection' not in st.session_state:
     st.session_state.previous_selection = None
 
+# Document types come from the published ARN map, loaded once per process
+DATA_AUTOMATION_ARNS = get_data_automation_arns()
+if not DATA_AUTOMATION_ARNS:
+    st.error("No document types are configured. Set DATA_AUTOMATION_ARNS or run create_bedrock_data_automation.py.")
+    st.stop()
+
 # Add select box for document type
 document_type = st.selectbox(
     "Select Document Type",
-    ("Payslip")
+    tuple(DATA_AUTOMATION_ARNS)
 )
 
 # Check if document type has changed
@@ -123,46 +231,60 @@ if st.session_state.previous_selection != document_type:
     # Rerun the app to clear all widgets
     st.rerun()
 
-# Define ARNs based on document type
-DATA_AUTOMATION_ARNS = {
-    # "Payslip": "arn:aws:bedrock:us-west-2:680038756295:data-automation-project/fa1b4fa8ffc8"
-    "Payslip": Payslip_Data_Automation_ARN
-}
+start_worker()
+if SEARCH_INDEX_ENABLED:
+    display_search()
+if 'job_ids' not in st.session_state:
+    st.session_state.job_ids = {}
 
 uploaded_file = st.file_uploader("Upload PDF or PNG file", type=["pdf", "png"], key="file_uploader")
 
 if uploaded_file is not None:
-    # Display the uploaded file content
-    display_file_content(uploaded_file)
+    document_hash = hash_document(uploaded_file)
+    page_count = get_preview_cache().get(document_hash, uploaded_file.getvalue(), uploaded_file.type).page_count
+    trace = Trace(document_type=document_type, size_bytes=uploaded_file.size, page_count=page_count)
+
+    # Start the page preview in the background so it never delays the extraction
+    page_preview = display_file_content(uploaded_file, document_hash)
+
+    # Route the document to the type its text matches, or stop before a wasted invocation
+    classification = classify_document(uploaded_file, document_hash, document_type, trace)
+    if classification is not None and classification.rejected:
+        st.warning(f"This does not look like a supported document ({classification.reason}).")
+        if not st.checkbox("Extract anyway"):
+            if page_preview:
+                render_page_preview(*page_preview)
+            st.stop()
+    elif classification is not None and classification.decision == ROUTED:
+        st.info(f"This looks like a {classification.document_type}, so it is extracted with that blueprint instead.")
+        document_type = classification.document_type
+        trace.tags['document_type'] = document_type
     
-    # Process the file
-    with st.spinner('Extracting data from document...'):
-        file_s3_uri = upload_file_to_s3(uploaded_file, uploaded_file.name)
-        if file_s3_uri:
-            invocation_arn = invoke_data_automation(file_s3_uri, f"{file_s3_uri}/output", document_type)
-            if invocation_arn:
-                status = 'Pending'
-                while status != 'Success':
-                    response = check_invocation_status(invocation_arn)
-                    status = response['status']
-                    
-                    if status == 'Success':
-                        try:
-                            output_s3_uri = response['outputConfiguration']['s3Uri']
-                            result = s3_client.get_object(
-                                Bucket=bucket_name, 
-                                Key=output_s3_uri[len(f"s3://{bucket_name}/"):]
-                            )
-                            job_metadata_json = json.loads(result['Body'].read())
-                            
-                            output_metadata = job_metadata_json.get("output_metadata", [])
-                            if output_metadata and output_metadata[0]['segment_metadata']:
-                                custom_output_path = output_metadata[0]['segment_metadata'][0]['custom_output_path']
-                                st.write("### Structured Data Extracted from Document:")
-                                display_inference_result(custom_output_path)
-                            else:
-                                st.error("Custom output path not found in job metadata.")
-                        except Exception as e:
-                            st.error(f"Error processing results: {e}")
-                        break
-                    time.sleep(5)
\ No newline at end of file
+    # Reuse a previous extraction of the same bytes with the same project and stage
+    result_cache = get_result_cache()
+    cache_key = compute_cache_key(
+        document_hash,
+        DATA_AUTOMATION_ARNS[document_type],
+        DATA_AUTOMATION_STAGE
+    )
+    with trace.span('cache_lookup'):
+        extraction_result = result_cache.get(cache_key)
+
+    job_id = None
+    if extraction_result is None:
+        job_id = st.session_state.job_ids.get(cache_key) or submit_extraction(uploaded_file, document_type, cache_key, trace)
+        if job_id:
+            st.session_state.job_ids[cache_key] = job_id
+            # Keep the job id in the URL so a reopened tab reattaches instead of re-invoking
+            st.query_params['job'] = job_id
+
+    if page_preview:
+        render_page_preview(*page_preview)
+
+    if extraction_result is not None:
+        show_extraction_result(extraction_result, trace, {})
+    elif job_id:
+        show_job(job_id, trace)
+
+elif 'job' in st.query_params:
+    show_job(st.query_params['job'])
@@ -0,0 +1,212 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import (
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_RETRIES,
+    INTERACTIVE,
+    is_throttling_error,
+    retry_delay,
+)
+from aws_clients import AWS_INVOKE_MAX_ATTEMPTS
+from bundle_splitter import SPLITTER_MIN_PAGES, merge_chunks, remove_chunks, should_split, split_bundle, split_markers
+from metrics import Trace
+from preprocess import BYTES_SAVED, get_preprocess_pool, preprocess_file, should_preprocess
+from poller import get_invocation_poller
+from regions import get_region_router
+from result_cache import compute_cache_key, get_result_cache, hash_document
+from extraction import (
+    DATA_AUTOMATION_STAGE,
+    EXTRACTION_TIMEOUT,
+    RESULT_FETCH_CONCURRENCY,
+    upload_document,
+    copy_document,
+    invoke_document,
+    check_invocation_status,
+    list_segments,
+    fetch_segment,
+    merge_segments,
+)
+
+# Threads that run the blocking boto3 calls. Waiting for a job holds no thread at all,
+# so this only bounds how many uploads/invocations/fetches are on the wire at once.
+ASYNC_IO_WORKERS = int(os.environ.get('ASYNC_IO_WORKERS', '32'))
+
+
+class ExtractionEngine:
+    def __init__(self, io_workers=ASYNC_IO_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix='bda-io')
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='bda-engine', daemon=True)
+        self._thread.start()
+        # Shared by every invocation in the process, so UI sessions and batch runs draw on one
+        # quota per region (and one admission controller per region)
+        self.router = get_region_router()
+
+    async def run_blocking(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    # Every stage takes an optional metrics.Trace that times it and tags it with document attributes
+
+    async def upload(self, body, filename, content_type, trace=None):
+        with (trace or Trace()).span('upload'):
+            return await self.run_blocking(upload_document, body, filename, content_type)
+
+    async def preprocess(self, path, content_type, trace=None):
+        # Returns a PreprocessResult, or None when the file skips the stage (small or unsupported)
+        if not should_preprocess(os.path.getsize(path), content_type):
+            return None
+        with (trace or Trace()).span('preprocess'):
+            result = await self.loop.run_in_executor(get_preprocess_pool(), preprocess_file, path, content_type)
+        BYTES_SAVED.observe(result.saved_bytes, content_type=content_type)
+        return result
+
+    async def upload_file(self, path, filename, content_type, trace=None):
+        # Uploads the normalized document when preprocessing made it smaller, otherwise the file as is
+        prepared = await self.preprocess(path, content_type, trace=trace)
+        if prepared is not None and prepared.data is not None:
+            return await self.upload(prepared.data, filename, content_type, trace=trace)
+        with open(path, 'rb') as f:
+            return await self.upload(f, filename, content_type, trace=trace)
+
+    async def invoke(self, input_s3_uri, data_automation_arn, job_id=None, lane=INTERACTIVE, trace=None):
+        # Picks the region expected to finish the job soonest, waits for admission in its lane
+        # there and invokes that region's copy of the project. A throttled region shrinks its
+        # concurrency limit and cools down, so the retry fails over to another region; the
+        # backoff is only taken once every region has throttled.
+        trace = trace or Trace()
+        retries = ADMISSION_MAX_RETRIES if ADMISSION_ENABLED or self.router.multi_region else 0
+        # Throttles we retry here must reach the controller on the first response, not after
+        # botocore's own retries
+        max_attempts = AWS_INVOKE_MAX_ATTEMPTS if retries else None
+        for attempt in range(retries + 1):
+            region, regional_arn = self.router.choose(data_automation_arn)
+            with trace.span('admission'):
+                await region.acquire(lane)
+            try:
+                source_s3_uri = input_s3_uri
+                # Only another region's project needs the document in its own bucket; a single
+                # region reads every input where it is, e.g. a batch run over another bucket
+                if self.router.multi_region and not region.holds(input_s3_uri):
+                    with trace.span('replicate'):
+                        source_s3_uri = await self.run_blocking(copy_document, input_s3_uri, region.bucket)
+                with trace.span('invoke'):
+                    invocation_arn, output_s3_uri = await self.run_blocking(
+                        invoke_document, source_s3_uri, regional_arn, job_id, max_attempts
+                    )
+            except Exception as e:
+                if not is_throttling_error(e) or attempt == retries:
+                    region.release()
+                    raise
+                region.on_throttle()
+                if self.router.all_cooling(data_automation_arn):
+                    await asyncio.sleep(retry_delay(attempt))
+                continue
+            region.admitted(invocation_arn)
+            return invocation_arn, output_s3_uri
+
+    async def wait(self, invocation_arn, timeout=EXTRACTION_TIMEOUT, trace=None):
+        # The shared poller resolves a future; awaiting it parks the coroutine, not a thread.
+        # Shield it so a timeout here does not cancel the future other sessions share.
+        succeeded = False
+        with (trace or Trace()).span('bda_processing'):
+            future = get_invocation_poller(check_invocation_status).submit(invocation_arn)
+            try:
+                response = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+                succeeded = True
+                return response
+            finally:
+                # The job no longer counts against its region's limit (on timeout we stop tracking
+                # it); successful jobs also update the region's observed latency
+                self.router.finished(invocation_arn, succeeded)
+
+    async def fetch(self, status_response, concurrency=RESULT_FETCH_CONCURRENCY, trace=None):
+        # Every segment's custom output is fetched concurrently, bounded by `concurrency`
+        with (trace or Trace()).span('fetch'):
+            segments = await self.run_blocking(list_segments, status_response)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def fetch_one(segment):
+                async with semaphore:
+                    return await self.run_blocking(fetch_segment, segment)
+
+            return merge_segments(await asyncio.gather(*(fetch_one(segment) for segment in segments)))
+
+    async def collect(self, invocation_arn, timeout=EXTRACTION_TIMEOUT, trace=None):
+        return await self.fetch(await self.wait(invocation_arn, timeout, trace=trace), trace=trace)
+
+    async def extract(self, body, filename, content_type, data_automation_arn, timeout=EXTRACTION_TIMEOUT, trace=None):
+        input_s3_uri = await self.upload(body, filename, content_type, trace=trace)
+        invocation_arn, _ = await self.invoke(input_s3_uri, data_automation_arn, trace=trace)
+        return await self.collect(invocation_arn, timeout, trace=trace)
+
+    async def extract_bundle(self, path, filename, content_type, data_automation_arn, document_type=None,
+                             lane=INTERACTIVE, timeout=EXTRACTION_TIMEOUT, trace=None):
+        # A PDF bundling many documents (e.g. a payroll run of payslips) is cut into one chunk per
+        # document and every chunk goes through upload, admission and BDA on its own, so the bundle
+        # takes about as long as its slowest chunk rather than the sum of them. Returns None for
+        # a single document, which then takes the usual path.
+        trace = trace or Trace()
+        page_count = trace.tags.get('page_count')
+        if not should_split(content_type) or (page_count is not None and page_count < SPLITTER_MIN_PAGES):
+            return None
+        with trace.span('split'):
+            chunks = await split_bundle(self.loop, path, split_markers(document_type))
+        if chunks is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                bundle_hash = await self.run_blocking(hash_document, f)
+            with trace.span('chunks'):
+                results = await asyncio.gather(
+                    *(self.extract_chunk(chunk, filename, bundle_hash, data_automation_arn, lane, timeout, trace.tags)
+                      for chunk in chunks),
+                    return_exceptions=True
+                )
+        finally:
+            remove_chunks(chunks)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return merge_chunks(chunks, results)
+
+    async def extract_chunk(self, chunk, filename, bundle_hash, data_automation_arn, lane, timeout, tags):
+        # Chunk results are cached by bundle and page range, so a bundle that is retried (for example
+        # after its worker died or another chunk failed) only invokes the chunks that had not finished
+        cache = get_result_cache()
+        cache_key = compute_cache_key(
+            f"{bundle_hash}:{chunk.first_page}-{chunk.end_page}", data_automation_arn, DATA_AUTOMATION_STAGE
+        )
+        result = await self.run_blocking(cache.get, cache_key)
+        if result is not None:
+            return result
+        trace = Trace(tags.get('document_type'), os.path.getsize(chunk.path), chunk.end_page - chunk.first_page)
+        name = f"{os.path.splitext(filename)[0]}-{chunk.number}.pdf"
+        input_s3_uri = await self.upload_file(chunk.path, name, 'application/pdf', trace=trace)
+        invocation_arn, _ = await self.invoke(input_s3_uri, data_automation_arn, lane=lane, trace=trace)
+        result = await self.collect(invocation_arn, timeout, trace=trace)
+        await self.run_blocking(cache.put, cache_key, result)
+        return result
+
+    def submit(self, coroutine):
+        # Schedule on the shared loop from any thread; returns a concurrent.futures.Future
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def run(self, coroutine, timeout=None):
+        return self.submit(coroutine).result(timeout)
+
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+
+def get_engine():
+    # One event loop per process shared by every Streamlit session and batch run
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            _default_engine = ExtractionEngine()
+        return _default_engine
@@ -0,0 +1,94 @@
+import os
+import threading
+
+# AWS client configuration
+AWS_REGION = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or 'us-west-2'
+# Concurrent sessions, upload parts and result fetches share each client's pool; botocore's default is 10
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '64'))
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '8'))
+# Attempts for a BDA invocation. Retrying a throttle inside botocore would hide it from the
+# admission controller (admission.py), which retries after shrinking its concurrency limit.
+AWS_INVOKE_MAX_ATTEMPTS = int(os.environ.get('AWS_INVOKE_MAX_ATTEMPTS', '1'))
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '5'))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '60'))
+AWS_TCP_KEEPALIVE = os.environ.get('AWS_TCP_KEEPALIVE', 'true').lower() == 'true'
+
+_session = None
+_clients = {}
+_overrides = {}
+# Buckets that live outside AWS_REGION (see regions.py); their requests go to a client in their region
+_bucket_regions = {}
+_lock = threading.Lock()
+
+
+def client_config(**overrides):
+    from botocore.config import Config
+    settings = {
+        'max_pool_connections': AWS_MAX_POOL_CONNECTIONS,
+        'retries': {'mode': AWS_RETRY_MODE, 'total_max_attempts': AWS_MAX_ATTEMPTS},
+        'connect_timeout': AWS_CONNECT_TIMEOUT,
+        'read_timeout': AWS_READ_TIMEOUT,
+        'tcp_keepalive': AWS_TCP_KEEPALIVE,
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def get_client(service_name, region_name=None, max_attempts=None):
+    # Clients are created on first use and shared by every thread in the process;
+    # botocore clients are thread-safe once built, but creating them is not. A client with its own
+    # max_attempts uses standard retries (no client-side rate limiting) and is kept separately.
+    key = (service_name, region_name or AWS_REGION, max_attempts)
+    override = _overrides.get(key[:2]) or _overrides.get(service_name)
+    if override is not None:
+        return override
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    global _session
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                # boto3 is imported on first use so processes that never call AWS don't pay for it
+                import boto3
+                _session = boto3.session.Session()
+            config = client_config() if max_attempts is None else \
+                client_config(retries={'mode': 'standard', 'total_max_attempts': max_attempts})
+            client = _session.client(service_name, region_name=key[1], config=config)
+            _clients[key] = client
+        return client
+
+
+def set_client(service_name, client, region_name=None):
+    # Replaces a service's client in one region, or in every region without one (benchmarks and
+    # local fakes); None restores boto3
+    key = (service_name, region_name) if region_name else service_name
+    if client is None:
+        _overrides.pop(key, None)
+    else:
+        _overrides[key] = client
+
+
+def arn_region(arn):
+    # arn:aws:bedrock:<region>:<account>:...; None for anything else
+    parts = arn.split(':') if arn else []
+    return (parts[3] or None) if len(parts) > 3 else None
+
+
+def set_bucket_region(bucket, region_name):
+    _bucket_regions[bucket] = region_name
+
+
+def s3_client(bucket):
+    return get_client('s3', _bucket_regions.get(bucket))
+
+
+def reset_clients():
+    global _session
+    with _lock:
+        _clients.clear()
+        _overrides.clear()
+        _bucket_regions.clear()
+        _session = None
@@ -0,0 +1,385 @@
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import threading
+import time
+
+from admission import BATCH
+from async_pipeline import get_engine
+from aws_clients import get_client
+from blueprint_registry import get_data_automation_arns
+from classifier import get_classifier, ROUTED
+from jobs import get_job_store, spool_document, FAILED as JOB_FAILED, QUEUED as JOB_QUEUED
+from metrics import Trace
+from result_cache import get_result_cache, hash_document, compute_cache_key
+from search_index import document_id, index_extraction
+from worker import start_embedded_worker
+from extraction import (
+    DATA_AUTOMATION_STAGE,
+    split_s3_uri,
+)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.png')
+# How often the job store is read for the documents of a run
+BATCH_POLL_SECONDS = float(os.environ.get('BATCH_POLL_SECONDS', '1.0'))
+# Run a worker inside this process unless a worker service (or the UI's embedded worker) drains
+# the job store
+EMBEDDED_WORKER = os.environ.get('EMBEDDED_WORKER', 'true').lower() == 'true'
+
+# Manifest states
+# Submitted to the job store as a batch lane job
+QUEUED = 'queued'
+# Invoked directly by a run from before documents went through the job store
+INVOKED = 'invoked'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+# Turned away by the local classifier before any upload or invocation
+REJECTED = 'rejected'
+
+
+class Manifest:
+    # Append-only JSONL log of per-document state; the last record for a document wins
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A run killed mid-write leaves a truncated last line
+                        continue
+                    self.records[record['document']] = record
+        self._file = open(path, 'a')
+
+    def get(self, document):
+        with self._lock:
+            return self.records.get(document)
+
+    def record(self, document, state, **fields):
+        record = {'document': document, 'state': state, 'timestamp': time.time(), **fields}
+        with self._lock:
+            self.records[document] = record
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+        return record
+
+    def close(self):
+        self._file.close()
+
+
+def list_local_documents(directory):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def list_s3_documents(s3_uri):
+    bucket, prefix = split_s3_uri(s3_uri)
+    paginator = get_client('s3').get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].lower().endswith(SUPPORTED_EXTENSIONS):
+                yield f"s3://{bucket}/{obj['Key']}"
+
+
+def lookup_local_document(document, data_automation_arn):
+    # Returns (cache_key, cached_result); the key is always computed from the original bytes
+    with open(document, 'rb') as f:
+        cache_key = compute_cache_key(hash_document(f), data_automation_arn, DATA_AUTOMATION_STAGE)
+    return cache_key, get_result_cache().get(cache_key)
+
+
+def classify_local_document(classifier, document, document_type):
+    with open(document, 'rb') as f:
+        data = f.read()
+    content_type = mimetypes.guess_type(document)[0] or 'application/octet-stream'
+    return classifier.classify(data, content_type, document_type)
+
+
+def submit_document(store, document, data_automation_arn, cache_key, attributes):
+    # Batch lane job for the document; its id. Workers admit batch jobs only behind interactive ones,
+    # wherever those were submitted, so a backfill never delays the UI.
+    content_type = mimetypes.guess_type(document)[0] or 'application/octet-stream'
+    if document.startswith('s3://'):
+        # Documents already in S3 are invoked in place (copied only when another region runs them)
+        return store.enqueue('', os.path.basename(document), content_type, data_automation_arn,
+                             attributes=attributes, lane=BATCH, input_s3_uri=document)
+    # Join a job the UI or an earlier run already started for the same document
+    active = store.find_active(cache_key)
+    if active is not None:
+        return active.id
+    # The worker removes the spooled copy once it is done, never the source document
+    with open(document, 'rb') as f:
+        document_path = spool_document(f, os.path.basename(document), cache_key)
+    return store.enqueue(document_path, os.path.basename(document), content_type, data_automation_arn, cache_key,
+                         attributes=attributes, lane=BATCH)
+
+
+async def wait_for_job(engine, store, job_id, timeout):
+    # The timeout starts once a worker has taken the job, so time spent queued behind other lanes
+    # does not count against it
+    deadline = None
+    while True:
+        job = await engine.run_blocking(store.get, job_id)
+        if job is None:
+            raise RuntimeError(f"Job {job_id} no longer exists")
+        if job.done:
+            if job.status == JOB_FAILED:
+                raise RuntimeError(job.error)
+            return job
+        if deadline is None and job.status != JOB_QUEUED:
+            deadline = time.monotonic() + timeout
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Job {job_id} did not finish within {timeout:g} seconds of starting")
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+
+
+async def process_document(engine, store, document, data_automation_arn, manifest, timeout, classifier=None,
+                           document_type=None):
+    previous = manifest.get(document)
+    trace = Trace(document_type, size_bytes=None if document.startswith('s3://') else os.path.getsize(document))
+
+    # Resume a job that was already invoked before the run was interrupted
+    if previous and previous['state'] == INVOKED:
+        result = await engine.collect(previous['invocation_arn'], timeout, trace=trace)
+        resumed_fields = {key: previous[key] for key in ('job_id', 'document_type', 'routed') if key in previous}
+        if previous.get('routed'):
+            data_automation_arn = get_data_automation_arns().get(previous['document_type'], data_automation_arn)
+        indexed_id = await engine.run_blocking(document_id, document, data_automation_arn)
+        await engine.run_blocking(
+            index_extraction, indexed_id, document, previous.get('document_type', document_type), result
+        )
+        return manifest.record(
+            document, SUCCEEDED, invocation_arn=previous['invocation_arn'], result=result, **resumed_fields
+        )
+
+    routed_fields = {}
+    previous_job = None
+    if previous and previous['state'] in (QUEUED, FAILED) and previous.get('job_id'):
+        previous_job = await engine.run_blocking(store.get, previous['job_id'])
+    if previous_job is not None and previous_job.status != JOB_FAILED:
+        # Wait for the job submitted before the run was interrupted, or one that outlived its
+        # timeout and may have finished since, instead of submitting it again
+        job_id = previous_job.id
+        routed_fields = {key: previous[key] for key in ('document_type', 'routed') if key in previous}
+    else:
+        if classifier is not None and not document.startswith('s3://'):
+            # Documents in S3 are not downloaded just to classify them, so only local ones are checked
+            with trace.span('classify'):
+                classification = await engine.run_blocking(
+                    classify_local_document, classifier, document, document_type
+                )
+            if classification.rejected:
+                return manifest.record(document, REJECTED, classification=classification.to_dict())
+            if classification.decision == ROUTED:
+                data_automation_arn = classification.data_automation_arn
+                routed_fields = {'document_type': classification.document_type, 'routed': True}
+
+        cache_key = None
+        if not document.startswith('s3://'):
+            with trace.span('cache_lookup'):
+                cache_key, cached = await engine.run_blocking(lookup_local_document, document, data_automation_arn)
+            if cached is not None:
+                indexed_id = document_id(document, data_automation_arn, cache_key)
+                await engine.run_blocking(
+                    index_extraction, indexed_id, document, routed_fields.get('document_type', document_type), cached
+                )
+                return manifest.record(document, SUCCEEDED, cached=True, result=cached, **routed_fields)
+
+        # Upload, admission, invocation, caching and indexing happen in the worker that claims the job
+        job_id = await engine.run_blocking(
+            submit_document, store, document, data_automation_arn, cache_key,
+            {**trace.tags, 'document_type': routed_fields.get('document_type', document_type)}
+        )
+        manifest.record(document, QUEUED, job_id=job_id, **routed_fields)
+
+    job = await wait_for_job(engine, store, job_id, timeout)
+    # A bundle split into one invocation per document reports its chunks
+    chunk_fields = {'chunks': len(job.result['chunks'])} if 'chunks' in job.result else {}
+    return manifest.record(
+        document, SUCCEEDED, invocation_arn=job.invocation_arn, job_id=job_id, result=job.result,
+        **chunk_fields, **routed_fields
+    )
+
+
+async def process_documents(engine, store, documents, data_automation_arn, manifest, concurrency, timeout, on_done,
+                            classifier=None, document_type=None):
+    # Coroutines waiting on jobs hold no threads, so the concurrency limit can be far above the thread count
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process_one(document):
+        async with semaphore:
+            try:
+                record = await process_document(
+                    engine, store, document, data_automation_arn, manifest, timeout, classifier, document_type
+                )
+                return document, record, None
+            except Exception as e:
+                return document, None, e
+
+    for next_done in asyncio.as_completed([process_one(document) for document in documents]):
+        document, record, error = await next_done
+        on_done(document, record, error)
+
+
+def write_results(manifest, output_path):
+    count = 0
+    with open(output_path, 'w') as f:
+        for document, record in sorted(manifest.records.items()):
+            if record['state'] == SUCCEEDED:
+                document_type = {'document_type': record['document_type']} if 'document_type' in record else {}
+                f.write(json.dumps({'document': document, **document_type, **record['result']}) + '\n')
+                count += 1
+    return count
+
+
+def store_results(result_store, manifest, documents, default_document_type):
+    # Appends this run's successful extractions to the columnar store, one part per document type
+    by_type = {}
+    for document in documents:
+        record = manifest.get(document)
+        by_type.setdefault(record.get('document_type', default_document_type), []).append((document, record['result']))
+    stored = 0
+    for document_type, results in sorted(by_type.items()):
+        if document_type not in result_store.definitions:
+            print(f"Not storing {len(results)} {document_type} results: no blueprint definition")
+            continue
+        result_store.append(document_type, results)
+        stored += len(results)
+    return stored
+
+
+def run_batch(source, data_automation_arn, manifest_path, output_path, concurrency, timeout, retry_failed=True,
+              classifier=None, document_type=None, result_store=None, embedded_worker=EMBEDDED_WORKER):
+    if source.startswith('s3://'):
+        documents = list(list_s3_documents(source))
+    else:
+        documents = list(list_local_documents(source))
+
+    manifest = Manifest(manifest_path)
+    pending = []
+    for document in documents:
+        previous = manifest.get(document)
+        if previous and previous['state'] in (SUCCEEDED, REJECTED):
+            continue
+        if previous and previous['state'] == FAILED and not retry_failed:
+            continue
+        pending.append(document)
+
+    print(f"{len(documents)} documents found, {len(documents) - len(pending)} already done, {len(pending)} to process")
+
+    started = time.monotonic()
+    counts = {'succeeded': 0, 'failed': 0, 'rejected': 0, 'routed': 0}
+    succeeded_documents = []
+
+    def on_done(document, record, error):
+        if error is None and record['state'] == REJECTED:
+            counts['rejected'] += 1
+            print(f"Rejected: {document}: {record['classification']['reason']}")
+        elif error is None:
+            counts['succeeded'] += 1
+            counts['routed'] += 1 if record.get('routed') else 0
+            succeeded_documents.append(document)
+        else:
+            previous = manifest.get(document) or {}
+            # The job id is kept so a re-run reattaches to a job that is still running
+            job_fields = {key: previous[key] for key in ('job_id', 'document_type', 'routed') if key in previous}
+            manifest.record(
+                document, FAILED, invocation_arn=previous.get('invocation_arn'), error=str(error), **job_fields
+            )
+            counts['failed'] += 1
+            print(f"Failed: {document}: {error}")
+        done = counts['succeeded'] + counts['failed'] + counts['rejected']
+        if done % 50 == 0 or done == len(pending):
+            elapsed = time.monotonic() - started
+            print(f"{done}/{len(pending)} processed, {done / elapsed * 60:.1f} documents/minute")
+
+    engine = get_engine()
+    # The worker also takes interactive jobs from a shared job store, ahead of this run's documents
+    worker_stop = start_embedded_worker(concurrency) if embedded_worker else None
+    try:
+        engine.run(process_documents(
+            engine, get_job_store(), pending, data_automation_arn, manifest, concurrency, timeout, on_done,
+            classifier, document_type
+        ))
+    finally:
+        if worker_stop is not None:
+            worker_stop.set()
+        written = write_results(manifest, output_path)
+        stored = store_results(result_store, manifest, succeeded_documents, document_type) if result_store else 0
+        manifest.close()
+
+    succeeded, failed, rejected = counts['succeeded'], counts['failed'], counts['rejected']
+    elapsed = time.monotonic() - started
+    throughput = (succeeded + failed + rejected) / elapsed * 60 if elapsed > 0 else 0.0
+    summary = {
+        'documents': len(documents),
+        'processed': succeeded + failed + rejected,
+        'succeeded': succeeded,
+        'failed': failed,
+        # Each rejected document is an extraction invocation that was never made
+        'rejected': rejected,
+        'routed': counts['routed'],
+        'results_written': written,
+        'results_stored': stored,
+        'elapsed_seconds': round(elapsed, 2),
+        'documents_per_minute': round(throughput, 2),
+    }
+    print(json.dumps(summary))
+    return summary
+
+
+def _result_store():
+    # pyarrow is only needed when results are stored
+    from result_store import ResultStore
+    return ResultStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract structured data from a directory or S3 prefix of documents")
+    parser.add_argument('source', help="Local directory or s3://bucket/prefix")
+    parser.add_argument('--document-type', default='Payslip',
+                        help="Document type to look up in the published ARN map (default: Payslip)")
+    parser.add_argument('--data-automation-arn', help="Data automation project ARN (overrides --document-type)")
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('BATCH_CONCURRENCY', '32')),
+                        help="Maximum number of documents in flight")
+    parser.add_argument('--manifest', default='batch_manifest.jsonl', help="Resumable per-document state log")
+    parser.add_argument('--output', default='batch_results.jsonl', help="Consolidated results file")
+    parser.add_argument('--timeout', type=float, default=900, help="Seconds to wait for each document's job once a worker has taken it")
+    parser.add_argument('--no-retry-failed', action='store_true', help="Skip documents that failed in a previous run")
+    parser.add_argument('--no-classify', action='store_true',
+                        help="Invoke every document as --document-type without local classification")
+    parser.add_argument('--no-result-store', action='store_true',
+                        help="Do not append results to the columnar result store (RESULT_STORE_DIR)")
+    args = parser.parse_args()
+
+    data_automation_arn = args.data_automation_arn or get_data_automation_arns().get(args.document_type)
+    if not data_automation_arn:
+        parser.error(f"No data automation ARN for document type {args.document_type!r}; "
+                     "pass --data-automation-arn or provision it first")
+
+    run_batch(
+        args.source,
+        data_automation_arn,
+        args.manifest,
+        args.output,
+        args.concurrency,
+        args.timeout,
+        retry_failed=not args.no_retry_failed,
+        classifier=None if args.no_classify else get_classifier(),
+        document_type=args.document_type,
+        result_store=None if args.no_result_store else _result_store(),
+    )
+
+
+if __name__ == '__main__':
+    main()
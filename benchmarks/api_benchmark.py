@@ -0,0 +1,190 @@
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# The API runs in this process on a local port, with its embedded worker driving the fake AWS backend
+SCRATCH_DIR = tempfile.mkdtemp(prefix='bda_api_')
+DATA_AUTOMATION_ARN = 'arn:aws:bedrock:us-west-2:000000000000:data-automation-project/benchmark'
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ['S3_BUCKET_NAME'] = 'bench-bucket'
+os.environ['DATA_AUTOMATION_ARNS'] = json.dumps({'Payslip': DATA_AUTOMATION_ARN})
+os.environ['SEARCH_INDEX_PATH'] = os.path.join(SCRATCH_DIR, 'search.db')
+os.environ['RESULT_CACHE_DIR'] = os.path.join(SCRATCH_DIR, 'result_cache')
+os.environ['JOB_STORE_PATH'] = os.path.join(SCRATCH_DIR, 'jobs.db')
+os.environ['JOB_SPOOL_DIR'] = os.path.join(SCRATCH_DIR, 'spool')
+os.environ.setdefault('POLL_INITIAL_INTERVAL', '0.05')
+os.environ.setdefault('POLL_MAX_INTERVAL', '0.25')
+os.environ.setdefault('WORKER_IDLE_SECONDS', '0.02')
+os.environ.setdefault('API_EVENT_INTERVAL', '0.05')
+os.environ.setdefault('METRICS_EMF', 'false')
+os.environ.setdefault('ADMISSION_RATE', '100')
+API_KEY = 'benchmark'
+os.environ['API_KEYS'] = API_KEY
+
+import uvicorn  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+import api  # noqa: E402
+from aws_clients import set_client  # noqa: E402
+from fake_aws import FakeS3, FakeBDARuntime  # noqa: E402
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+
+
+def make_document(index):
+    # A small one-page PNG payslip, unique per index so every upload is a new job
+    image = Image.new('L', (850, 1100), 255)
+    draw = ImageDraw.Draw(image)
+    for line, text in enumerate(("Earnings Statement", f"Employee {index}", "Net Pay 3,100.00")):
+        draw.text((60, 60 + line * 30), text, fill=0)
+    output = BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+def start_server():
+    server = uvicorn.Server(uvicorn.Config(api.app, host='127.0.0.1', port=0, log_level='warning', access_log=False))
+    threading.Thread(target=server.run, name='api', daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server.servers[0].sockets[0].getsockname()[1]
+
+
+class Client:
+    # One keep-alive connection per client thread, like an integrating service would hold
+    def __init__(self, port):
+        self.port = port
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        return connection
+
+    def request(self, method, path, body=None, headers=None):
+        connection = self.connection()
+        connection.request(method, path, body=body, headers={'Authorization': f"Bearer {API_KEY}", **(headers or {})})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def submit(self, body, name):
+        return self.request('POST', f"/documents?document_type=Payslip&filename={name}", body,
+                            {'Content-Type': 'image/png'})
+
+    def wait(self, job_id):
+        # Reads the event stream until the `done` event, on a connection of its own
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        connection.request('GET', f"/jobs/{job_id}/events", headers={'Authorization': f"Bearer {API_KEY}"})
+        response = connection.getresponse()
+        event = None
+        try:
+            while True:
+                raw = response.readline()
+                if not raw:
+                    return None
+                line = raw.decode().rstrip('\n')
+                if line.startswith('event: '):
+                    event = line[len('event: '):]
+                elif line.startswith('data: ') and event == 'done':
+                    return json.loads(line[len('data: '):])
+        finally:
+            connection.close()
+
+
+def run_requests(client, count, concurrency, make_request):
+    latencies, failures = [], 0
+    lock = threading.Lock()
+
+    def one(index):
+        nonlocal failures
+        started = time.perf_counter()
+        status = make_request(index)
+        with lock:
+            if status < 400:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(count)))
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': count,
+        'failures': failures,
+        'requests_per_second': round(count / elapsed, 1),
+        'p50_ms': round((percentile(latencies, 0.5) or 0) * 1000, 2),
+        'p95_ms': round((percentile(latencies, 0.95) or 0) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the HTTP API against the in-process fake AWS backend")
+    parser.add_argument('--documents', type=int, default=200, help="Documents submitted and waited on over SSE")
+    parser.add_argument('--status-requests', type=int, default=5000, help="GET /jobs/<id> requests")
+    parser.add_argument('--concurrency', type=int, default=32, help="Client threads")
+    parser.add_argument('--job-latency', type=float, default=0.5, help="Simulated BDA job time in seconds")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    fake_s3 = FakeS3(latency=0.005)
+    set_client('s3', fake_s3)
+    set_client('bedrock-data-automation-runtime', FakeBDARuntime(fake_s3, job_latency=args.job_latency))
+    port = start_server()
+    client = Client(port)
+    documents = [make_document(index) for index in range(args.documents)]
+
+    # Submit every document, then follow it to completion over server-sent events
+    job_ids = [None] * len(documents)
+    end_to_end = []
+
+    def submit_and_wait(index):
+        started = time.perf_counter()
+        status, body = client.submit(documents[index], f"payslip-{index}.png")
+        if status >= 400:
+            return status
+        job_ids[index] = body['job_id']
+        done = client.wait(body['job_id'])
+        end_to_end.append(time.perf_counter() - started)
+        return 200 if done and done['status'] == 'succeeded' else 500
+
+    results = {'extraction': run_requests(client, len(documents), args.concurrency, submit_and_wait)}
+    results['extraction']['end_to_end_p50_seconds'] = percentile(end_to_end, 0.5)
+    results['extraction']['end_to_end_p95_seconds'] = percentile(end_to_end, 0.95)
+    results['extraction']['documents_per_minute'] = round(results['extraction']['requests_per_second'] * 60, 1)
+
+    # Re-submitting known documents exercises the streamed upload path without BDA (result cache hits)
+    results['cached_submit'] = run_requests(
+        client, len(documents), args.concurrency,
+        lambda index: client.submit(documents[index], f"payslip-{index}.png")[0]
+    )
+    results['status'] = run_requests(
+        client, args.status_requests, args.concurrency,
+        lambda index: client.request('GET', f"/jobs/{job_ids[index % len(job_ids)]}")[0]
+    )
+
+    for name, result in results.items():
+        print(f"{name}: {json.dumps(result)}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
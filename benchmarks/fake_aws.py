@@ -0,0 +1,290 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class FakeS3:
+    # In-process stand-in for the S3 calls the pipeline makes. Each request pays
+    # `latency` seconds and bodies are "sent" at `bandwidth` bytes/second per connection.
+    def __init__(self, latency=0.0, bandwidth=None, store=True):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.store = store
+        self.objects = {}
+        self.calls = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _request(self, operation, size=0):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        delay = self.latency
+        if self.bandwidth and size:
+            delay += size / self.bandwidth
+        if delay:
+            time.sleep(delay)
+
+    def _consume(self, body):
+        # Read file objects in chunks the way an HTTP client streams them
+        if isinstance(body, (bytes, bytearray)):
+            return bytes(body) if self.store else None, len(body)
+        chunks = [] if self.store else None
+        size = 0
+        for chunk in iter(lambda: body.read(_STREAM_CHUNK_SIZE), b''):
+            size += len(chunk)
+            if chunks is not None:
+                chunks.append(chunk)
+        return (b''.join(chunks) if chunks is not None else None), size
+
+    @staticmethod
+    def _ok(**fields):
+        return {'ResponseMetadata': {'HTTPStatusCode': 200}, **fields}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        data, size = self._consume(Body)
+        self._request('PutObject', size)
+        with self._lock:
+            self.objects[(Bucket, Key)] = data if data is not None else size
+        return self._ok(ETag=f'"{uuid.uuid4().hex}"')
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._request('HeadObject')
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                # Like S3, a HEAD on a missing key fails with a bare 404
+                raise _client_error('404', 'Not Found', 'HeadObject')
+            data = self.objects[(Bucket, Key)]
+        # Like a single-part upload's ETag, it changes whenever the content does
+        etag = hashlib.md5(str(data).encode('utf-8') if isinstance(data, int) else data).hexdigest()
+        return self._ok(ContentLength=data if isinstance(data, int) else len(data), ETag=f'"{etag}"')
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._request('GetObject')
+        with self._lock:
+            if (Bucket, Key) not in self.objects:
+                raise _client_error('NoSuchKey', f"s3://{Bucket}/{Key} not found", 'GetObject')
+            data = self.objects[(Bucket, Key)]
+        return self._ok(Body=_Body(data))
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        # Server-side: no body crosses the client connection
+        self._request('CopyObject')
+        with self._lock:
+            source = (CopySource['Bucket'], CopySource['Key'])
+            if source not in self.objects:
+                raise _client_error('NoSuchKey', f"s3://{source[0]}/{source[1]} not found", 'CopyObject')
+            self.objects[(Bucket, Key)] = self.objects[source]
+        return self._ok(CopyObjectResult={'ETag': f'"{uuid.uuid4().hex}"'})
+
+    def write(self, Bucket, Key, data):
+        # Used by the fake runtime to drop outputs without paying simulated latency
+        with self._lock:
+            self.objects[(Bucket, Key)] = data
+
+    def list_objects_v2(self, Bucket, Prefix='', **kwargs):
+        self._request('ListObjectsV2')
+        with self._lock:
+            keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        return self._ok(Contents=[{'Key': key} for key in keys], KeyCount=len(keys))
+
+    def get_paginator(self, operation_name):
+        return _SinglePagePaginator(getattr(self, operation_name))
+
+    def create_multipart_upload(self, Bucket, Key, ContentType=None, **kwargs):
+        self._request('CreateMultipartUpload')
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return self._ok(UploadId=upload_id)
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        data, size = self._consume(Body)
+        self._request('UploadPart', size)
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = data if data is not None else size
+        return self._ok(ETag=f'"{uuid.uuid4().hex}"')
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._request('CompleteMultipartUpload')
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+            ordered = [parts[part['PartNumber']] for part in MultipartUpload['Parts']]
+            if self.store:
+                self.objects[(Bucket, Key)] = b''.join(ordered)
+            else:
+                self.objects[(Bucket, Key)] = sum(ordered)
+        return self._ok(ETag=f'"{uuid.uuid4().hex}-{len(ordered)}"')
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._request('AbortMultipartUpload')
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return self._ok()
+
+
+class FakeBDARuntime:
+    # In-process stand-in for bedrock-data-automation-runtime. Jobs finish after a simulated
+    # processing time and write job metadata plus `segments` custom/standard outputs to the fake S3.
+    def __init__(self, s3, job_latency=1.0, latency_jitter=0.2, request_latency=0.0,
+                 throttle_rate=0.0, max_concurrent_jobs=None, segments=1, failure_rate=0.0,
+                 region='us-west-2', page_latency=0.0, seed=None):
+        self.s3 = s3
+        self.job_latency = job_latency
+        # Extra job time per page of a PDF input, so bigger documents take longer like in BDA
+        self.page_latency = page_latency
+        self.latency_jitter = latency_jitter
+        self.request_latency = request_latency
+        self.throttle_rate = throttle_rate
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.segments = segments
+        self.failure_rate = failure_rate
+        self.region = region
+        self.calls = {}
+        self.throttled = 0
+        self._jobs = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _request(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.request_latency:
+            time.sleep(self.request_latency)
+
+    def active_jobs(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['done_at'] > now)
+
+    def invoke_data_automation_async(self, inputConfiguration, outputConfiguration,
+                                     dataAutomationConfiguration, **kwargs):
+        self._request('InvokeDataAutomationAsync')
+        now = time.monotonic()
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job['done_at'] > now)
+            over_quota = self.max_concurrent_jobs is not None and active >= self.max_concurrent_jobs
+            if over_quota or self._random.random() < self.throttle_rate:
+                self.throttled += 1
+                raise _client_error('ThrottlingException', 'Rate exceeded', 'InvokeDataAutomationAsync')
+            invocation_arn = (f"arn:aws:bedrock:{self.region}:000000000000:"
+                              f"data-automation-invocation/{uuid.uuid4().hex}")
+            duration = max(0.0, self._random.gauss(self.job_latency, self.job_latency * self.latency_jitter))
+            if self.page_latency:
+                duration += self.page_latency * self._page_count(inputConfiguration['s3Uri'])
+            self._jobs[invocation_arn] = {
+                'input_s3_uri': inputConfiguration['s3Uri'],
+                'output_s3_uri': outputConfiguration['s3Uri'].rstrip('/'),
+                'data_automation_arn': dataAutomationConfiguration['dataAutomationArn'],
+                'done_at': now + duration,
+                'failed': self._random.random() < self.failure_rate,
+                'metadata_uri': None,
+            }
+        return {'invocationArn': invocation_arn}
+
+    def _page_count(self, s3_uri):
+        bucket, _, key = s3_uri[len('s3://'):].partition('/')
+        data = self.s3.objects.get((bucket, key))
+        if not isinstance(data, bytes) or not data.startswith(b'%PDF'):
+            return 1
+        return max(1, len(re.findall(rb'/Type\s*/Page\b', data)))
+
+    def get_data_automation_status(self, invocationArn, **kwargs):
+        self._request('GetDataAutomationStatus')
+        with self._lock:
+            job = self._jobs.get(invocationArn)
+        if job is None:
+            raise _client_error('ResourceNotFoundException', f"{invocationArn} not found", 'GetDataAutomationStatus')
+        if time.monotonic() < job['done_at']:
+            return {'status': 'InProgress'}
+        if job['failed']:
+            return {'status': 'ServiceError', 'errorType': 'SimulatedFailure', 'errorMessage': 'Simulated job failure'}
+        with self._lock:
+            if job['metadata_uri'] is None:
+                job['metadata_uri'] = self._write_outputs(invocationArn, job)
+        return {'status': 'Success', 'outputConfiguration': {'s3Uri': job['metadata_uri']}}
+
+    def _write_outputs(self, invocation_arn, job):
+        bucket, _, prefix = job['output_s3_uri'][len('s3://'):].partition('/')
+        job_id = invocation_arn.rsplit('/', 1)[1]
+        base = f"{prefix}/{job_id}/0"
+        segment_metadata = []
+        for index in range(self.segments):
+            custom_key = f"{base}/custom_output/{index}/result.json"
+            standard_key = f"{base}/standard_output/{index}/result.json"
+            self.s3.write(bucket, custom_key, json.dumps(synthetic_custom_output(index, self._random)).encode('utf-8'))
+            self.s3.write(bucket, standard_key, json.dumps(synthetic_standard_output(index, self._random)).encode('utf-8'))
+            segment_metadata.append({
+                'segment_index': index,
+                'custom_output_status': 'MATCH',
+                'custom_output_path': f"s3://{bucket}/{custom_key}",
+                'standard_output_path': f"s3://{bucket}/{standard_key}",
+            })
+        metadata = {
+            'job_id': job_id,
+            'job_status': 'PROCESSED',
+            'output_metadata': [{'asset_id': 0, 'segment_metadata': segment_metadata}],
+        }
+        metadata_key = f"{prefix}/{job_id}/job_metadata.json"
+        self.s3.write(bucket, metadata_key, json.dumps(metadata).encode('utf-8'))
+        return f"s3://{bucket}/{metadata_key}"
+
+
+def synthetic_custom_output(index, rng=random):
+    gross = round(rng.uniform(1500, 9000), 2)
+    net = round(gross * rng.uniform(0.6, 0.85), 2)
+    return {
+        'matched_blueprint': {'name': 'custom_payslip', 'confidence': 1},
+        'document_class': {'type': 'Payslip'},
+        'split_document': {'page_indices': [index]},
+        'inference_result': {
+            'PayPeriodStartDate': '2024-01-01',
+            'PayPeriodEndDate': '2024-01-15',
+            'PayDate': '2024-01-19',
+            'EmployeeName': f'Employee {index}',
+            'CurrentGrossPay': gross,
+            'CurrentNetPay': net,
+            'YTDGrossPay': round(gross * rng.randint(1, 24), 2),
+            'YTDNetPay': round(net * rng.randint(1, 24), 2),
+            'currency': 'USD',
+        },
+    }
+
+
+EMPLOYERS = ('ACME Corp', 'Globex', 'Initech', 'Umbrella Health', 'Stark Industries')
+
+
+def synthetic_standard_output(index, rng=random):
+    employer = rng.choice(EMPLOYERS)
+    text = f"{employer} Earnings Statement\nEmployee {index}\nPay Period 2024-01-01 to 2024-01-15\nNet Pay"
+    return {
+        'document': {'representation': {'text': text}},
+        'pages': [{'page_index': index, 'representation': {'text': text}}],
+    }
+
+
+def _client_error(code, message, operation):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation)
+
+
+class _SinglePagePaginator:
+    def __init__(self, operation):
+        self._operation = operation
+
+    def paginate(self, **kwargs):
+        yield self._operation(**kwargs)
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
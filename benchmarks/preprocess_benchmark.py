@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix='bda_preprocess_')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ['S3_BUCKET_NAME'] = 'bench-bucket'
+os.environ['SEARCH_INDEX_PATH'] = os.path.join(SCRATCH_DIR, 'search.db')
+os.environ.setdefault('POLL_INITIAL_INTERVAL', '0.05')
+os.environ.setdefault('POLL_MAX_INTERVAL', '0.25')
+os.environ.setdefault('METRICS_EMF', 'false')
+
+from PIL import Image  # noqa: E402
+
+from async_pipeline import get_engine  # noqa: E402
+from aws_clients import set_client  # noqa: E402
+from extraction import split_s3_uri  # noqa: E402
+from fake_aws import FakeS3, FakeBDARuntime  # noqa: E402
+from metrics import Trace  # noqa: E402
+from preprocess import get_preprocess_pool  # noqa: E402
+
+SAMPLE_PAYSLIP = os.path.join(ROOT, 'Images', 'sample_payslip.png')
+DATA_AUTOMATION_ARN = 'arn:aws:bedrock:us-west-2:000000000000:data-automation-project/benchmark'
+MB = 1024 * 1024
+
+
+def scanned_page(dpi):
+    # The sample payslip upscaled to what a color scanner produces at `dpi`
+    image = Image.open(SAMPLE_PAYSLIP).convert('RGB')
+    return image.resize((int(8.5 * dpi), int(11 * dpi)), Image.Resampling.BICUBIC)
+
+
+def make_documents(dpi, pdf_pages):
+    page = scanned_page(dpi)
+    png_path = os.path.join(SCRATCH_DIR, 'scan.png')
+    page.save(png_path, format='PNG', dpi=(dpi, dpi))
+    pdf_path = os.path.join(SCRATCH_DIR, 'scan.pdf')
+    pages = [page.rotate(index * 0.5, fillcolor='white') for index in range(pdf_pages)]
+    pages[0].save(pdf_path, format='PDF', save_all=True, append_images=pages[1:], resolution=dpi, quality=95)
+    return [(png_path, 'image/png'), (pdf_path, 'application/pdf')]
+
+
+def extract_once(engine, path, content_type, preprocess):
+    async def run():
+        trace = Trace()
+        if preprocess:
+            input_s3_uri = await engine.upload_file(path, os.path.basename(path), content_type, trace=trace)
+        else:
+            with open(path, 'rb') as f:
+                input_s3_uri = await engine.upload(f, os.path.basename(path), content_type, trace=trace)
+        invocation_arn, _ = await engine.invoke(input_s3_uri, DATA_AUTOMATION_ARN, trace=trace)
+        await engine.collect(invocation_arn, trace=trace)
+        return input_s3_uri, trace.timings
+
+    started = time.perf_counter()
+    input_s3_uri, timings = engine.run(run())
+    return time.perf_counter() - started, input_s3_uri, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare extraction latency with and without upload preprocessing")
+    parser.add_argument('--dpi', type=int, default=300, help="Resolution of the synthetic scans")
+    parser.add_argument('--pdf-pages', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=3, help="Runs per document and mode; the median is reported")
+    parser.add_argument('--bandwidth-mb', type=float, default=2.0, help="Simulated upload bandwidth in MB/s")
+    parser.add_argument('--latency', type=float, default=0.02, help="Simulated per-request round trip in seconds")
+    parser.add_argument('--job-latency', type=float, default=0.5, help="Simulated BDA job time in seconds")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    fake_s3 = FakeS3(latency=args.latency, bandwidth=args.bandwidth_mb * MB)
+    set_client('s3', fake_s3)
+    set_client('bedrock-data-automation-runtime', FakeBDARuntime(fake_s3, job_latency=args.job_latency, latency_jitter=0))
+    engine = get_engine()
+    # Pool processes start once per server, not per document
+    get_preprocess_pool().submit(int).result()
+
+    results = []
+    for path, content_type in make_documents(args.dpi, args.pdf_pages):
+        result = {'document': os.path.basename(path), 'original_bytes': os.path.getsize(path)}
+        for mode in ('original', 'preprocessed'):
+            runs = [extract_once(engine, path, content_type, mode == 'preprocessed') for _ in range(args.iterations)]
+            result[f'{mode}_seconds'] = round(statistics.median(elapsed for elapsed, _, _ in runs), 3)
+            result[f'{mode}_upload_seconds'] = round(statistics.median(t['upload'] for _, _, t in runs), 3)
+            if mode == 'preprocessed':
+                result['preprocess_seconds'] = round(statistics.median(t.get('preprocess', 0) for _, _, t in runs), 3)
+                bucket, key = split_s3_uri(runs[-1][1])
+                result['uploaded_bytes'] = len(fake_s3.objects[(bucket, key)])
+        result['saved_bytes'] = result['original_bytes'] - result['uploaded_bytes']
+        result['latency_difference_seconds'] = round(result['original_seconds'] - result['preprocessed_seconds'], 3)
+        results.append(result)
+
+    print(f"{'document':>10} {'bytes':>10} {'uploaded':>10} {'original (s)':>13} {'preprocessed (s)':>17} {'of which preprocess':>20}")
+    for result in results:
+        print(f"{result['document']:>10} {result['original_bytes']:>10} {result['uploaded_bytes']:>10} "
+              f"{result['original_seconds']:>13} {result['preprocessed_seconds']:>17} {result['preprocess_seconds']:>20}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,563 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+# Everything the pipeline persists goes to a scratch directory, and polling is scaled
+# down to the simulated job latency. Must happen before the pipeline modules are imported.
+SCRATCH_DIR = tempfile.mkdtemp(prefix='bda_bench_')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+os.environ['S3_BUCKET_NAME'] = 'bench-bucket'
+os.environ['SEARCH_INDEX_PATH'] = os.path.join(SCRATCH_DIR, 'search.db')
+os.environ['RESULT_CACHE_DIR'] = os.path.join(SCRATCH_DIR, 'result_cache')
+os.environ['JOB_STORE_PATH'] = os.path.join(SCRATCH_DIR, 'jobs.db')
+os.environ['JOB_SPOOL_DIR'] = os.path.join(SCRATCH_DIR, 'spool')
+os.environ.setdefault('POLL_INITIAL_INTERVAL', '0.05')
+os.environ.setdefault('POLL_MAX_INTERVAL', '0.25')
+os.environ.setdefault('WORKER_IDLE_SECONDS', '0.02')
+os.environ.setdefault('BATCH_POLL_SECONDS', '0.02')
+os.environ.setdefault('METRICS_EMF', 'false')
+# The fakes only enforce a concurrent-job quota (--max-concurrent-jobs), not a request rate
+os.environ.setdefault('ADMISSION_RATE', '100')
+os.environ.setdefault('ADMISSION_RETRY_DELAY', '0.05')
+
+import PyPDF2  # noqa: E402
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject  # noqa: E402
+
+import batch_extract  # noqa: E402
+from aws_clients import get_client, set_client  # noqa: E402
+from blueprint_registry import load_blueprints  # noqa: E402
+from classifier import DocumentClassifier  # noqa: E402
+from result_store import ResultStore  # noqa: E402
+from search_index import get_search_index  # noqa: E402
+from async_pipeline import get_engine  # noqa: E402
+from metrics import Trace  # noqa: E402
+from regions import build_router  # noqa: E402
+from jobs import get_job_store, spool_document, SUCCEEDED  # noqa: E402
+from worker import start_embedded_worker  # noqa: E402
+from fake_aws import FakeS3, FakeBDARuntime  # noqa: E402
+
+SAMPLE_PAYSLIP = os.path.join(ROOT, 'Images', 'sample_payslip.png')
+DATA_AUTOMATION_ARN = 'arn:aws:bedrock:us-west-2:000000000000:data-automation-project/benchmark'
+
+# Page text for synthetic PDFs. Payslips are what the batch is labelled as; invoices are
+# mislabelled uploads the classifier should reroute, and prose is irrelevant and should be rejected.
+PAYSLIP_TEXT = [
+    "ACME Corp Earnings Statement",
+    "Employee Name: Jane Doe   Employee Number: {seed}",
+    "Pay Period: 2024-01-01 to 2024-01-15   Pay Date: 2024-01-19",
+    "Gross Pay 4,000.00   YTD Gross 8,000.00",
+    "Federal Tax 500.00   State Tax 120.00   Net Pay 3,100.00",
+]
+INVOICE_TEXT = [
+    "INVOICE   Invoice Number: INV-{seed}   Invoice Date: 2024-02-01",
+    "Bill To: Globex Inc, 12 Main St   Payment terms: Net 30",
+    "Consulting services   10   150.00   1500.00",
+    "Subtotal 1500.00   Tax 120.00   Total Amount Due 1620.00",
+]
+# Second page of the payslips that run over two pages in a bundle
+PAYSLIP_CONTINUATION_TEXT = [
+    "Page 2 of 2",
+    "Deductions (continued)   Employee Number: {seed}",
+    "401k 200.00   Health 85.00   Dental 12.00",
+]
+IRRELEVANT_TEXT = [
+    "Chapter {seed}",
+    "It was a bright cold day in April, and the clocks were striking thirteen.",
+    "Winston Smith slipped quickly through the glass doors of Victory Mansions,",
+    "though not quickly enough to prevent a swirl of gritty dust from entering along with him.",
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, failures):
+    completed = len(latencies)
+    return {
+        'documents': completed + failures,
+        'failures': failures,
+        'p50_seconds': _round(percentile(latencies, 0.50)),
+        'p95_seconds': _round(percentile(latencies, 0.95)),
+        'p99_seconds': _round(percentile(latencies, 0.99)),
+        'elapsed_seconds': _round(elapsed),
+        'documents_per_minute': _round(completed / elapsed * 60 if elapsed else 0.0),
+    }
+
+
+def _round(value):
+    return round(value, 4) if value is not None else None
+
+
+def _text_page(lines):
+    page = PyPDF2.PageObject.create_blank_page(None, 612, 792)
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    page[NameObject('/Resources')] = DictionaryObject({NameObject('/Font'): DictionaryObject({NameObject('/F1'): font})})
+    content = DecodedStreamObject()
+    content.set_data(('BT /F1 11 Tf 72 720 Td 14 TL ' + ' '.join(f'({line}) Tj T*' for line in lines) + ' ET').encode('latin-1'))
+    page[NameObject('/Contents')] = content
+    return page
+
+
+def synthetic_pdf(pages, seed, text=None):
+    writer = PyPDF2.PdfWriter()
+    for _ in range(pages):
+        if text:
+            writer.add_page(_text_page([line.format(seed=seed) for line in text]))
+        else:
+            writer.add_blank_page(612, 792)
+    # Unique metadata so every synthetic document hashes differently
+    writer.add_metadata({'/Title': f'synthetic payslip {seed}'})
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def bundle_pdf(payslips, seed):
+    # One PDF with `payslips` payslips back to back, as a payroll provider sends them; every
+    # fourth one runs over two pages. Returns the PDF and each payslip's first page.
+    writer = PyPDF2.PdfWriter()
+    first_pages = []
+    for index in range(payslips):
+        first_pages.append(len(writer.pages))
+        employee = f'{seed}-{index}'
+        if index % 4 == 3:
+            writer.add_page(_text_page(["Page 1 of 2"] + [line.format(seed=employee) for line in PAYSLIP_TEXT]))
+            writer.add_page(_text_page([line.format(seed=employee) for line in PAYSLIP_CONTINUATION_TEXT]))
+        else:
+            writer.add_page(_text_page([line.format(seed=employee) for line in PAYSLIP_TEXT]))
+    writer.add_metadata({'/Title': f'synthetic payroll bundle {seed}'})
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue(), first_pages
+
+
+def sample_png(seed):
+    with open(SAMPLE_PAYSLIP, 'rb') as f:
+        # Bytes after IEND are ignored by decoders but make the content hash unique
+        return f.read() + f'benchmark-{seed}'.encode('utf-8')
+
+
+def make_documents(count, pdf_pages, prefix, irrelevant_rate=0.0, mislabelled_rate=0.0, seed=0):
+    rng = random.Random(f'{prefix}-{seed}')
+    documents = []
+    for index in range(count):
+        name = f'{prefix}-{index}'
+        draw = rng.random()
+        if draw < irrelevant_rate:
+            documents.append((f'{name}.pdf', 'application/pdf', synthetic_pdf(pdf_pages, name, IRRELEVANT_TEXT)))
+        elif draw < irrelevant_rate + mislabelled_rate:
+            documents.append((f'{name}.pdf', 'application/pdf', synthetic_pdf(pdf_pages, name, INVOICE_TEXT)))
+        elif index % 2 == 0:
+            documents.append((f'{name}.png', 'image/png', sample_png(name)))
+        else:
+            documents.append((f'{name}.pdf', 'application/pdf', synthetic_pdf(pdf_pages, name, PAYSLIP_TEXT)))
+    return documents
+
+
+def benchmark_classifier():
+    # Every registered document type gets a fake project ARN; the batch is labelled Payslip
+    definitions = load_blueprints()
+    arns = {
+        definition.document_type: f'arn:aws:bedrock:us-west-2:000000000000:data-automation-project/{definition.project_name}'
+        for definition in definitions
+    }
+    return DocumentClassifier(definitions, arns)
+
+
+def install_fakes(args):
+    fake_s3 = FakeS3(latency=args.s3_latency)
+    fake_bda = FakeBDARuntime(
+        fake_s3,
+        job_latency=args.job_latency,
+        latency_jitter=args.job_jitter,
+        request_latency=args.api_latency,
+        throttle_rate=args.throttle_rate,
+        max_concurrent_jobs=args.max_concurrent_jobs,
+        segments=args.segments,
+        seed=args.seed,
+    )
+    set_client('s3', fake_s3)
+    set_client('bedrock-data-automation-runtime', fake_bda)
+    return fake_s3, fake_bda
+
+
+def run_single(args):
+    engine = get_engine()
+    latencies, failures = [], 0
+    started = time.perf_counter()
+    for name, content_type, body in make_documents(args.iterations, args.pdf_pages, 'single'):
+        document_started = time.perf_counter()
+        try:
+            engine.run(engine.extract(BytesIO(body), name, content_type, DATA_AUTOMATION_ARN))
+            latencies.append(time.perf_counter() - document_started)
+        except Exception:
+            failures += 1
+    return summarize(latencies, time.perf_counter() - started, failures)
+
+
+_worker_started = False
+
+
+def ensure_worker(args):
+    # One worker drives the fakes for every scenario, sized for the backfills' concurrency
+    global _worker_started
+    if not _worker_started:
+        start_embedded_worker(args.concurrency * 4)
+        _worker_started = True
+
+
+def run_batch(args):
+    ensure_worker(args)
+    source = os.path.join(SCRATCH_DIR, 'batch_input')
+    os.makedirs(source, exist_ok=True)
+    documents = make_documents(
+        args.batch_size, args.pdf_pages, 'batch', args.irrelevant_rate, args.mislabelled_rate, args.seed
+    )
+    for name, _, body in documents:
+        with open(os.path.join(source, name), 'wb') as f:
+            f.write(body)
+
+    classifier = None if args.no_classify else benchmark_classifier()
+    # Per-document classification cost, measured serially so concurrent batch threads don't inflate it
+    classify_ms = [
+        classifier.classify(body, content_type, 'Payslip').elapsed_ms for _, content_type, body in documents
+    ] if classifier is not None else []
+
+    result_store = None if args.no_result_store else ResultStore(os.path.join(SCRATCH_DIR, 'result_store'))
+
+    latencies = []
+    process_document = batch_extract.process_document
+
+    async def timed_process_document(*process_args, **process_kwargs):
+        document_started = time.perf_counter()
+        record = await process_document(*process_args, **process_kwargs)
+        latencies.append(time.perf_counter() - document_started)
+        return record
+
+    batch_extract.process_document = timed_process_document
+    try:
+        started = time.perf_counter()
+        summary = batch_extract.run_batch(
+            source,
+            DATA_AUTOMATION_ARN,
+            os.path.join(SCRATCH_DIR, 'batch_manifest.jsonl'),
+            os.path.join(SCRATCH_DIR, 'batch_results.jsonl'),
+            args.concurrency,
+            timeout=args.timeout,
+            classifier=classifier,
+            document_type='Payslip',
+            result_store=result_store,
+            embedded_worker=False,
+        )
+        elapsed = time.perf_counter() - started
+    finally:
+        batch_extract.process_document = process_document
+    result = summarize(latencies, elapsed, summary['failed'])
+    # Rejected documents never reach BDA: each one is an invocation saved
+    result['invocations_saved'] = summary['rejected']
+    result['routed'] = summary['routed']
+    result['classify_p95_ms'] = _round(percentile(classify_ms, 0.95))
+    result['classify_max_ms'] = _round(max(classify_ms)) if classify_ms else None
+    result['results_stored'] = summary['results_stored']
+    if result_store is not None:
+        # Full scan plus every consistency check over the stored Payslip rows
+        check_started = time.perf_counter()
+        result['result_store_violations'] = result_store.summary('Payslip')['violations']
+        result['result_store_check_ms'] = _round((time.perf_counter() - check_started) * 1000)
+    # "All payslips for employer X" against the pages indexed as the batch completed
+    search_index = get_search_index()
+    search_started = time.perf_counter()
+    hits = search_index.search('earnings Globex', 'Payslip')
+    result['search_ms'] = _round((time.perf_counter() - search_started) * 1000)
+    result['search_hits'] = len(hits)
+    result['indexed_pages'] = search_index.stats()['pages']
+    return result
+
+
+def run_session_documents(args, documents):
+    # Each session behaves like a Streamlit script run: spool, enqueue, then poll the job store
+    ensure_worker(args)
+    store = get_job_store()
+    latencies, failures = [], []
+    lock = threading.Lock()
+
+    def session(document):
+        name, content_type, body = document
+        document_started = time.perf_counter()
+        path = spool_document(BytesIO(body), name)
+        job_id = store.enqueue(path, name, content_type, DATA_AUTOMATION_ARN)
+        deadline = document_started + args.timeout
+        job = store.get(job_id)
+        while not job.done and time.perf_counter() < deadline:
+            time.sleep(0.02)
+            job = store.get(job_id)
+        with lock:
+            if job.status == SUCCEEDED:
+                latencies.append(time.perf_counter() - document_started)
+            else:
+                failures.append(job_id)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(documents)) as executor:
+        list(executor.map(session, documents))
+    return summarize(latencies, time.perf_counter() - started, len(failures))
+
+
+def run_sessions(args):
+    return run_session_documents(args, make_documents(args.sessions, args.pdf_pages, 'session'))
+
+
+def run_mixed(args):
+    # A bulk backfill saturates the BDA quota while interactive sessions arrive; interactive
+    # latency should stay close to the unloaded sessions scenario. The backfill is a batch_extract.py
+    # process of its own, as in production: it only submits batch lane jobs to the shared job store,
+    # and the worker in this process (which drives the fakes) admits them behind the sessions.
+    ensure_worker(args)
+    source = os.path.join(SCRATCH_DIR, 'mixed_input')
+    os.makedirs(source, exist_ok=True)
+    for name, _, body in make_documents(args.batch_size, args.pdf_pages, 'backfill'):
+        with open(os.path.join(source, name), 'wb') as f:
+            f.write(body)
+    backfill = subprocess.Popen(
+        [
+            sys.executable, os.path.join(ROOT, 'batch_extract.py'), source,
+            '--data-automation-arn', DATA_AUTOMATION_ARN,
+            '--concurrency', str(args.concurrency * 4),
+            '--manifest', os.path.join(SCRATCH_DIR, 'mixed_manifest.jsonl'),
+            '--output', os.path.join(SCRATCH_DIR, 'mixed_results.jsonl'),
+            '--timeout', str(args.timeout),
+            '--no-classify', '--no-result-store',
+        ],
+        env={**os.environ, 'EMBEDDED_WORKER': 'false'}, stdout=subprocess.PIPE, text=True,
+    )
+    # Let the backfill fill the quota and build a queue before the sessions arrive
+    router = get_engine().router
+    def invocations():
+        return sum(region.invocations for region in router.regions.values())
+
+    invoked = invocations()
+    deadline = time.perf_counter() + args.timeout
+    while invocations() - invoked < min(args.batch_size, args.concurrency):
+        if backfill.poll() is not None or time.perf_counter() > deadline:
+            break
+        time.sleep(0.02)
+    time.sleep(args.job_latency)
+    result = run_session_documents(args, make_documents(args.sessions, args.pdf_pages, 'interactive'))
+    output, _ = backfill.communicate()
+    # The run's summary is the last line batch_extract.py prints
+    lines = output.strip().splitlines()
+    summary = json.loads(lines[-1]) if backfill.returncode == 0 and lines else {}
+    result['backfill_documents_per_minute'] = summary.get('documents_per_minute')
+    result['backfill_failed'] = summary.get('failed', args.batch_size)
+    result['admission_throttled'] = sum(region.throttled for region in router.regions.values())
+    return result
+
+
+def run_regions(args):
+    # The batch from run_mixed's backfill against three regions, each a fake BDA runtime with its own
+    # concurrent-job quota and job latency; the home region is the fastest. Reports how the router
+    # spread invocations and how often a throttled region was failed over.
+    quota = args.max_concurrent_jobs or 8
+    latencies = {'us-west-2': args.job_latency, 'us-east-1': args.job_latency * 1.5, 'eu-west-1': args.job_latency * 2}
+    fakes = {}
+    settings = []
+    for region, job_latency in latencies.items():
+        fakes[region] = FakeBDARuntime(
+            get_client('s3'), job_latency=job_latency, latency_jitter=args.job_jitter, request_latency=args.api_latency,
+            max_concurrent_jobs=quota, region=region, seed=args.seed,
+        )
+        set_client('bedrock-data-automation-runtime', fakes[region], region_name=region)
+        settings.append({
+            'region': region,
+            'bucket': f"bench-bucket-{region}",
+            'data_automation_arns': {'Payslip': DATA_AUTOMATION_ARN.replace('us-west-2', region)},
+        })
+    settings[0]['bucket'] = 'bench-bucket'
+
+    source = os.path.join(SCRATCH_DIR, 'regions_input')
+    os.makedirs(source, exist_ok=True)
+    for name, _, body in make_documents(args.batch_size, args.pdf_pages, 'regions'):
+        with open(os.path.join(source, name), 'wb') as f:
+            f.write(body)
+
+    ensure_worker(args)
+    engine = get_engine()
+    single_region_router = engine.router
+    engine.router = build_router(settings)
+    try:
+        started = time.perf_counter()
+        summary = batch_extract.run_batch(
+            source,
+            DATA_AUTOMATION_ARN,
+            os.path.join(SCRATCH_DIR, 'regions_manifest.jsonl'),
+            os.path.join(SCRATCH_DIR, 'regions_results.jsonl'),
+            args.concurrency * 4,
+            timeout=args.timeout,
+            document_type='Payslip',
+            embedded_worker=False,
+        )
+        elapsed = time.perf_counter() - started
+        regions = engine.router.stats()
+    finally:
+        engine.router = single_region_router
+        for region in latencies:
+            set_client('bedrock-data-automation-runtime', None, region_name=region)
+    return {
+        'documents': summary['processed'],
+        'failures': summary['failed'],
+        'elapsed_seconds': _round(elapsed),
+        'documents_per_minute': _round(summary['processed'] / elapsed * 60),
+        # One region at the same quota could run at most this many documents/minute
+        'single_region_ceiling_per_minute': _round(quota / args.job_latency * 60),
+        'regions': {region['region']: {
+            'invocations': region['invocations'],
+            'throttled': region['throttled'],
+            'latency_seconds': region['latency_seconds'],
+        } for region in regions},
+    }
+
+
+def run_bundle(args):
+    # A payroll bundle extracted as one invocation and then split into one chunk per payslip.
+    # BDA job time grows with the pages of the input (--page-latency), so the single invocation
+    # scales with the bundle while the split run scales with the admitted concurrency.
+    engine = get_engine()
+    fake_bda = get_client('bedrock-data-automation-runtime')
+    body, first_pages = bundle_pdf(args.bundle_payslips, args.seed)
+    path = os.path.join(SCRATCH_DIR, 'bundle.pdf')
+    with open(path, 'wb') as f:
+        f.write(body)
+    page_latency = fake_bda.page_latency
+    fake_bda.page_latency = args.page_latency
+    try:
+        started = time.perf_counter()
+        engine.run(engine.extract(BytesIO(body), 'bundle.pdf', 'application/pdf', DATA_AUTOMATION_ARN))
+        whole_seconds = time.perf_counter() - started
+
+        trace = Trace('Payslip', len(body))
+        started = time.perf_counter()
+        result = engine.run(engine.extract_bundle(
+            path, 'bundle.pdf', 'application/pdf', DATA_AUTOMATION_ARN, 'Payslip', timeout=args.timeout, trace=trace
+        ))
+        split_seconds = time.perf_counter() - started
+    finally:
+        fake_bda.page_latency = page_latency
+    # Every payslip should come back as its own segment, in order, starting on its own first page
+    segments = result['segments'] if result else []
+    found = [segment['page_indices'][0] for segment in segments]
+    return {
+        'pages': len(PyPDF2.PdfReader(path).pages),
+        'payslips': args.bundle_payslips,
+        'chunks': len(result['chunks']) if result else 0,
+        'failures': 0 if found == first_pages else 1,
+        'split_ms': _round(trace.timings.get('split', 0) * 1000),
+        'whole_seconds': _round(whole_seconds),
+        'split_seconds': _round(split_seconds),
+        'speedup': _round(whole_seconds / split_seconds),
+        'documents_per_minute': _round(args.bundle_payslips / split_seconds * 60),
+    }
+
+
+SCENARIOS = {
+    'single': run_single,
+    'batch': run_batch,
+    'sessions': run_sessions,
+    'mixed': run_mixed,
+    'regions': run_regions,
+    'bundle': run_bundle,
+}
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    # A scenario regresses when p95 latency grows or throughput drops by more than `tolerance`
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        if previous.get('p95_seconds') and current.get('p95_seconds'):
+            if current['p95_seconds'] > previous['p95_seconds'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {previous['p95_seconds']}s -> {current['p95_seconds']}s")
+        if previous.get('documents_per_minute') and current.get('documents_per_minute') is not None:
+            if current['documents_per_minute'] < previous['documents_per_minute'] * (1 - tolerance):
+                regressions.append(
+                    f"{name}: throughput {previous['documents_per_minute']} -> "
+                    f"{current['documents_per_minute']} documents/minute"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline extraction benchmarks against in-process AWS stand-ins")
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=['single', 'batch', 'sessions'])
+    parser.add_argument('--iterations', type=int, default=10, help="Documents in the single-document scenario")
+    parser.add_argument('--batch-size', type=int, default=100, help="Documents in the batch scenario")
+    parser.add_argument('--sessions', type=int, default=25, help="Concurrent sessions in the sessions scenario")
+    parser.add_argument('--concurrency', type=int, default=32, help="Batch and worker concurrency")
+    parser.add_argument('--pdf-pages', type=int, default=3, help="Pages per synthetic PDF")
+    parser.add_argument('--job-latency', type=float, default=0.5, help="Mean simulated BDA job time in seconds")
+    parser.add_argument('--job-jitter', type=float, default=0.2, help="Job time standard deviation as a fraction of the mean")
+    parser.add_argument('--api-latency', type=float, default=0.005, help="Simulated BDA API round trip in seconds")
+    parser.add_argument('--s3-latency', type=float, default=0.005, help="Simulated S3 round trip in seconds")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction of invocations throttled at random")
+    parser.add_argument('--max-concurrent-jobs', type=int, help="Simulated BDA concurrent job quota")
+    parser.add_argument('--segments', type=int, default=1, help="Segments produced per job")
+    parser.add_argument('--bundle-payslips', type=int, default=60, help="Payslips in the bundle scenario's PDF")
+    parser.add_argument('--page-latency', type=float, default=0.05,
+                        help="Simulated BDA job time per page in the bundle scenario")
+    parser.add_argument('--irrelevant-rate', type=float, default=0.1,
+                        help="Fraction of batch documents that match no document type")
+    parser.add_argument('--mislabelled-rate', type=float, default=0.1,
+                        help="Fraction of batch documents of another type (invoices) labelled as payslips")
+    parser.add_argument('--no-classify', action='store_true', help="Disable local classification in the batch scenario")
+    parser.add_argument('--no-result-store', action='store_true', help="Do not store batch results as Parquet")
+    parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait for each document")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default='benchmark_results.json', help="Machine-readable results")
+    parser.add_argument('--baseline', help="Previous results to compare against; exits 1 on regression")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression against the baseline")
+    args = parser.parse_args()
+
+    fake_s3, fake_bda = install_fakes(args)
+    results = {'config': vars(args), 'scenarios': {}}
+    for name in args.scenarios:
+        results['scenarios'][name] = SCENARIOS[name](args)
+        print(f"{name}: {json.dumps(results['scenarios'][name])}")
+    results['api_calls'] = {'s3': fake_s3.calls, 'bedrock_data_automation_runtime': fake_bda.calls}
+    results['throttled_invocations'] = fake_bda.throttled
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
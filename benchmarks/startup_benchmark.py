@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# What a fresh UI process imports before it can serve the first page
+APP_MODULES = ('streamlit', 'aws_clients', 'result_cache', 'preview', 'extraction', 'jobs', 'worker', 'metrics', 'classifier')
+# Heavy dependencies that must only be imported on first use
+DEFERRED_MODULES = ('pandas', 'PyPDF2', 'PIL', 'boto3', 'botocore')
+
+
+def parse_importtime(stderr):
+    # Lines look like "import time:   self [us] | cumulative | imported package", indented by depth
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append({'module': name.strip(), 'self_us': int(self_us), 'cumulative_us': int(cumulative_us), 'depth': depth})
+    return modules
+
+
+def measure_once():
+    code = (
+        "import sys, json\n"
+        f"import {', '.join(APP_MODULES)}\n"
+        f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    modules = parse_importtime(completed.stderr)
+    top_level = [module for module in modules if module['depth'] == 0]
+    return {
+        'total_ms': sum(module['cumulative_us'] for module in top_level) / 1000,
+        'app_modules_ms': {
+            module['module']: module['cumulative_us'] / 1000 for module in top_level if module['module'] in APP_MODULES
+        },
+        'slowest': sorted(modules, key=lambda module: module['self_us'], reverse=True)[:10],
+        'eagerly_imported': json.loads(completed.stdout.strip().splitlines()[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure UI cold-start import time with python -X importtime")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to measure; the median is reported")
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_IMPORT_BUDGET_MS', '1000')),
+                        help="Fail when the median total import time exceeds this")
+    parser.add_argument('--output', default='startup_results.json')
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    median_total = statistics.median(run['total_ms'] for run in runs)
+    last = runs[-1]
+    results = {
+        'runs': args.runs,
+        'budget_ms': args.budget_ms,
+        'median_total_ms': round(median_total, 1),
+        'app_modules_ms': {name: round(ms, 1) for name, ms in last['app_modules_ms'].items()},
+        'slowest_modules': [
+            {'module': module['module'], 'self_ms': round(module['self_us'] / 1000, 1)} for module in last['slowest']
+        ],
+        'eagerly_imported': last['eagerly_imported'],
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"Median import time: {results['median_total_ms']} ms (budget {args.budget_ms} ms)")
+    for name, ms in results['app_modules_ms'].items():
+        print(f"  {name:<14} {ms:>8} ms")
+    print(f"Results written to {args.output}")
+
+    failures = []
+    if median_total > args.budget_ms:
+        failures.append(f"import time {results['median_total_ms']} ms exceeds budget {args.budget_ms} ms")
+    if results['eagerly_imported']:
+        failures.append(f"deferred modules imported at startup: {', '.join(results['eagerly_imported'])}")
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+MB = 1024 * 1024
+DEFAULT_SIZES_MB = (1, 50, 200)
+
+
+def current_rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def peak_rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return 0
+
+
+def legacy_upload(s3_client, file, bucket, filename):
+    # The upload path before streaming: copy the buffer, PUT it, then HEAD it twice
+    s3_key = f'input_data/{filename}'
+    file_bytes = BytesIO(file.getvalue())
+    s3_client.put_object(Bucket=bucket, Key=s3_key, Body=file_bytes.getvalue(), ContentType='application/pdf')
+    s3_client.head_object(Bucket=bucket, Key=s3_key)
+    s3_client.head_object(Bucket=bucket, Key=s3_key)
+    return f"s3://{bucket}/{s3_key}"
+
+
+def run_single(mode, size_mb, latency, bandwidth):
+    import extraction
+    from aws_clients import set_client
+    from fake_aws import FakeS3
+
+    fake_s3 = FakeS3(latency=latency, bandwidth=bandwidth, store=False)
+    set_client('s3', fake_s3)
+
+    # The uploaded file arrives as an in-memory buffer, like Streamlit's UploadedFile
+    uploaded_file = BytesIO(os.urandom(size_mb * MB))
+    baseline_kb = current_rss_kb()
+
+    started = time.perf_counter()
+    if mode == 'legacy':
+        legacy_upload(fake_s3, uploaded_file, 'bench-bucket', 'document.pdf')
+    else:
+        extraction.upload_document(uploaded_file, 'document.pdf', 'application/pdf', bucket='bench-bucket')
+    elapsed = time.perf_counter() - started
+
+    return {
+        'mode': mode,
+        'size_mb': size_mb,
+        'latency_seconds': round(elapsed, 4),
+        'peak_rss_over_input_mb': round((peak_rss_kb() - baseline_kb) / 1024, 1),
+        'requests': fake_s3.calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy and streaming S3 upload paths")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES_MB), help="Input sizes in MB")
+    parser.add_argument('--latency', type=float, default=0.02, help="Simulated per-request round trip in seconds")
+    parser.add_argument('--bandwidth-mb', type=float, default=100.0, help="Simulated per-connection bandwidth in MB/s")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--single', nargs=2, metavar=('MODE', 'SIZE_MB'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    bandwidth = args.bandwidth_mb * MB
+
+    if args.single:
+        print(json.dumps(run_single(args.single[0], int(args.single[1]), args.latency, bandwidth)))
+        return
+
+    # Each case runs in a fresh interpreter so peak RSS is not polluted by earlier cases
+    results = []
+    for size_mb in args.sizes:
+        for mode in ('legacy', 'streaming'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--single', mode, str(size_mb),
+                 '--latency', str(args.latency), '--bandwidth-mb', str(args.bandwidth_mb)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'size':>6} {'mode':>10} {'latency (s)':>12} {'peak RSS over input (MB)':>26}  requests")
+    for result in results:
+        print(f"{result['size_mb']:>4}MB {result['mode']:>10} {result['latency_seconds']:>12} "
+              f"{result['peak_rss_over_input_mb']:>26}  {result['requests']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
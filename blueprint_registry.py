@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+
+# Registry configuration
+BLUEPRINTS_DIR = os.environ.get('BLUEPRINTS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blueprints'))
+# Published {document type: project ARN} map written by provisioning and read by the UI and batch tools
+DATA_AUTOMATION_ARNS_PATH = os.environ.get(
+    'DATA_AUTOMATION_ARNS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_automation_arns.json')
+)
+
+_REQUIRED_KEYS = ('document_type', 'blueprint_name', 'project_name', 'schema')
+# Comparisons a check can use; the result store evaluates them
+CHECK_OPS = ('>=', '>', '<=', '<', '==')
+
+
+class BlueprintDefinition:
+    # One document type: its blueprint schema and the data automation project that uses it
+    def __init__(self, document_type, blueprint_name, project_name, schema, keywords=(), checks=(), split_markers=(),
+                 path=None):
+        self.document_type = document_type
+        self.blueprint_name = blueprint_name
+        self.project_name = project_name
+        self.schema = schema
+        # Phrases that identify the document type in its text, used by the local classifier
+        self.keywords = tuple(keywords)
+        # Consistency rules between two fields ({"name", "left", "op", "right"}), used by the result store
+        self.checks = tuple(checks)
+        # Phrases at the top of the first page of each document, used to split bundled PDFs
+        self.split_markers = tuple(split_markers)
+        self.path = path
+
+    @property
+    def fields(self):
+        return self.schema.get('properties', {})
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        missing = [key for key in _REQUIRED_KEYS if key not in data]
+        if missing:
+            raise ValueError(f"{path}: missing {', '.join(missing)}")
+        if not isinstance(data['schema'].get('properties'), dict):
+            raise ValueError(f"{path}: schema has no properties")
+        for check in data.get('checks', ()):
+            unknown = [check[side] for side in ('left', 'right') if check[side] not in data['schema']['properties']]
+            if unknown:
+                raise ValueError(f"{path}: check {check['name']} refers to unknown fields {', '.join(unknown)}")
+            if check['op'] not in CHECK_OPS:
+                raise ValueError(
+                    f"{path}: check {check['name']} has unknown op {check['op']!r} (expected one of {', '.join(CHECK_OPS)})"
+                )
+        return cls(
+            data['document_type'],
+            data['blueprint_name'],
+            data['project_name'],
+            data['schema'],
+            data.get('keywords', ()),
+            data.get('checks', ()),
+            data.get('split_markers', ()),
+            path
+        )
+
+
+def load_blueprints(directory=BLUEPRINTS_DIR):
+    # Every *.json file in the directory is one document type; adding a type is data-only
+    definitions = [
+        BlueprintDefinition.from_file(os.path.join(directory, name))
+        for name in sorted(os.listdir(directory))
+        if name.endswith('.json')
+    ]
+    for attribute in ('document_type', 'blueprint_name', 'project_name'):
+        values = [getattr(definition, attribute) for definition in definitions]
+        duplicates = sorted({value for value in values if values.count(value) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate {attribute} in {directory}: {', '.join(duplicates)}")
+    return definitions
+
+
+def publish_data_automation_arns(arns, path=DATA_AUTOMATION_ARNS_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(sorted(arns.items())), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def validate_arns(arns, source):
+    if not isinstance(arns, dict):
+        raise ValueError(f"{source}: expected a {{document type: project ARN}} object")
+    for document_type, arn in arns.items():
+        if not isinstance(arn, str) or not arn.startswith('arn:') or ':data-automation-project/' not in arn:
+            raise ValueError(f"{source}: {document_type!r} is not a data automation project ARN: {arn!r}")
+    return arns
+
+
+def load_data_automation_arns():
+    # Sources, in order: DATA_AUTOMATION_ARNS (JSON set by the deployment), the published file
+    # from a local provisioning run, then the legacy single-type PAYSLIP_DATA_AUTOMATION_ARN
+    if os.environ.get('DATA_AUTOMATION_ARNS'):
+        return validate_arns(json.loads(os.environ['DATA_AUTOMATION_ARNS']), 'DATA_AUTOMATION_ARNS')
+    if os.path.exists(DATA_AUTOMATION_ARNS_PATH):
+        with open(DATA_AUTOMATION_ARNS_PATH) as f:
+            return validate_arns(json.load(f), DATA_AUTOMATION_ARNS_PATH)
+    if os.environ.get('PAYSLIP_DATA_AUTOMATION_ARN'):
+        return {'Payslip': os.environ['PAYSLIP_DATA_AUTOMATION_ARN']}
+    return {}
+
+
+_arns = None
+_arns_lock = threading.Lock()
+_definitions = None
+_definitions_lock = threading.Lock()
+
+
+def get_data_automation_arns():
+    # Loaded once per process
+    global _arns
+    with _arns_lock:
+        if _arns is None:
+            _arns = load_data_automation_arns()
+        return _arns
+
+
+def get_blueprints():
+    # {document type: BlueprintDefinition}, loaded once per process; empty when no registry is deployed
+    global _definitions
+    with _definitions_lock:
+        if _definitions is None:
+            try:
+                _definitions = {definition.document_type: definition for definition in load_blueprints()}
+            except OSError:
+                _definitions = {}
+        return _definitions
@@ -0,0 +1,193 @@
+import asyncio
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from blueprint_registry import get_blueprints
+
+# Bundle splitting configuration
+SPLITTER_ENABLED = os.environ.get('SPLITTER_ENABLED', 'true').lower() == 'true'
+# PDFs with fewer pages go to BDA in one piece; its own splitter handles a handful of payslips well
+SPLITTER_MIN_PAGES = int(os.environ.get('SPLITTER_MIN_PAGES', '8'))
+# A start marker only counts near the top of a page, so a payslip quoting its title further down
+# does not start a new document
+SPLITTER_HEADER_CHARS = int(os.environ.get('SPLITTER_HEADER_CHARS', '200'))
+# Bundles without any detectable boundary (e.g. scans) are cut every N pages when set; 0 keeps them whole
+SPLITTER_FALLBACK_PAGES = int(os.environ.get('SPLITTER_FALLBACK_PAGES', '0'))
+SPLITTER_WORKERS = int(os.environ.get('SPLITTER_WORKERS', str(os.cpu_count() or 2)))
+# Pages whose text one pool task reads
+SPLITTER_PAGES_PER_TASK = int(os.environ.get('SPLITTER_PAGES_PER_TASK', '25'))
+SPLITTER_DIR = os.environ.get('SPLITTER_DIR', tempfile.gettempdir())
+
+# Page boundary flags
+START = 'start'
+CONTINUATION = 'continuation'
+
+# "Page 1 of 3" starts a document and "Page 2 of 3" continues one, whatever the document type
+_PAGE_OF = re.compile(r'\bpage (\d+) of (\d+)\b')
+
+
+class Chunk:
+    # Pages [first_page, end_page) of the bundle, written to `path` as a PDF of their own
+    def __init__(self, number, first_page, end_page, path=None):
+        self.number = number
+        self.first_page = first_page
+        self.end_page = end_page
+        self.path = path
+
+    def to_dict(self):
+        return {'chunk': self.number, 'first_page': self.first_page, 'end_page': self.end_page}
+
+
+def should_split(content_type):
+    return SPLITTER_ENABLED and content_type == 'application/pdf'
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+
+
+def split_markers(document_type):
+    # Phrases that open each document of the type, from its blueprint's `split_markers`
+    definition = get_blueprints().get(document_type)
+    return tuple(_normalize(marker) for marker in definition.split_markers) if definition else ()
+
+
+def page_flag(text, markers, header_chars=SPLITTER_HEADER_CHARS):
+    # START, CONTINUATION or None (no evidence either way) for one page's text
+    text = _normalize(text)
+    page_of = _PAGE_OF.search(text)
+    if page_of:
+        return START if page_of.group(1) == '1' else CONTINUATION
+    header = f" {text[:header_chars]} "
+    if any(f" {marker} " in header for marker in markers):
+        return START
+    return None
+
+
+def count_pages(path):
+    import PyPDF2
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def scan_pages(path, first_page, end_page, markers):
+    # Runs in a pool process: flags for pages [first_page, end_page)
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    return [page_flag(reader.pages[index].extract_text() or '', markers) for index in range(first_page, end_page)]
+
+
+def write_chunks(path, ranges, directory):
+    # Runs in a pool process: one PDF per (number, first_page, end_page), returned as paths
+    import PyPDF2
+    reader = PyPDF2.PdfReader(path)
+    paths = []
+    for number, first_page, end_page in ranges:
+        writer = PyPDF2.PdfWriter()
+        for index in range(first_page, end_page):
+            writer.add_page(reader.pages[index])
+        chunk_path = os.path.join(directory, f"{number:05d}.pdf")
+        output = BytesIO()
+        writer.write(output)
+        with open(chunk_path, 'wb') as f:
+            f.write(output.getvalue())
+        paths.append(chunk_path)
+    return paths
+
+
+def chunk_ranges(flags, fallback_pages=SPLITTER_FALLBACK_PAGES):
+    # [(first_page, end_page)] with a new chunk at every page flagged START. The first page always
+    # opens a chunk; pages without evidence stay with the document before them.
+    page_count = len(flags)
+    if START in flags:
+        starts = [index for index, flag in enumerate(flags) if flag == START and index > 0]
+    elif fallback_pages:
+        starts = list(range(fallback_pages, page_count, fallback_pages))
+    else:
+        return [(0, page_count)]
+    boundaries = [0] + starts + [page_count]
+    return list(zip(boundaries, boundaries[1:]))
+
+
+async def split_bundle(loop, path, markers, pool=None):
+    # [Chunk] with one chunk per document found in the PDF at `path`, or None when it holds a
+    # single document. Page text is read and chunks are written in parallel by the pool.
+    pool = pool or get_split_pool()
+    page_count = await loop.run_in_executor(pool, count_pages, path)
+    if page_count < SPLITTER_MIN_PAGES:
+        return None
+    scans = await asyncio.gather(*(
+        loop.run_in_executor(pool, scan_pages, path, first, min(first + SPLITTER_PAGES_PER_TASK, page_count), markers)
+        for first in range(0, page_count, SPLITTER_PAGES_PER_TASK)
+    ))
+    ranges = chunk_ranges([flag for scan in scans for flag in scan])
+    if len(ranges) < 2:
+        return None
+
+    chunks = [Chunk(number, first, end) for number, (first, end) in enumerate(ranges, start=1)]
+    directory = tempfile.mkdtemp(prefix='bda_chunks_', dir=SPLITTER_DIR)
+    # Every pool process parses the bundle once and writes a contiguous run of chunks
+    per_task = -(-len(chunks) // SPLITTER_WORKERS)
+    groups = [chunks[index:index + per_task] for index in range(0, len(chunks), per_task)]
+    try:
+        written = await asyncio.gather(*(
+            loop.run_in_executor(
+                pool, write_chunks, path,
+                [(chunk.number, chunk.first_page, chunk.end_page) for chunk in group], directory
+            )
+            for group in groups
+        ))
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    for group, paths in zip(groups, written):
+        for chunk, chunk_path in zip(group, paths):
+            chunk.path = chunk_path
+    return chunks
+
+
+def remove_chunks(chunks):
+    directories = {os.path.dirname(chunk.path) for chunk in chunks if chunk.path}
+    for directory in directories:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def merge_chunks(chunks, results):
+    # One result for the bundle: segments in page order, with page indices mapped back from the
+    # chunk to the bundle and the chunk each segment came from. Results are not modified, since
+    # a cached chunk result may be shared.
+    segments = []
+    for chunk, result in zip(chunks, results):
+        for segment in result['segments']:
+            pages = segment.get('page_indices') or range(chunk.end_page - chunk.first_page)
+            segments.append({
+                **segment,
+                'page_indices': [chunk.first_page + page for page in pages],
+                'page_offset': chunk.first_page,
+                'chunk': chunk.number,
+            })
+    for number, segment in enumerate(segments, start=1):
+        segment['segment'] = number
+    return {'segments': segments, 'chunks': [chunk.to_dict() for chunk in chunks]}
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_split_pool():
+    # Page text extraction and PDF writing are pure Python, so they run in processes; spawn for
+    # the same reason as the preprocess pool (the parent runs threads)
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ProcessPoolExecutor(
+                max_workers=SPLITTER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _default_pool
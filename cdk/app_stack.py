@@ -1,68 +1,64 @@
 from aws_cdk import (
     Stack,
     aws_s3 as s3,
+    aws_sqs as sqs,
     aws_ecs as ecs,
+    aws_efs as efs,
     aws_iam as iam,
     aws_ec2 as ec2,
     aws_logs as logs,
+    aws_dynamodb as dynamodb,
+    aws_cloudwatch as cloudwatch,
     aws_ecr_assets as ecr_assets,
     aws_elasticloadbalancingv2 as elbv2,
     CfnOutput,
+    Duration,
     RemovalPolicy
 )
 from constructs import Construct
-import subprocess
-import os
 import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from create_bedrock_data_automation import provision
+from metrics import METRICS_NAMESPACE
 
 class AppStack(Stack):
+    def context_value(self, key, default):
+        # Capacity settings come from CDK context (cdk.json, or `cdk deploy -c workerMaxTasks=20`);
+        # values given on the command line arrive as strings
+        value = self.node.try_get_context(key)
+        return default if value is None else type(default)(value)
+
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
-        # Path to the Python script
-        python_file_path = os.path.join(os.path.dirname(__file__), "../create_bedrock_data_automation.py")
+        # UI service: scales on ALB requests per task
+        ui_cpu = self.context_value("uiCpu", 512)
+        ui_memory_mib = self.context_value("uiMemoryMiB", 1024)
+        ui_min_tasks = self.context_value("uiMinTasks", 1)
+        ui_max_tasks = self.context_value("uiMaxTasks", 4)
+        ui_requests_per_target = self.context_value("uiRequestsPerTarget", 500)
+        # Worker service: scales on queued jobs and on jobs in flight per task
+        worker_cpu = self.context_value("workerCpu", 1024)
+        worker_memory_mib = self.context_value("workerMemoryMiB", 2048)
+        worker_min_tasks = self.context_value("workerMinTasks", 1)
+        worker_max_tasks = self.context_value("workerMaxTasks", 10)
+        worker_concurrency = self.context_value("workerConcurrency", 16)
+        worker_queue_depth_target = self.context_value("workerQueueDepthTarget", 16)
+        worker_batch_queue_depth_target = self.context_value("workerBatchQueueDepthTarget", 64)
+        worker_in_flight_target = self.context_value("workerInFlightTarget", 12)
+        job_lease_seconds = self.context_value("jobLeaseSeconds", 120)
+        job_max_receives = self.context_value("jobMaxReceives", 5)
+        job_retention_days = self.context_value("jobRetentionDays", 7)
 
-        try:
-            # Execute the Python script and pass the role_arn parameter
-            result = subprocess.run(
-                ["python3", python_file_path],
-                capture_output=True,
-                text=True,
-                check=True,
-            )
-            try:
-                start_index = result.stdout.find("{\"final_project_arn")
-                
-                if start_index == -1:
-                    raise ValueError("The expected JSON key 'final_project_arn' was not found in the output.")
-                
-                # Try to find the last closing brace for the JSON string
-                end_index = result.stdout.rfind("}") + 1  # +1 to include the closing brace
-
-                # Extract the JSON string
-                json_str = result.stdout[start_index:end_index].strip()
-                
-                print("Extracted JSON string:")
-                print(json_str)
-                
-                # Parse the JSON string
-                output = json.loads(json_str)
-
-                # Extract values from the parsed JSON
-                data_automation_project_arn = output.get("final_project_arn")
-                
-                print(f"Project ARN: {data_automation_project_arn}")
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON. Error: {e}")
-                print(f"Raw output: {result.stdout.strip()}")
-                raise
-            except ValueError as ve:
-                print(f"ValueError: {ve}")
-                raise
-
-        except subprocess.CalledProcessError as e:
-            print("Error executing Python file!")
-            print(f"Error: {e.stderr.strip()}")
+        # Provision every registered document type in-process; unchanged resources resolve
+        # from the local provisioning cache without calling Bedrock
+        provisioning = provision()
+        for resource in provisioning["resources"]:
+            print(f"{resource['type']} {resource['name']}: {resource['action']} ({resource['arn']})", file=sys.stderr)
+        data_automation_arns = provisioning["data_automation_arns"]
 
         # Get AWS Account ID
         account_id = Stack.of(self).account
@@ -121,9 +117,73 @@ class AppStack(Stack):
             ec2.Port.tcp(8501)
         )
 
-        # Create S3 Bucket
+        worker_security_group = ec2.SecurityGroup(
+            self, "WorkerSecurityGroup",
+            vpc=vpc,
+            allow_all_outbound=True
+        )
+
+        # Create S3 Bucket; documents handed from the UI to the workers (and large job results)
+        # live under spool/ only as long as the job records do
         bucket = s3.Bucket(self, "MyAppBucket",
-            bucket_name=s3_bucket_name
+            bucket_name=s3_bucket_name,
+            lifecycle_rules=[
+                s3.LifecycleRule(prefix="spool/", expiration=Duration.days(job_retention_days))
+            ]
+        )
+
+        # Job store shared by the UI and worker services: job records in DynamoDB and one SQS
+        # message per queued job. The visibility timeout is a worker's lease on the job, and a job
+        # whose worker keeps dying moves to the dead-letter queue.
+        job_table = dynamodb.Table(self, "JobTable",
+            partition_key=dynamodb.Attribute(name="id", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        job_table.add_global_secondary_index(
+            index_name="cache_key",
+            partition_key=dynamodb.Attribute(name="cache_key", type=dynamodb.AttributeType.STRING)
+        )
+        job_dead_letter_queue = sqs.Queue(self, "JobDeadLetterQueue",
+            retention_period=Duration.days(14)
+        )
+        job_queue = sqs.Queue(self, "JobQueue",
+            visibility_timeout=Duration.seconds(job_lease_seconds),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=job_max_receives,
+                queue=job_dead_letter_queue
+            )
+        )
+        # batch_extract.py jobs wait here, so workers only take them when no upload is queued
+        batch_job_queue = sqs.Queue(self, "BatchJobQueue",
+            visibility_timeout=Duration.seconds(job_lease_seconds),
+            dead_letter_queue=sqs.DeadLetterQueue(
+                max_receive_count=job_max_receives,
+                queue=job_dead_letter_queue
+            )
+        )
+
+        # Full-text search index (search_index.py) on a file system every task mounts: workers index
+        # the jobs they finish and the UI searches the same file
+        search_file_system = efs.FileSystem(self, "SearchIndexFileSystem",
+            vpc=vpc,
+            vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS),
+            encrypted=True,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        for security_group in (service_security_group, worker_security_group):
+            search_file_system.connections.allow_default_port_from(security_group)
+        search_volume = ecs.Volume(
+            name="search-index",
+            efs_volume_configuration=ecs.EfsVolumeConfiguration(
+                file_system_id=search_file_system.file_system_id,
+                transit_encryption="ENABLED",
+                authorization_config=ecs.AuthorizationConfig(iam="ENABLED")
+            )
+        )
+        search_mount_point = ecs.MountPoint(
+            container_path="/mnt/search", source_volume="search-index", read_only=False
         )
 
         # Create ECS Cluster
@@ -143,14 +203,43 @@ class AppStack(Stack):
             ]
         )
 
+        for queue in (job_queue, batch_job_queue):
+            queue.grant_send_messages(task_role)
+            queue.grant_consume_messages(task_role)
+        job_table.grant_read_write_data(task_role)
+        search_file_system.grant_read_write(task_role)
+
+        # Settings both services share
+        environment = {
+            "S3_BUCKET_NAME": s3_bucket_name,
+            "DATA_AUTOMATION_ARNS": json.dumps(data_automation_arns),
+            "JOB_STORE_BACKEND": "sqs",
+            "JOB_QUEUE_URL": job_queue.queue_url,
+            "JOB_BATCH_QUEUE_URL": batch_job_queue.queue_url,
+            "JOB_TABLE_NAME": job_table.table_name,
+            "JOB_LEASE_SECONDS": str(job_lease_seconds),
+            # Workers fail a job on the delivery that would otherwise be its last before the dead-letter queue
+            "JOB_MAX_RECEIVES": str(job_max_receives),
+            "JOB_RETENTION_DAYS": str(job_retention_days),
+            # Results written by a worker are cache hits for every UI task
+            "RESULT_CACHE_S3_BUCKET": s3_bucket_name,
+            # The worker service scales on a metric its tasks publish as EMF in this namespace
+            "METRICS_EMF": "true",
+            "METRICS_NAMESPACE": METRICS_NAMESPACE,
+            # SQLite's WAL mode needs memory shared between processes, which EFS cannot provide
+            "SEARCH_INDEX_PATH": "/mnt/search/bda_search.db",
+            "SEARCH_INDEX_JOURNAL_MODE": "DELETE"
+        }
+
         # Define the ECS Fargate Task Definition
         task_definition = ecs.FargateTaskDefinition(
             self, 
             "MyTaskDef",
             task_role=task_role,
             execution_role=task_role,
-            cpu=512,
-            memory_limit_mib=1024
+            cpu=ui_cpu,
+            memory_limit_mib=ui_memory_mib,
+            volumes=[search_volume]
         )
 
         # Add container with logging
@@ -167,8 +256,9 @@ class AppStack(Stack):
                 )
             ),
             environment={
-                "S3_BUCKET_NAME": s3_bucket_name,
-                "PAYSLIP_DATA_AUTOMATION_ARN": data_automation_project_arn
+                **environment,
+                # Extraction runs in the worker service
+                "EMBEDDED_WORKER": "false"
             }
         )
 
@@ -176,6 +266,7 @@ class AppStack(Stack):
         container.add_port_mappings(
             ecs.PortMapping(container_port=8501)
         )
+        container.add_mount_points(search_mount_point)
 
         # Create ALB
         alb = elbv2.ApplicationLoadBalancer(
@@ -190,6 +281,7 @@ class AppStack(Stack):
             self, "MyFargateService",
             cluster=cluster,
             task_definition=task_definition,
+            desired_count=ui_min_tasks,
             security_groups=[service_security_group],
             assign_public_ip=False,
             vpc_subnets=ec2.SubnetSelection(
@@ -199,7 +291,7 @@ class AppStack(Stack):
 
         # Add listener and target group
         listener = alb.add_listener("Listener", port=80)
-        listener.add_targets("ECS",
+        target_group = listener.add_targets("ECS",
             port=8501,
             protocol=elbv2.ApplicationProtocol.HTTP,
             targets=[service],
@@ -210,6 +302,97 @@ class AppStack(Stack):
             )
         )
 
+        ui_scaling = service.auto_scale_task_count(
+            min_capacity=ui_min_tasks,
+            max_capacity=ui_max_tasks
+        )
+        ui_scaling.scale_on_request_count("RequestScaling",
+            requests_per_target=ui_requests_per_target,
+            target_group=target_group,
+            scale_in_cooldown=Duration.minutes(5),
+            scale_out_cooldown=Duration.minutes(1)
+        )
+
+        # Worker service: drains the job queue, no load balancer
+        worker_task_definition = ecs.FargateTaskDefinition(
+            self,
+            "WorkerTaskDef",
+            task_role=task_role,
+            execution_role=task_role,
+            cpu=worker_cpu,
+            memory_limit_mib=worker_memory_mib,
+            volumes=[search_volume]
+        )
+        worker_container = worker_task_definition.add_container(
+            "WorkerContainer",
+            image=ecs.ContainerImage.from_docker_image_asset(docker_image_asset),
+            command=["python", "worker.py"],
+            logging=ecs.LogDrivers.aws_logs(
+                stream_prefix="worker",
+                log_group=logs.LogGroup(
+                    self,
+                    "WorkerLogGroup",
+                    retention=logs.RetentionDays.ONE_WEEK,
+                    removal_policy=RemovalPolicy.DESTROY
+                )
+            ),
+            environment={
+                **environment,
+                "WORKER_CONCURRENCY": str(worker_concurrency),
+                "WORKER_SERVICE_NAME": "worker"
+            }
+        )
+        worker_container.add_mount_points(search_mount_point)
+        worker_service = ecs.FargateService(
+            self, "WorkerService",
+            cluster=cluster,
+            task_definition=worker_task_definition,
+            desired_count=worker_min_tasks,
+            security_groups=[worker_security_group],
+            assign_public_ip=False,
+            vpc_subnets=ec2.SubnetSelection(
+                subnet_type=ec2.SubnetType.PRIVATE_WITH_EGRESS
+            )
+        )
+
+        # Target tracking on queued jobs adds tasks as soon as work waits (with a looser target for
+        # backfills), and on jobs in flight per task (sampled by every worker) keeps capacity while
+        # jobs run. Application Auto Scaling only scales in when every policy agrees.
+        worker_scaling = worker_service.auto_scale_task_count(
+            min_capacity=worker_min_tasks,
+            max_capacity=worker_max_tasks
+        )
+        worker_scaling.scale_to_track_custom_metric("QueueDepthScaling",
+            metric=job_queue.metric_approximate_number_of_messages_visible(
+                period=Duration.minutes(1),
+                statistic="Average"
+            ),
+            target_value=worker_queue_depth_target,
+            scale_in_cooldown=Duration.minutes(5),
+            scale_out_cooldown=Duration.minutes(1)
+        )
+        worker_scaling.scale_to_track_custom_metric("BatchQueueDepthScaling",
+            metric=batch_job_queue.metric_approximate_number_of_messages_visible(
+                period=Duration.minutes(1),
+                statistic="Average"
+            ),
+            target_value=worker_batch_queue_depth_target,
+            scale_in_cooldown=Duration.minutes(5),
+            scale_out_cooldown=Duration.minutes(1)
+        )
+        worker_scaling.scale_to_track_custom_metric("InFlightScaling",
+            metric=cloudwatch.Metric(
+                namespace=METRICS_NAMESPACE,
+                metric_name="JobsInFlight",
+                dimensions_map={"Service": "worker"},
+                period=Duration.minutes(1),
+                statistic="Average"
+            ),
+            target_value=worker_in_flight_target,
+            scale_in_cooldown=Duration.minutes(5),
+            scale_out_cooldown=Duration.minutes(1)
+        )
+
         # Output ALB DNS
         CfnOutput(
             self, "LoadBalancerDNS",
@@ -219,4 +402,14 @@ class AppStack(Stack):
         CfnOutput(
             self, "BucketName",
             value=bucket.bucket_name
+        )
+
+        CfnOutput(
+            self, "JobQueueUrl",
+            value=job_queue.queue_url
+        )
+
+        CfnOutput(
+            self, "BatchJobQueueUrl",
+            value=batch_job_queue.queue_url
         )
\ No newline at end of file
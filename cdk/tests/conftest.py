@@ -0,0 +1,5 @@
+import os
+import sys
+
+# app_stack is imported the way cdk/app.py imports it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
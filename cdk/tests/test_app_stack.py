@@ -0,0 +1,176 @@
+import json
+
+import pytest
+from aws_cdk import App
+from aws_cdk.assertions import Match, Template
+
+import app_stack
+
+DATA_AUTOMATION_ARNS = {'Payslip': 'arn:aws:bedrock:us-west-2:123456789012:data-automation-project/payslip'}
+OVERRIDES = {
+    'uiCpu': 1024,
+    'uiMemoryMiB': 2048,
+    'uiMinTasks': 2,
+    'uiMaxTasks': 6,
+    'workerCpu': 2048,
+    'workerMemoryMiB': 4096,
+    'workerMinTasks': 3,
+    'workerMaxTasks': 30,
+    'jobMaxReceives': 7,
+}
+
+
+def synth(context=None):
+    # Provisioning would call Bedrock; the stack only needs the ARN map it returns
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(app_stack, 'provision', lambda: {'resources': [], 'data_automation_arns': DATA_AUTOMATION_ARNS})
+        app = App(context=context or {})
+        return Template.from_stack(app_stack.AppStack(app, 'TestStack'))
+
+
+@pytest.fixture(scope='module')
+def template():
+    return synth()
+
+
+@pytest.fixture(scope='module')
+def overridden():
+    return synth(OVERRIDES)
+
+
+def container(template, name):
+    for task_definition in template.find_resources('AWS::ECS::TaskDefinition').values():
+        for definition in task_definition['Properties']['ContainerDefinitions']:
+            if definition['Name'] == name:
+                return task_definition['Properties'], definition
+    raise AssertionError(f"No container {name}")
+
+
+def environment(definition):
+    return {variable['Name']: variable['Value'] for variable in definition['Environment']}
+
+
+def service_id(template, container_name):
+    # Logical id of the service that runs the task definition with this container
+    task_definitions = template.find_resources('AWS::ECS::TaskDefinition')
+    for logical_id, service in template.find_resources('AWS::ECS::Service').items():
+        task_definition = task_definitions[service['Properties']['TaskDefinition']['Ref']]
+        if any(definition['Name'] == container_name
+               for definition in task_definition['Properties']['ContainerDefinitions']):
+            return logical_id
+    raise AssertionError(f"No service runs {container_name}")
+
+
+def service_task_definition(template, container_name):
+    services = template.find_resources('AWS::ECS::Service')
+    return services[service_id(template, container_name)]['Properties']['TaskDefinition']['Ref']
+
+
+def scalable_target(template, container_name):
+    # (logical id, properties) of the service's scalable target
+    service = service_id(template, container_name)
+    for logical_id, target in template.find_resources('AWS::ApplicationAutoScaling::ScalableTarget').items():
+        if service in json.dumps(target['Properties']['ResourceId']):
+            return logical_id, target['Properties']
+    raise AssertionError(f"{container_name} does not scale")
+
+
+def scaling_policies(template, container_name):
+    target_id, _ = scalable_target(template, container_name)
+    return [
+        policy['Properties']['TargetTrackingScalingPolicyConfiguration']
+        for policy in template.find_resources('AWS::ApplicationAutoScaling::ScalingPolicy').values()
+        if policy['Properties']['ScalingTargetId'] == {'Ref': target_id}
+    ]
+
+
+def test_ui_and_worker_run_as_separate_services(template):
+    template.resource_count_is('AWS::ECS::Service', 2)
+    assert service_id(template, 'MyContainer') != service_id(template, 'WorkerContainer')
+
+    _, ui = container(template, 'MyContainer')
+    assert environment(ui)['EMBEDDED_WORKER'] == 'false'
+    _, worker = container(template, 'WorkerContainer')
+    assert worker['Command'] == ['python', 'worker.py']
+    assert 'EMBEDDED_WORKER' not in environment(worker)
+    for definition in (ui, worker):
+        assert environment(definition)['JOB_STORE_BACKEND'] == 'sqs'
+        assert environment(definition)['METRICS_EMF'] == 'true'
+        assert environment(definition)['SEARCH_INDEX_PATH'].startswith('/mnt/search/')
+        assert environment(definition)['SEARCH_INDEX_JOURNAL_MODE'] == 'DELETE'
+        assert json.loads(environment(definition)['DATA_AUTOMATION_ARNS']) == DATA_AUTOMATION_ARNS
+
+
+def test_search_index_is_on_a_file_system_both_services_mount(template):
+    template.resource_count_is('AWS::EFS::FileSystem', 1)
+    [file_system_id] = template.find_resources('AWS::EFS::FileSystem')
+    for name in ('MyContainer', 'WorkerContainer'):
+        task_definition, definition = container(template, name)
+        [volume] = task_definition['Volumes']
+        assert volume['EFSVolumeConfiguration']['FilesystemId'] == {'Ref': file_system_id}
+        assert volume['EFSVolumeConfiguration']['TransitEncryption'] == 'ENABLED'
+        assert definition['MountPoints'] == [
+            {'ContainerPath': '/mnt/search', 'ReadOnly': False, 'SourceVolume': volume['Name']}
+        ]
+    # NFS from both services' security groups
+    nfs = template.find_resources('AWS::EC2::SecurityGroupIngress', {'Properties': {'FromPort': 2049}})
+    assert len(nfs) == 2
+
+
+def test_worker_scales_on_queue_depth_and_jobs_in_flight(template):
+    metrics = {}
+    for policy in scaling_policies(template, 'WorkerContainer'):
+        metric = policy['CustomizedMetricSpecification']
+        metrics.setdefault(metric['MetricName'], []).append(metric)
+    assert len(metrics['ApproximateNumberOfMessagesVisible']) == 2
+    assert {metric['Namespace'] for metric in metrics['ApproximateNumberOfMessagesVisible']} == {'AWS/SQS'}
+    [in_flight] = metrics['JobsInFlight']
+    assert in_flight['Namespace'] == app_stack.METRICS_NAMESPACE
+    assert in_flight['Dimensions'] == [{'Name': 'Service', 'Value': 'worker'}]
+
+
+def test_ui_scales_on_alb_requests(template):
+    [policy] = scaling_policies(template, 'MyContainer')
+    assert policy['PredefinedMetricSpecification']['PredefinedMetricType'] == 'ALBRequestCountPerTarget'
+    assert policy['TargetValue'] == 500
+
+
+def test_job_queues_redrive_to_dead_letter_queue(template):
+    queues = template.find_resources('AWS::SQS::Queue', {'Properties': {'RedrivePolicy': Match.any_value()}})
+    assert len(queues) == 2
+    for queue in queues.values():
+        redrive = queue['Properties']['RedrivePolicy']
+        assert redrive['maxReceiveCount'] == 5
+        assert redrive['deadLetterTargetArn']['Fn::GetAtt'][0].startswith('JobDeadLetterQueue')
+
+
+def test_job_table_has_cache_key_index_and_ttl(template):
+    template.has_resource_properties('AWS::DynamoDB::Table', {
+        'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        'TimeToLiveSpecification': {'AttributeName': 'expires_at', 'Enabled': True},
+        'GlobalSecondaryIndexes': [Match.object_like({
+            'IndexName': 'cache_key',
+            'KeySchema': [{'AttributeName': 'cache_key', 'KeyType': 'HASH'}],
+        })],
+    })
+
+
+def test_context_overrides(overridden):
+    ui_task, ui = container(overridden, 'MyContainer')
+    assert (ui_task['Cpu'], ui_task['Memory']) == ('1024', '2048')
+    worker_task, worker = container(overridden, 'WorkerContainer')
+    assert (worker_task['Cpu'], worker_task['Memory']) == ('2048', '4096')
+
+    _, ui_target = scalable_target(overridden, 'MyContainer')
+    assert (ui_target['MinCapacity'], ui_target['MaxCapacity']) == (2, 6)
+    _, worker_target = scalable_target(overridden, 'WorkerContainer')
+    assert (worker_target['MinCapacity'], worker_target['MaxCapacity']) == (3, 30)
+    overridden.has_resource_properties('AWS::ECS::Service', {
+        'TaskDefinition': {'Ref': service_task_definition(overridden, 'WorkerContainer')},
+        'DesiredCount': 3,
+    })
+
+    queues = overridden.find_resources('AWS::SQS::Queue', {'Properties': {'RedrivePolicy': Match.any_value()}})
+    assert [queue['Properties']['RedrivePolicy']['maxReceiveCount'] for queue in queues.values()] == [7, 7]
+    for definition in (ui, worker):
+        assert environment(definition)['JOB_MAX_RECEIVES'] == '7'
@@ -0,0 +1,187 @@
+import math
+import os
+import re
+import threading
+import time
+from io import BytesIO
+
+from blueprint_registry import get_blueprints, get_data_automation_arns
+
+# Classifier configuration
+CLASSIFIER_ENABLED = os.environ.get('CLASSIFIER_ENABLED', 'true').lower() == 'true'
+# Only the first pages are read; a document's type is almost always evident on page one
+CLASSIFIER_MAX_PAGES = int(os.environ.get('CLASSIFIER_MAX_PAGES', '2'))
+CLASSIFIER_MAX_CHARS = int(os.environ.get('CLASSIFIER_MAX_CHARS', '4000'))
+# Below this many words there is no evidence either way (e.g. a scanned PDF), so the selected type is kept
+CLASSIFIER_MIN_WORDS = int(os.environ.get('CLASSIFIER_MIN_WORDS', '12'))
+# A document whose best score stays below this matches no registered type and is rejected
+CLASSIFIER_MIN_SCORE = float(os.environ.get('CLASSIFIER_MIN_SCORE', '3.0'))
+# Images are not OCRed; they are only rejected when they clearly are not a page (e.g. a photo)
+CLASSIFIER_MIN_IMAGE_SIDE = int(os.environ.get('CLASSIFIER_MIN_IMAGE_SIDE', '200'))
+CLASSIFIER_MIN_LIGHT_FRACTION = float(os.environ.get('CLASSIFIER_MIN_LIGHT_FRACTION', '0.5'))
+
+# Decisions
+SELECTED = 'selected'
+ROUTED = 'routed'
+REJECTED = 'rejected'
+
+KEYWORD_WEIGHT = 3.0
+_STOPWORDS = frozenset((
+    'the', 'and', 'for', 'what', 'are', 'this', 'that', 'with', 'from', 'extract', 'format', 'available',
+    'given', 'contains', 'each', 'usually', 'document', 'default', 'amount', 'date', 'name', 'total',
+    'yyyy', 'etc', 'used', 'issued', 'any', 'its', 'per',
+))
+
+
+def normalize(text):
+    # Lowercase words separated by single spaces, padded so phrases match on word boundaries
+    return ' ' + ' '.join(re.findall(r'[a-z0-9]+', text.lower())) + ' '
+
+
+def _schema_terms(definition):
+    # Words from the document type, description and field names/descriptions of the blueprint
+    schema = definition.schema
+    parts = [definition.document_type, schema.get('description', ''), schema.get('documentClass', '')]
+    for field_name, field in definition.fields.items():
+        parts.append(re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', field_name))
+        parts.append(field.get('description', ''))
+    words = normalize(' '.join(parts)).split()
+    return {word for word in words if len(word) > 2 and word not in _STOPWORDS and not word.isdigit()}
+
+
+class Classification:
+    def __init__(self, decision, document_type, data_automation_arn, scores, reason, elapsed_ms):
+        self.decision = decision
+        self.document_type = document_type
+        self.data_automation_arn = data_automation_arn
+        self.scores = scores
+        self.reason = reason
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def rejected(self):
+        return self.decision == REJECTED
+
+    def to_dict(self):
+        return {
+            'decision': self.decision,
+            'document_type': self.document_type,
+            'scores': self.scores,
+            'reason': self.reason,
+            'elapsed_ms': self.elapsed_ms,
+        }
+
+
+class DocumentClassifier:
+    # Keyword scoring of a document's own text against every registered blueprint. Terms that
+    # appear in several blueprints are down-weighted (inverse document frequency), so generic
+    # words such as "pay" or "tax" do not decide between types.
+    def __init__(self, definitions, data_automation_arns):
+        self.data_automation_arns = dict(data_automation_arns)
+        self.profiles = {}
+        definitions = [definition for definition in definitions if definition.document_type in self.data_automation_arns]
+        term_sets = {definition.document_type: _schema_terms(definition) for definition in definitions}
+        document_frequency = {}
+        for terms in term_sets.values():
+            for term in terms:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        idf = {term: math.log((len(term_sets) + 1) / (count + 0.5)) for term, count in document_frequency.items()}
+        for definition in definitions:
+            terms = {term: idf[term] for term in term_sets[definition.document_type] if idf[term] > 0}
+            phrases = {normalize(keyword): KEYWORD_WEIGHT for keyword in definition.keywords}
+            self.profiles[definition.document_type] = (terms, phrases)
+
+    def score(self, text):
+        normalized = normalize(text)
+        words = set(normalized.split())
+        scores = {}
+        for document_type, (terms, phrases) in self.profiles.items():
+            score = sum(weight for term, weight in terms.items() if term in words)
+            score += sum(weight for phrase, weight in phrases.items() if phrase in normalized)
+            scores[document_type] = round(score, 2)
+        return scores, len(words)
+
+    def classify(self, data, content_type, selected_type):
+        started = time.perf_counter()
+        decision, document_type, scores, reason = self._classify(data, content_type, selected_type)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        return Classification(
+            decision,
+            document_type,
+            self.data_automation_arns.get(document_type) if document_type else None,
+            scores,
+            reason,
+            elapsed_ms
+        )
+
+    def _classify(self, data, content_type, selected_type):
+        if content_type == 'image/png':
+            problem = image_problem(data)
+            if problem:
+                return REJECTED, None, {}, problem
+            return SELECTED, selected_type, {}, "image: no text to classify"
+
+        try:
+            text = pdf_text(data)
+        except Exception as e:
+            return REJECTED, None, {}, f"unreadable PDF: {e}"
+        scores, word_count = self.score(text)
+        if word_count < CLASSIFIER_MIN_WORDS:
+            return SELECTED, selected_type, scores, "no text layer (scanned document)"
+
+        best_type = max(scores, key=scores.get) if scores else None
+        if best_type is None or scores[best_type] < CLASSIFIER_MIN_SCORE:
+            return REJECTED, None, scores, "matches no registered document type"
+        # Keep the user's choice when it scores as well as the best type
+        if selected_type in scores and scores[selected_type] >= scores[best_type]:
+            return SELECTED, selected_type, scores, "matches the selected type"
+        return ROUTED, best_type, scores, f"text matches {best_type}"
+
+
+def pdf_text(data, max_pages=CLASSIFIER_MAX_PAGES, max_chars=CLASSIFIER_MAX_CHARS):
+    import PyPDF2
+    reader = PyPDF2.PdfReader(BytesIO(data))
+    text = ''
+    for page in reader.pages[:max_pages]:
+        text += (page.extract_text() or '') + '\n'
+        if len(text) >= max_chars:
+            break
+    return text[:max_chars]
+
+
+def image_problem(data):
+    # Returns why the image is not a document page, or None. Pages are reasonably large and
+    # mostly light background; photos usually are not.
+    from PIL import Image
+    image = Image.open(BytesIO(data))
+    if min(image.size) < CLASSIFIER_MIN_IMAGE_SIDE:
+        return f"image too small for a document ({image.size[0]}x{image.size[1]})"
+    # Downscale first: everything after this works on at most 64x64 pixels
+    image.draft('RGB', (128, 128))
+    image.thumbnail((64, 64), Image.Resampling.NEAREST)
+    if image.mode in ('RGBA', 'LA', 'P', 'PA'):
+        # Transparent areas count as paper
+        image = image.convert('RGBA')
+        image = Image.alpha_composite(Image.new('RGBA', image.size, (255, 255, 255, 255)), image)
+    image = image.convert('L')
+    histogram = image.histogram()
+    light_fraction = sum(histogram[200:]) / max(1, sum(histogram))
+    if light_fraction < CLASSIFIER_MIN_LIGHT_FRACTION:
+        return f"image does not look like a document page ({light_fraction:.0%} light background)"
+    return None
+
+
+_default_classifier = None
+_default_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    # Built once per process from the blueprint registry and the published ARN map;
+    # None when classification is disabled or no blueprint definitions are available
+    global _default_classifier
+    if not CLASSIFIER_ENABLED:
+        return None
+    with _default_classifier_lock:
+        if _default_classifier is None:
+            _default_classifier = DocumentClassifier(get_blueprints().values(), get_data_automation_arns())
+        return _default_classifier if _default_classifier.profiles else None
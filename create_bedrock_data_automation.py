@@ -1,277 +1,238 @@
-import boto3
+import hashlib
 import json
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Initialize AWS clients
-bedrock_automation_client = boto3.client('bedrock-data-automation', region_name='us-west-2')
-bedrock_runtime_client = boto3.client('bedrock-data-automation-runtime', region_name='us-west-2')
-s3_client = boto3.client('s3')
+from aws_clients import AWS_REGION, get_client
+from blueprint_registry import load_blueprints, publish_data_automation_arns
 
-def check_blueprint_exists(blueprint_name):
-    try:
-        response = bedrock_automation_client.list_blueprints()
-        for blueprint in response['blueprints']:
-            if blueprint['blueprintName'] == blueprint_name:
-                return True
-        return False
-    except Exception as e:
-        print(f"Error checking blueprint: {e}")
-        return False
+# Provisioning state is cached locally so unchanged resources resolve without any Bedrock call
+PROVISIONING_CACHE_PATH = os.environ.get(
+    'PROVISIONING_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.provisioning_cache.json')
+)
+# Set to true to ignore the cache and look every resource up again (e.g. after deleting one by hand)
+PROVISIONING_REFRESH = os.environ.get('PROVISIONING_REFRESH', 'false').lower() == 'true'
+# Document types provisioned at once; each one is a handful of sequential API calls
+PROVISIONING_CONCURRENCY = int(os.environ.get('PROVISIONING_CONCURRENCY', '8'))
 
-def create_blueprint(blueprint_name):
-    response = bedrock_automation_client.create_blueprint(
-        blueprintName=blueprint_name,
-        type='DOCUMENT',
-        blueprintStage='LIVE',
-        schema=json.dumps({
-            '\$schema': 'http://json-schema.org/draft-07/schema#',
-            'description': 'This document issued by an employer to an employee contains wages received by an employee for a given period. It usually contains the breakdown of each of the income and tax deductions items.',
-            'documentClass': 'Payslip',
-            'type': 'object',
-            'properties': {
-                "PayPeriodStartDate": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "What is the Pay Period Start Date? YYYY-MM-DD Format"
-                },
-                "PayPeriodEndDate": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "What is the Pay Period End Date? YYYY-MM-DD Format"
+# Shared by every document type's project; the blueprint list is filled in per type
+PROJECT_CONFIG = {
+    'projectStage': 'LIVE',
+    'standardOutputConfiguration': {
+        'document': {
+            'outputFormat': {
+                'textFormat': {
+                    'types': ['PLAIN_TEXT']
+                },
+                'additionalFileFormat': {
+                    'state': 'ENABLED',
                 }
             }
-        })
-    )
-    return response['blueprint']['blueprintArn']
+        },
+    },
+    'overrideConfiguration': {
+        'document': {
+            'splitter': {
+                'state': 'ENABLED'
+            }
+        }
+    },
+}
 
-def create_blueprint1(blueprint_name):
-    response = bedrock_automation_client.create_blueprint(
-        blueprintName=blueprint_name,
-        type='DOCUMENT',
-        blueprintStage='LIVE',
-        schema=json.dumps({
-            '$schema': 'http://json-schema.org/draft-07/schema#',
-            'description': 'default',
-            'documentClass': 'default',
-            'type': 'object',
-            'properties': {
-                "PayPeriodStartDate": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "What is the Pay Period Start Date? YYYY-MM-DD Format"
-                },
-                "PayPeriodEndDate": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "What is the Pay Period End Date? YYYY-MM-DD Format"
-                },
-                "PayDate": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "What is the Pay Date? YYYY-MM-DD Format"
-                },
-                "EmployeeName": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "Extract the employee name"
-                },
-                "EmployeeAddress": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "Extract the employee address"
-                },
-                "CompanyAddress": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "Extract the company address"
-                },
-                "FederalFilingStatus": {
-                    "type": "string",
-                    "inferenceType": "extractive",
-                    "description": "What is the Federal Filing Status? If available"
-                },
-                "StateFilingStatus": {
-                    "type": "string",
-                    "inferenceType": "extractive",
-                    "description": "What is the State Filing Status? (If available)"
-                },
-                "CurrentGrossPay": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What is the Current Gross Pay?"
-                },
-                "YTDGrossPay": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What is the YTD Gross Pay?"
-                },
-                "CurrentNetPay": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What is the Current Net Pay?"
-                },
-                "YTDNetPay": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What is the YTD Net Pay?"
-                },
-                "RegularHourlyRate": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What is the Regular Hourly Rate? (if available)"
-                },
-                "HolidayHourlyRate": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What is the Holiday Hourly Rate? (if available)"
-                },
-                "YTDFederalTax": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What is the YTD Federal Taxes amount?"
-                },
-                "YTDStateTax": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What are the YTD State Taxes?"
-                },
-                "is_ytd_gross_pay_highest": {
-                    "type": "boolean",
-                    "inferenceType": "extractive",
-                    "description": "Is the YTD Gross Pay the largest amount in the entire paystub?"
-                },
-                "FederalTaxes": {
-                    "type": "boolean",
-                    "inferenceType": "extractive",
-                    "description": "Extract the federal taxes"
-                },
-                "StateTaxes": {
-                    "type": "boolean",
-                    "inferenceType": "extractive",
-                    "description": "Extract the state taxes"
-                },
-                "CityTaxes": {
-                    "type": "boolean",
-                    "inferenceType": "extractive",
-                    "description": "Extract the city taxes"
-                },
-                "EmployeeNumber": {
-                    "type": "string",
-                    "inferenceType": "extractive",
-                    "description": "What is the employee number?"
-                },
-                "PayrollNumber": {
-                    "type": "string",
-                    "inferenceType": "extractive",
-                    "description": "What is the payroll number?"
-                },
-                "YTDCityTax": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What are the YTD City Taxes?"
-                },
-                "CurrentTotalDeductions": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What are the current total deductions?"
-                },
-                "YTDTotalDeductions": {
-                    "type": "number",
-                    "inferenceType": "extractive",
-                    "description": "What are the YTD total deductions?"
-                },
-                "is_gross_pay_valid": {
-                    "type": "boolean",
-                    "inferenceType": "generative",
-                    "description": "Is the YTD gross pay the largest dollar amount value on the paystub?"
-                },
-                "are_field_names_sufficient": {
-                    "type": "boolean",
-                    "inferenceType": "generative",
-                    "description": "Are field names / key values sufficient for any validation?"
-                },
-                "currency": {
-                    "type": "string",
-                    "inferenceType": "generative",
-                    "description": "What currency is used in this document? CAD, USD, EUR, etc."
+
+def config_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ProvisioningCache:
+    # Manifest of {"<account>/<region>": {"blueprints"|"projects": {name: {"hash", "arn"}}}}.
+    # An entry only resolves while the hash of the definition that produced it still matches.
+    def __init__(self, path=PROVISIONING_CACHE_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope, kind, name, digest):
+        with self._lock:
+            entry = self.state.get(scope, {}).get(kind, {}).get(name)
+        if entry and entry['hash'] == digest:
+            return entry['arn']
+        return None
+
+    def put(self, scope, kind, name, digest, arn):
+        with self._lock:
+            self.state.setdefault(scope, {}).setdefault(kind, {})[name] = {'hash': digest, 'arn': arn}
+
+    def save(self):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with self._lock, os.fdopen(fd, 'w') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class NameIndex:
+    # Name -> ARN for every account-owned resource of one kind. All pages are listed, but
+    # only the first time a cache miss needs a lookup.
+    def __init__(self, operation_name, items_key, name_key, arn_key, region=None):
+        self.operation_name = operation_name
+        self.region = region
+        self.items_key = items_key
+        self.name_key = name_key
+        self.arn_key = arn_key
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if self._index is None:
+                paginator = get_client('bedrock-data-automation', self.region).get_paginator(self.operation_name)
+                self._index = {
+                    item[self.name_key]: item[self.arn_key]
+                    for page in paginator.paginate(resourceOwner='ACCOUNT')
+                    for item in page[self.items_key]
                 }
-            }
-        }),
-    )
-    return response['blueprint']['blueprintArn']
+        return self._index.get(name)
 
-def check_project_exists(project_name):
-    next_token = None
-    while True:
-        if next_token:
-            response = bedrock_automation_client.list_data_automation_projects(NextToken=next_token)
+
+def ensure_blueprint(cache, scope, name, schema, index, refresh=False):
+    digest = config_hash(schema)
+    arn = None if refresh else cache.get(scope, 'blueprints', name, digest)
+    if arn:
+        return arn, 'cached'
+
+    client = get_client('bedrock-data-automation', index.region)
+    arn = index.get(name)
+    if arn is None:
+        response = client.create_blueprint(
+            blueprintName=name,
+            type='DOCUMENT',
+            blueprintStage='LIVE',
+            schema=json.dumps(schema)
+        )
+        arn, action = response['blueprint']['blueprintArn'], 'created'
+    else:
+        current = client.get_blueprint(blueprintArn=arn, blueprintStage='LIVE')['blueprint']
+        if json.loads(current['schema']) != schema:
+            client.update_blueprint(blueprintArn=arn, schema=json.dumps(schema), blueprintStage='LIVE')
+            action = 'updated'
         else:
-            response = bedrock_automation_client.list_data_automation_projects()
-        
-        for project in response['projects']:
-            if project['projectName'] == project_name:
-                return project['projectArn']
-        
-        next_token = response.get('nextToken')
-        if not next_token:
-            break
-    return None
+            action = 'unchanged'
+    cache.put(scope, 'blueprints', name, digest, arn)
+    return arn, action
 
-def create_project(project_name, blueprint_arn):
-    response = bedrock_automation_client.create_data_automation_project(
-        projectName=project_name,
-        projectDescription=project_name,
-        projectStage='LIVE',
-        standardOutputConfiguration={
-            'document': {
-                'outputFormat': {
-                    'textFormat': {
-                        'types': ['PLAIN_TEXT']
-                    },
-                    'additionalFileFormat': {
-                        'state': 'ENABLED',
-                    }
-                }
-            },
-        },
-        customOutputConfiguration={
-            'blueprints': [
-            {
-                'blueprintArn': blueprint_arn
-            }
-            ],
-        },
-        overrideConfiguration={
-            'document': {
-                'splitter': {
-                    'state': 'ENABLED'
-                }
-            }
-        },
+
+def ensure_project(cache, scope, name, config, blueprint_arns, index, refresh=False):
+    request = dict(config, customOutputConfiguration={
+        'blueprints': [{'blueprintArn': blueprint_arn} for blueprint_arn in blueprint_arns]
+    })
+    digest = config_hash(request)
+    arn = None if refresh else cache.get(scope, 'projects', name, digest)
+    if arn:
+        return arn, 'cached'
+
+    client = get_client('bedrock-data-automation', index.region)
+    arn = index.get(name)
+    if arn is None:
+        arn = client.create_data_automation_project(projectName=name, projectDescription=name, **request)['projectArn']
+        action = 'created'
+    else:
+        # Cache miss on an existing project: the definition changed or was never recorded here
+        client.update_data_automation_project(projectArn=arn, projectDescription=name, **request)
+        action = 'updated'
+    cache.put(scope, 'projects', name, digest, arn)
+    return arn, action
+
+
+def provision_document_type(definition, cache, scope, blueprint_index, project_index, refresh=False):
+    blueprint_arn, blueprint_action = ensure_blueprint(
+        cache, scope, definition.blueprint_name, definition.schema, blueprint_index, refresh
+    )
+    project_arn, project_action = ensure_project(
+        cache, scope, definition.project_name, PROJECT_CONFIG, [blueprint_arn], project_index, refresh
     )
-    return response['projectArn']
+    return project_arn, [
+        {'type': 'blueprint', 'name': definition.blueprint_name, 'arn': blueprint_arn, 'action': blueprint_action},
+        {'type': 'project', 'name': definition.project_name, 'arn': project_arn, 'action': project_action},
+    ]
 
-blueprint_name = 'custom_payslip'
-project_name = 'custom_payslip_project'
 
-# Get AWS account and region details
-session = boto3.session.Session()
-region = session.region_name
+def provision(definitions=None, cache_path=PROVISIONING_CACHE_PATH, refresh=PROVISIONING_REFRESH,
+              concurrency=PROVISIONING_CONCURRENCY, publish=True, region=AWS_REGION):
+    # Provisions every registered document type in `region`, `concurrency` at a time, and returns
+    # the {document type: project ARN} map plus what happened to each resource. Only resources
+    # whose definition changed since the last run reach the Bedrock Data Automation API.
+    definitions = load_blueprints() if definitions is None else definitions
+    account_id = get_client('sts').get_caller_identity()["Account"]
+    scope = f"{account_id}/{region}"
+    cache = ProvisioningCache(cache_path)
+    blueprint_index = NameIndex('list_blueprints', 'blueprints', 'blueprintName', 'blueprintArn', region)
+    project_index = NameIndex('list_data_automation_projects', 'projects', 'projectName', 'projectArn', region)
 
-sts_client = boto3.client("sts")
-account_id = sts_client.get_caller_identity()["Account"]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(definitions)))) as executor:
+            results = list(executor.map(
+                lambda definition: provision_document_type(
+                    definition, cache, scope, blueprint_index, project_index, refresh
+                ),
+                definitions
+            ))
+    finally:
+        # Whatever finished is kept, so a retry after a partial failure skips it
+        cache.save()
 
-if not check_blueprint_exists(blueprint_name):
-    blueprint_arn = create_blueprint1(blueprint_name)
-else:
-    blueprint_arn = f"arn:aws:bedrock:us-west-2:{account_id}:blueprint/{blueprint_name}"
-    
-project_arn = check_project_exists(project_name)
-if not project_arn:
-    project_arn = create_project(project_name, blueprint_arn)
+    data_automation_arns = {
+        definition.document_type: project_arn for definition, (project_arn, _) in zip(definitions, results)
+    }
+    if publish:
+        publish_data_automation_arns(data_automation_arns)
+    return {
+        'account_id': account_id,
+        'region': region,
+        'data_automation_arns': data_automation_arns,
+        'resources': [resource for _, resources in results for resource in resources],
+    }
 
-# Print output as JSON
-output = {
-    "final_project_arn": project_arn
-}
-print(json.dumps(output))
\ No newline at end of file
+
+def provision_regions(regions, definitions=None, cache_path=PROVISIONING_CACHE_PATH, refresh=PROVISIONING_REFRESH,
+                      concurrency=PROVISIONING_CONCURRENCY, publish=True):
+    # Provisions the same blueprints and projects in every {"region", "bucket"} of `regions` (the
+    # BDA_REGIONS list), one region after another, and publishes the region/bucket/projects
+    # triples that regions.py routes over. AWS_REGION's map is also published as the default.
+    from regions import publish_region_settings
+    definitions = load_blueprints() if definitions is None else definitions
+    results = [
+        provision(definitions, cache_path, refresh, concurrency, publish=False, region=entry['region'])
+        for entry in regions
+    ]
+    settings = [
+        {'region': entry['region'], 'bucket': entry['bucket'], 'data_automation_arns': result['data_automation_arns']}
+        for entry, result in zip(regions, results)
+    ]
+    home = next((result for result in results if result['region'] == AWS_REGION), results[0])
+    if publish:
+        publish_region_settings(settings)
+        publish_data_automation_arns(home['data_automation_arns'])
+    return {
+        'account_id': home['account_id'],
+        'region': home['region'],
+        'data_automation_arns': home['data_automation_arns'],
+        'regions': settings,
+        'resources': [dict(resource, region=result['region']) for result in results for resource in result['resources']],
+    }
+
+
+if __name__ == '__main__':
+    # Print output as JSON; with BDA_REGIONS set, every listed region is provisioned
+    if os.environ.get('BDA_REGIONS'):
+        print(json.dumps(provision_regions(json.loads(os.environ['BDA_REGIONS'])), indent=2))
+    else:
+        print(json.dumps(provision(), indent=2))
@@ -0,0 +1,286 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from aws_clients import arn_region, get_client, s3_client
+from poller import get_invocation_poller
+from result_cache import hash_document
+from s3_layout import input_key, new_job_id, output_prefix
+
+bucket_name = os.environ.get('S3_BUCKET_NAME')
+DATA_AUTOMATION_STAGE = os.environ.get('DATA_AUTOMATION_STAGE', 'LIVE')
+EXTRACTION_TIMEOUT = float(os.environ.get('EXTRACTION_TIMEOUT', '900'))
+
+# Upload configuration
+MB = 1024 * 1024
+UPLOAD_MULTIPART_THRESHOLD = int(float(os.environ.get('UPLOAD_MULTIPART_THRESHOLD_MB', '16')) * MB)
+# S3 rejects parts smaller than 5 MB (except the last one)
+UPLOAD_PART_SIZE = max(5 * MB, int(float(os.environ.get('UPLOAD_PART_SIZE_MB', '8')) * MB))
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', '8'))
+
+# Custom outputs fetched in parallel when the splitter produces several segments
+RESULT_FETCH_CONCURRENCY = int(os.environ.get('RESULT_FETCH_CONCURRENCY', '8'))
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def split_s3_uri(s3_uri):
+    if not s3_uri.startswith('s3://'):
+        raise ValueError(f"Not an S3 URI: {s3_uri}")
+    bucket, _, key = s3_uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+def _body_size(body):
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return len(body)
+    position = body.tell()
+    size = body.seek(0, os.SEEK_END)
+    body.seek(position)
+    return size
+
+
+def _check_response(response, operation):
+    # A 200 with an ETag from PUT/CompleteMultipartUpload already proves the object exists
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    if status != 200 or not response.get('ETag'):
+        raise ExtractionError(f"{operation} did not confirm the upload (HTTP {status})")
+
+
+class _MemoryviewReader(io.RawIOBase):
+    # Read-only file object over a slice of an in-memory buffer, so a part is
+    # streamed to S3 without first being copied into its own bytes object
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self._view) - self._position)
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, min(offset, len(self._view)))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+def _read_part(body, offset, size, lock):
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return _MemoryviewReader(memoryview(body)[offset:offset + size])
+    if hasattr(body, 'getbuffer'):
+        return _MemoryviewReader(body.getbuffer()[offset:offset + size])
+    # Parts of real files are read just before they are sent, so at most `concurrency` parts are in memory
+    with lock:
+        body.seek(offset)
+        return body.read(size)
+
+
+def _multipart_upload(body, bucket, key, content_type, size, part_size, concurrency):
+    upload_id = s3_client(bucket).create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        ContentType=content_type
+    )['UploadId']
+    lock = threading.Lock()
+
+    def upload_part(part_number, offset):
+        data = _read_part(body, offset, part_size, lock)
+        response = s3_client(bucket).upload_part(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            parts = list(executor.map(
+                upload_part,
+                range(1, (size + part_size - 1) // part_size + 1),
+                range(0, size, part_size)
+            ))
+        response = s3_client(bucket).complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        _check_response(response, 'CompleteMultipartUpload')
+    except Exception:
+        s3_client(bucket).abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+
+def _object_size(bucket, key):
+    try:
+        return s3_client(bucket).head_object(Bucket=bucket, Key=key)['ContentLength']
+    except Exception as e:
+        # botocore is not imported here just for ClientError; a missing key is a 404 either way
+        if (getattr(e, 'response', None) or {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+def upload_document(body, filename, content_type, bucket=None,
+                    part_size=UPLOAD_PART_SIZE, concurrency=UPLOAD_CONCURRENCY, document_hash=None):
+    # body can be bytes/memoryview or a seekable file object; file objects are streamed, not copied.
+    # The key is derived from the content (see s3_layout), so the filename only supplies the extension.
+    bucket = bucket or bucket_name
+    s3_key = input_key(document_hash or hash_document(body), filename)
+    if not isinstance(body, (bytes, bytearray, memoryview)):
+        body.seek(0)
+    size = _body_size(body)
+
+    if size >= UPLOAD_MULTIPART_THRESHOLD and _object_size(bucket, s3_key) == size:
+        # Identical content was already uploaded; for large files a HEAD is far cheaper than
+        # the upload. Small files are simply PUT again, which rewrites the same bytes.
+        pass
+    elif size < UPLOAD_MULTIPART_THRESHOLD:
+        response = s3_client(bucket).put_object(
+            Bucket=bucket,
+            Key=s3_key,
+            Body=_MemoryviewReader(body) if isinstance(body, memoryview) else body,
+            ContentType=content_type
+        )
+        _check_response(response, 'PutObject')
+    else:
+        _multipart_upload(body, bucket, s3_key, content_type, size, part_size, concurrency)
+    return f"s3://{bucket}/{s3_key}"
+
+
+def copy_document(input_s3_uri, bucket):
+    # Server-side copy of a document into another region's bucket; skipped when that bucket already
+    # has it. The copy is keyed by the source's location and ETag, so a source object that was
+    # rewritten since is copied again instead of BDA reading the stale copy.
+    source_bucket, key = split_s3_uri(input_s3_uri)
+    if source_bucket == bucket:
+        return input_s3_uri
+    etag = s3_client(source_bucket).head_object(Bucket=source_bucket, Key=key)['ETag'].strip('"')
+    version = hashlib.sha256(f"{source_bucket}/{key}:{etag}".encode('utf-8')).hexdigest()
+    copy_key = input_key(version, key)
+    if _object_size(bucket, copy_key) is None:
+        s3_client(bucket).copy_object(Bucket=bucket, Key=copy_key, CopySource={'Bucket': source_bucket, 'Key': key})
+    return f"s3://{bucket}/{copy_key}"
+
+
+def start_invocation(input_s3_uri, output_s3_uri, data_automation_arn, max_attempts=None):
+    # The project's region decides where it runs; its input and output buckets must be in that region too.
+    # Callers that retry throttles themselves pass max_attempts, so botocore does not retry them first.
+    runtime = get_client('bedrock-data-automation-runtime', arn_region(data_automation_arn), max_attempts)
+    response = runtime.invoke_data_automation_async(
+        inputConfiguration={'s3Uri': input_s3_uri},
+        outputConfiguration={'s3Uri': output_s3_uri},
+        dataAutomationConfiguration={
+            'dataAutomationArn': data_automation_arn,
+            'stage': DATA_AUTOMATION_STAGE
+        }
+    )
+    return response['invocationArn']
+
+
+def invoke_document(input_s3_uri, data_automation_arn, job_id=None, max_attempts=None):
+    # Outputs go to a fresh per-job prefix next to (not under) the content-addressed input,
+    # since several jobs may share one input. Returns (invocation ARN, output S3 URI); the job
+    # store keeps both on the job record.
+    job_id = job_id or new_job_id()
+    bucket, _ = split_s3_uri(input_s3_uri)
+    output_s3_uri = f"s3://{bucket}/{output_prefix(job_id)}"
+    invocation_arn = start_invocation(input_s3_uri, output_s3_uri, data_automation_arn, max_attempts)
+    return invocation_arn, output_s3_uri
+
+
+def check_invocation_status(invocation_arn):
+    return get_client('bedrock-data-automation-runtime', arn_region(invocation_arn)).get_data_automation_status(
+        invocationArn=invocation_arn
+    )
+
+
+def wait_for_invocation(invocation_arn, timeout=EXTRACTION_TIMEOUT):
+    # Raises InvocationFailed when the job ends in ServiceError/ClientError
+    return get_invocation_poller(check_invocation_status).submit(invocation_arn).result(timeout=timeout)
+
+
+def read_json(s3_uri):
+    bucket, key = split_s3_uri(s3_uri)
+    result = s3_client(bucket).get_object(Bucket=bucket, Key=key)
+    return json.loads(result['Body'].read())
+
+
+def list_segments(status_response):
+    # With the splitter enabled one input can produce many assets and segments
+    job_metadata_json = read_json(status_response['outputConfiguration']['s3Uri'])
+    segments = []
+    for asset in job_metadata_json.get("output_metadata", []):
+        for segment in asset.get('segment_metadata', []):
+            if segment.get('custom_output_path'):
+                segments.append({
+                    'asset_id': asset.get('asset_id', 0),
+                    'segment_index': segment.get('segment_index', len(segments)),
+                    'custom_output_path': segment['custom_output_path'],
+                    'standard_output_path': segment.get('standard_output_path'),
+                })
+    if not segments:
+        raise ExtractionError("Custom output path not found in job metadata.")
+    return segments
+
+
+def fetch_segment(segment):
+    content = read_json(segment['custom_output_path'])
+    return {
+        'asset_id': segment['asset_id'],
+        'segment_index': segment['segment_index'],
+        'document_class': content.get('document_class', {}).get('type'),
+        'page_indices': content.get('split_document', {}).get('page_indices', []),
+        'inference_result': content.get('inference_result', {}),
+        # Read later by the search indexer; not every project emits standard output
+        'standard_output_path': segment.get('standard_output_path'),
+    }
+
+
+def merge_segments(fetched_segments):
+    segments = sorted(fetched_segments, key=lambda segment: (segment['asset_id'], segment['segment_index']))
+    for number, segment in enumerate(segments, start=1):
+        segment['segment'] = number
+    return {'segments': segments}
+
+
+def fetch_results(status_response, concurrency=RESULT_FETCH_CONCURRENCY):
+    segments = list_segments(status_response)
+    if len(segments) == 1:
+        return merge_segments([fetch_segment(segments[0])])
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(segments))) as executor:
+        return merge_segments(list(executor.map(fetch_segment, segments)))
+
+
+def collect_result(invocation_arn, timeout=EXTRACTION_TIMEOUT):
+    return fetch_results(wait_for_invocation(invocation_arn, timeout))
+
+
+def extract_s3_document(input_s3_uri, data_automation_arn, timeout=EXTRACTION_TIMEOUT):
+    invocation_arn, _ = invoke_document(input_s3_uri, data_automation_arn)
+    return collect_result(invocation_arn, timeout)
+
+
+def extract_document(body, filename, content_type, data_automation_arn, timeout=EXTRACTION_TIMEOUT):
+    input_s3_uri = upload_document(body, filename, content_type)
+    return extract_s3_document(input_s3_uri, data_automation_arn, timeout)
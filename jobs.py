@@ -0,0 +1,516 @@
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from admission import BATCH, INTERACTIVE, LANES
+from aws_clients import get_client
+from sqlite_local import ThreadLocalSQLite
+
+# Job store configuration
+JOB_STORE_BACKEND = os.environ.get('JOB_STORE_BACKEND', 'sqlite')
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join(os.path.expanduser('~'), '.cache', 'bda_jobs.db'))
+JOB_SPOOL_DIR = os.environ.get('JOB_SPOOL_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'bda_spool'))
+# A claimed job whose worker has not heartbeated for this long is handed to another worker
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '120'))
+# Deliveries of a job's message before the job is marked failed; the stack's dead-letter queue
+# takes the message after the same number (its maxReceiveCount)
+JOB_MAX_RECEIVES = int(os.environ.get('JOB_MAX_RECEIVES', '5'))
+
+# Shared job store (JOB_STORE_BACKEND=sqs), used when the UI and the workers run in separate containers
+JOB_QUEUE_URL = os.environ.get('JOB_QUEUE_URL')
+# Batch lane jobs get a queue of their own, so a backfill never sits in front of an upload; without
+# one they share JOB_QUEUE_URL and only the workers' admission order separates the lanes
+JOB_BATCH_QUEUE_URL = os.environ.get('JOB_BATCH_QUEUE_URL')
+JOB_TABLE_NAME = os.environ.get('JOB_TABLE_NAME')
+# Documents are handed to workers through S3 instead of the local spool directory
+JOB_SPOOL_BUCKET = os.environ.get('JOB_SPOOL_BUCKET', os.environ.get('S3_BUCKET_NAME'))
+JOB_SPOOL_PREFIX = os.environ.get('JOB_SPOOL_PREFIX', 'spool')
+# Long polling for queued jobs; an idle worker makes one receive call per this many seconds
+JOB_QUEUE_WAIT_SECONDS = int(os.environ.get('JOB_QUEUE_WAIT_SECONDS', '1'))
+# DynamoDB items are limited to 400 KB, so larger results (e.g. split bundles) are stored in S3
+JOB_RESULT_INLINE_BYTES = int(os.environ.get('JOB_RESULT_INLINE_KB', '300')) * 1024
+# Job items expire (DynamoDB TTL) after this long; the stack expires the S3 spool prefix to match
+JOB_RETENTION_DAYS = float(os.environ.get('JOB_RETENTION_DAYS', '7'))
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+ACTIVE_STATES = (QUEUED, RUNNING)
+TERMINAL_STATES = (SUCCEEDED, FAILED)
+
+
+class Job:
+    def __init__(self, row):
+        self.id = row['id']
+        self.status = row['status']
+        self.document_path = row['document_path']
+        self.filename = row['filename']
+        self.content_type = row['content_type']
+        self.data_automation_arn = row['data_automation_arn']
+        self.cache_key = row['cache_key']
+        self.input_s3_uri = row['input_s3_uri']
+        # Prefix the job's BDA outputs were written under (see s3_layout.output_prefix)
+        self.output_s3_uri = row['output_s3_uri']
+        self.invocation_arn = row['invocation_arn']
+        self.result = json.loads(row['result']) if row['result'] else None
+        # Document attributes (document_type, size_bytes, page_count) and per-stage timings in seconds
+        self.attributes = json.loads(row['attributes']) if row['attributes'] else {}
+        self.timings = json.loads(row['timings']) if row['timings'] else {}
+        self.error = row['error']
+        self.worker_id = row['worker_id']
+        # Admission lane (admission.LANES) the worker invokes the job in
+        self.lane = row['lane'] or INTERACTIVE
+        self.created_at = row['created_at']
+        self.updated_at = row['updated_at']
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATES
+
+
+class JobStore(ABC):
+    # Backends persist job rows; everything else (UI, workers) only talks to this interface. A backend
+    # missing a method fails when it is constructed, not in the middle of a job.
+
+    @abstractmethod
+    def enqueue(self, document_path, filename, content_type, data_automation_arn, cache_key=None, attributes=None,
+                result=None, lane=INTERACTIVE, input_s3_uri=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, job_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_active(self, cache_key, lease_seconds=JOB_LEASE_SECONDS):
+        # A running job whose worker has not heartbeated within the lease is not active
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, worker_id, lanes=LANES):
+        # The next queued job in one of `lanes`, interactive ones first
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self, job_ids):
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_expired(self, lease_seconds=JOB_LEASE_SECONDS):
+        raise NotImplementedError
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    document_path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    data_automation_arn TEXT NOT NULL,
+    cache_key TEXT,
+    input_s3_uri TEXT,
+    output_s3_uri TEXT,
+    invocation_arn TEXT,
+    result TEXT,
+    error TEXT,
+    attributes TEXT,
+    timings TEXT,
+    worker_id TEXT,
+    lane TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_cache_key ON jobs (cache_key, status);
+"""
+
+# Columns added after the first release; older databases are migrated on open
+_ADDED_COLUMNS = (('attributes', 'TEXT'), ('timings', 'TEXT'), ('lane', 'TEXT'), ('output_s3_uri', 'TEXT'))
+_UPDATABLE_FIELDS = (
+    'status', 'input_s3_uri', 'output_s3_uri', 'invocation_arn', 'result', 'error', 'worker_id', 'timings'
+)
+_JSON_FIELDS = ('result', 'timings')
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path=JOB_STORE_PATH):
+        self.path = path
+        self._db = ThreadLocalSQLite(path)
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+            existing = {row['name'] for row in connection.execute("PRAGMA table_info(jobs)")}
+            for name, column_type in _ADDED_COLUMNS:
+                if name not in existing:
+                    connection.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+    def _connection(self):
+        return _Transaction(self._db.connection())
+
+    def enqueue(self, document_path, filename, content_type, data_automation_arn, cache_key=None, attributes=None,
+                result=None, lane=INTERACTIVE, input_s3_uri=None):
+        # A job enqueued with a (cached) result is recorded as already succeeded and never claimed.
+        # A job enqueued with an S3 URI (a batch document already in S3) is invoked in place.
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, status, document_path, filename, content_type, data_automation_arn, "
+                "cache_key, input_s3_uri, result, attributes, lane, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED if result is None else SUCCEEDED, document_path, filename, content_type,
+                 data_automation_arn, cache_key, input_s3_uri, json.dumps(result) if result is not None else None,
+                 json.dumps(attributes or {}), lane, now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connection() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(row) if row else None
+
+    def find_active(self, cache_key, lease_seconds=JOB_LEASE_SECONDS):
+        with self._connection() as connection:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE cache_key = ? AND status IN (?, ?) "
+                "AND NOT (status = ? AND updated_at < ?) ORDER BY created_at LIMIT 1",
+                (cache_key,) + ACTIVE_STATES + (RUNNING, time.time() - lease_seconds)
+            ).fetchone()
+        return Job(row) if row else None
+
+    def claim(self, worker_id, lanes=LANES):
+        # BEGIN IMMEDIATE takes the write lock up front so two workers never claim the same job.
+        # Rows from before lanes existed are interactive.
+        placeholders = ', '.join('?' for _ in lanes)
+        with self._connection() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                f"SELECT * FROM jobs WHERE status = ? AND worker_id IS NULL AND COALESCE(lane, ?) IN ({placeholders}) "
+                "ORDER BY COALESCE(lane, ?) != ?, created_at LIMIT 1",
+                (QUEUED, INTERACTIVE) + tuple(lanes) + (INTERACTIVE, INTERACTIVE)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET worker_id = ?, updated_at = ? WHERE id = ?",
+                (worker_id, time.time(), row['id'])
+            )
+        return self.get(row['id'])
+
+    def update(self, job_id, **fields):
+        unknown = set(fields) - set(_UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot update job fields: {', '.join(sorted(unknown))}")
+        for name in _JSON_FIELDS:
+            if fields.get(name) is not None:
+                fields[name] = json.dumps(fields[name])
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connection() as connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", tuple(fields.values()) + (job_id,))
+
+    def heartbeat(self, job_ids):
+        if not job_ids:
+            return
+        placeholders = ', '.join('?' for _ in job_ids)
+        with self._connection() as connection:
+            connection.execute(
+                f"UPDATE jobs SET updated_at = ? WHERE id IN ({placeholders})",
+                (time.time(),) + tuple(job_ids)
+            )
+
+    def release_expired(self, lease_seconds=JOB_LEASE_SECONDS):
+        # Jobs of crashed workers go back to the queue; an invocation ARN, if any, is kept so
+        # the next worker resumes waiting instead of invoking again
+        with self._connection() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL WHERE status IN (?, ?) "
+                "AND worker_id IS NOT NULL AND updated_at < ?",
+                (QUEUED,) + ACTIVE_STATES + (time.time() - lease_seconds,)
+            )
+            return cursor.rowcount
+
+
+_COLUMNS = (
+    'id', 'status', 'document_path', 'filename', 'content_type', 'data_automation_arn', 'cache_key',
+    'input_s3_uri', 'output_s3_uri', 'invocation_arn', 'result', 'error', 'attributes', 'timings', 'worker_id', 'lane',
+    'created_at', 'updated_at',
+)
+_NUMBER_COLUMNS = ('created_at', 'updated_at', 'expires_at')
+
+
+def _split_s3_uri(s3_uri):
+    bucket, _, key = s3_uri[len('s3://'):].partition('/')
+    return bucket, key
+
+
+class SQSJobStore(JobStore):
+    # Jobs shared by every container: one DynamoDB item per job, and one SQS message per queued job.
+    # A worker's lease is the visibility timeout of the job's message, which heartbeats extend, so a
+    # job whose worker stopped is delivered to another one; a job that keeps failing that way is
+    # marked failed on its last delivery, before the message goes to the queue's dead-letter queue.
+    def __init__(self, queue_url=JOB_QUEUE_URL, table_name=JOB_TABLE_NAME, spool_bucket=JOB_SPOOL_BUCKET,
+                 batch_queue_url=JOB_BATCH_QUEUE_URL, max_receives=JOB_MAX_RECEIVES):
+        if not queue_url or not table_name or not spool_bucket:
+            raise ValueError("The sqs job store needs JOB_QUEUE_URL, JOB_TABLE_NAME and JOB_SPOOL_BUCKET")
+        self.queue_urls = {lane: queue_url for lane in LANES}
+        if batch_queue_url:
+            self.queue_urls[BATCH] = batch_queue_url
+        self.table_name = table_name
+        self.spool_bucket = spool_bucket
+        self.max_receives = max_receives
+        # (queue URL, receipt handle) of the messages this process holds, by job id
+        self._receipts = {}
+        self._lock = threading.Lock()
+
+    def _to_item(self, fields):
+        # Numbers stay numbers; everything else is stored as a string, and empty values are left out
+        item = {}
+        for name, value in fields.items():
+            if value is None or value == '':
+                continue
+            item[name] = {'N': repr(value)} if name in _NUMBER_COLUMNS else {'S': str(value)}
+        return item
+
+    def _to_job(self, item):
+        row = {name: None for name in _COLUMNS}
+        for name, value in item.items():
+            row[name] = float(value['N']) if 'N' in value else value['S']
+        row['document_path'] = row['document_path'] or ''
+        if row.get('result') and row['result'].startswith('s3://'):
+            bucket, key = _split_s3_uri(row['result'])
+            row['result'] = get_client('s3').get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+        return Job(row)
+
+    def _result_value(self, job_id, result):
+        encoded = json.dumps(result)
+        if len(encoded) <= JOB_RESULT_INLINE_BYTES:
+            return encoded
+        key = f"{JOB_SPOOL_PREFIX}/results/{job_id}.json"
+        get_client('s3').put_object(
+            Bucket=self.spool_bucket, Key=key, Body=encoded.encode('utf-8'), ContentType='application/json'
+        )
+        return f"s3://{self.spool_bucket}/{key}"
+
+    def enqueue(self, document_path, filename, content_type, data_automation_arn, cache_key=None, attributes=None,
+                result=None, lane=INTERACTIVE, input_s3_uri=None):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        if result is None and document_path and not document_path.startswith('s3://'):
+            # The worker that claims the job may run in another container
+            key = f"{JOB_SPOOL_PREFIX}/{job_id}{os.path.splitext(document_path)[1]}"
+            get_client('s3').upload_file(document_path, self.spool_bucket, key)
+            os.remove(document_path)
+            document_path = f"s3://{self.spool_bucket}/{key}"
+        get_client('dynamodb').put_item(TableName=self.table_name, Item=self._to_item({
+            'id': job_id,
+            'status': QUEUED if result is None else SUCCEEDED,
+            'document_path': document_path,
+            'filename': filename,
+            'content_type': content_type,
+            'data_automation_arn': data_automation_arn,
+            'cache_key': cache_key,
+            'input_s3_uri': input_s3_uri,
+            'result': self._result_value(job_id, result) if result is not None else None,
+            'attributes': json.dumps(attributes or {}),
+            'lane': lane,
+            'created_at': now,
+            'updated_at': now,
+            'expires_at': int(now + JOB_RETENTION_DAYS * 86400),
+        }))
+        if result is None:
+            get_client('sqs').send_message(QueueUrl=self.queue_urls[lane], MessageBody=job_id)
+        return job_id
+
+    def get(self, job_id):
+        item = get_client('dynamodb').get_item(
+            TableName=self.table_name, Key={'id': {'S': job_id}}, ConsistentRead=True
+        ).get('Item')
+        return self._to_job(item) if item else None
+
+    def find_active(self, cache_key, lease_seconds=JOB_LEASE_SECONDS):
+        # The cache_key index is eventually consistent; a duplicate job in that window only costs an invocation.
+        # Heartbeats keep updated_at fresh, so a stale running job is one whose worker died.
+        items = get_client('dynamodb').query(
+            TableName=self.table_name,
+            IndexName='cache_key',
+            KeyConditionExpression='cache_key = :cache_key',
+            FilterExpression='#status = :queued OR (#status = :running AND updated_at >= :fresh)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':cache_key': {'S': cache_key}, ':queued': {'S': QUEUED}, ':running': {'S': RUNNING},
+                ':fresh': {'N': repr(time.time() - lease_seconds)},
+            },
+        ).get('Items', [])
+        jobs = sorted((self._to_job(item) for item in items), key=lambda job: job.created_at)
+        return jobs[0] if jobs else None
+
+    def _receive(self, lanes):
+        # (queue URL, message) from the first of `lanes` with a job waiting. Only the last queue is
+        # long-polled, so a waiting interactive job is never held up by a wait on the batch queue.
+        queue_urls = list(dict.fromkeys(self.queue_urls[lane] for lane in LANES if lane in lanes))
+        for index, queue_url in enumerate(queue_urls):
+            messages = get_client('sqs').receive_message(
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=1,
+                WaitTimeSeconds=JOB_QUEUE_WAIT_SECONDS if index == len(queue_urls) - 1 else 0,
+                VisibilityTimeout=int(JOB_LEASE_SECONDS),
+                AttributeNames=['ApproximateReceiveCount'],
+            ).get('Messages', [])
+            if messages:
+                return queue_url, messages[0]
+        return None, None
+
+    def claim(self, worker_id, lanes=LANES):
+        queue_url, message = self._receive(lanes)
+        if message is None:
+            return None
+        job_id, receipt = message['Body'], message['ReceiptHandle']
+        job = self.get(job_id)
+        if job is None or job.done:
+            # Delivered again after the job finished (SQS is at-least-once)
+            get_client('sqs').delete_message(QueueUrl=queue_url, ReceiptHandle=receipt)
+            return None
+        with self._lock:
+            self._receipts[job_id] = (queue_url, receipt)
+        if int(message.get('Attributes', {}).get('ApproximateReceiveCount', '1')) >= self.max_receives:
+            # Its workers keep dying on it; failing it here deletes the message, and the job no longer
+            # looks active to a caller that would otherwise wait on it forever
+            self.update(job_id, status=FAILED, error=f"Abandoned by workers {self.max_receives} times")
+            return None
+        # A job redelivered after its worker died keeps its invocation ARN, so it is resumed
+        self.update(job_id, worker_id=worker_id)
+        return self.get(job_id)
+
+    def update(self, job_id, **fields):
+        unknown = set(fields) - set(_UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Cannot update job fields: {', '.join(sorted(unknown))}")
+        for name in _JSON_FIELDS:
+            if fields.get(name) is not None:
+                fields[name] = self._result_value(job_id, fields[name]) if name == 'result' else json.dumps(fields[name])
+        fields['updated_at'] = time.time()
+        values = self._to_item(fields)
+        names = {f"#{name}": name for name in values}
+        get_client('dynamodb').update_item(
+            TableName=self.table_name,
+            Key={'id': {'S': job_id}},
+            UpdateExpression='SET ' + ', '.join(f"#{name} = :{name}" for name in values),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={f":{name}": value for name, value in values.items()},
+        )
+        if fields.get('status') in TERMINAL_STATES:
+            with self._lock:
+                held = self._receipts.pop(job_id, None)
+            if held:
+                queue_url, receipt = held
+                get_client('sqs').delete_message(QueueUrl=queue_url, ReceiptHandle=receipt)
+
+    def heartbeat(self, job_ids):
+        by_queue = {}
+        with self._lock:
+            for job_id in job_ids:
+                if job_id in self._receipts:
+                    queue_url, receipt = self._receipts[job_id]
+                    by_queue.setdefault(queue_url, []).append((job_id, receipt))
+        # updated_at is what find_active judges a running job by
+        for receipts in by_queue.values():
+            for job_id, _ in receipts:
+                self.update(job_id)
+        for queue_url, receipts in by_queue.items():
+            for start in range(0, len(receipts), 10):
+                get_client('sqs').change_message_visibility_batch(
+                    QueueUrl=queue_url,
+                    Entries=[
+                        {'Id': job_id, 'ReceiptHandle': receipt, 'VisibilityTimeout': int(JOB_LEASE_SECONDS)}
+                        for job_id, receipt in receipts[start:start + 10]
+                    ]
+                )
+
+    def release_expired(self, lease_seconds=JOB_LEASE_SECONDS):
+        # SQS makes the message of an expired lease visible again by itself
+        return 0
+
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.connection.in_transaction:
+            if exc_type is None:
+                self.connection.execute('COMMIT')
+            else:
+                self.connection.execute('ROLLBACK')
+        return False
+
+
+JOB_STORE_BACKENDS = {
+    'sqlite': SQLiteJobStore,
+    'sqs': SQSJobStore,
+}
+
+
+def spool_document(file, filename, cache_key=None):
+    # Workers may run in other processes, so the document is handed over on disk
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    extension = os.path.splitext(filename)[1]
+    path = os.path.join(JOB_SPOOL_DIR, f"{cache_key or uuid.uuid4().hex}{extension}")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        file.seek(0)
+        with open(tmp_path, 'wb') as f:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    return path
+
+
+def fetch_spooled(document_path):
+    # Local path of a spooled document; one spooled to S3 by another container is downloaded first
+    if not document_path.startswith('s3://'):
+        return document_path
+    bucket, key = _split_s3_uri(document_path)
+    path = os.path.join(JOB_SPOOL_DIR, os.path.basename(key))
+    if not os.path.exists(path):
+        os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        get_client('s3').download_file(bucket, key, tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def remove_spooled(document_path):
+    # Once the job is done: the spooled document, and for S3 its local download
+    if document_path.startswith('s3://'):
+        bucket, key = _split_s3_uri(document_path)
+        get_client('s3').delete_object(Bucket=bucket, Key=key)
+        document_path = os.path.join(JOB_SPOOL_DIR, os.path.basename(key))
+    if document_path and os.path.exists(document_path):
+        os.remove(document_path)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_job_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            if JOB_STORE_BACKEND not in JOB_STORE_BACKENDS:
+                raise ValueError(f"Unknown job store backend: {JOB_STORE_BACKEND}")
+            _default_store = JOB_STORE_BACKENDS[JOB_STORE_BACKEND]()
+        return _default_store
@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics configuration
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))
+# EMF lines go to stdout, which only containers ship to CloudWatch; the image turns them on
+METRICS_EMF = os.environ.get('METRICS_EMF', 'false').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DocumentExtraction')
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def size_class(size_bytes):
+    # Raw sizes and page counts would explode label cardinality, so they are bucketed
+    if size_bytes is None:
+        return 'unknown'
+    megabytes = size_bytes / (1024 * 1024)
+    if megabytes < 1:
+        return '<1MB'
+    if megabytes < 10:
+        return '1-10MB'
+    if megabytes < 50:
+        return '10-50MB'
+    return '>=50MB'
+
+
+def page_class(page_count):
+    if page_count is None:
+        return 'unknown'
+    if page_count <= 1:
+        return '1'
+    if page_count <= 10:
+        return '2-10'
+    if page_count <= 50:
+        return '11-50'
+    return '>50'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = list(zip(self.label_names, key))
+                for bound, count in zip(self.buckets, series['counts']):
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series['count']}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, key)))} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def histogram(self, name, documentation, label_names, buckets=DEFAULT_BUCKETS):
+        return self._register(name, lambda: Histogram(name, documentation, label_names, buckets))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self._register(name, lambda: Gauge(name, documentation, label_names))
+
+    def expose(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'extraction_stage_seconds',
+    'Time spent in each extraction pipeline stage',
+    ('stage', 'document_type', 'size_class', 'page_class', 'outcome')
+)
+
+
+def emit_emf(stage, duration, tags, outcome):
+    # CloudWatch Embedded Metric Format: the awslogs driver ships stdout, and CloudWatch
+    # extracts the metric from the structured log line
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Stage', 'DocumentType'], ['Stage']],
+                'Metrics': [{'Name': 'StageDuration', 'Unit': 'Milliseconds'}],
+            }],
+        },
+        'Stage': stage,
+        'DocumentType': tags.get('document_type') or 'unknown',
+        'Outcome': outcome,
+        'StageDuration': round(duration * 1000, 3),
+        'FileSizeBytes': tags.get('size_bytes'),
+        'PageCount': tags.get('page_count'),
+    }
+    print(json.dumps(record), flush=True)
+
+
+def emit_emf_value(name, value, unit='Count', **dimensions):
+    # One sampled value (e.g. a gauge that autoscaling tracks) in Embedded Metric Format
+    if not METRICS_EMF:
+        return
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [sorted(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit}],
+            }],
+        },
+        name: value,
+        **dimensions,
+    }
+    print(json.dumps(record), flush=True)
+
+
+def record_stage(stage, duration, tags=None, outcome='success'):
+    tags = tags or {}
+    STAGE_SECONDS.observe(
+        duration,
+        stage=stage,
+        document_type=tags.get('document_type') or 'unknown',
+        size_class=size_class(tags.get('size_bytes')),
+        page_class=page_class(tags.get('page_count')),
+        outcome=outcome
+    )
+    if METRICS_EMF:
+        emit_emf(stage, duration, tags, outcome)
+
+
+class Trace:
+    # Collects per-stage timings for one document and tags every span with its attributes
+    def __init__(self, document_type=None, size_bytes=None, page_count=None, timings=None):
+        self.tags = {'document_type': document_type, 'size_bytes': size_bytes, 'page_count': page_count}
+        self.timings = dict(timings or {})
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        outcome = 'success'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.timings[stage] = round(duration, 4)
+            record_stage(stage, duration, self.tags, outcome)
+
+    def record(self, stage, duration):
+        # For stages measured from timestamps rather than wrapped in a span (e.g. queue wait)
+        self.timings[stage] = round(duration, 4)
+        record_stage(stage, duration, self.tags)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = registry.expose().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    # Serves Prometheus text exposition on /metrics; disabled when the port is 0
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            _server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+        except OSError as e:
+            print(f"Metrics server not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+        return _server
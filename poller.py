@@ -0,0 +1,130 @@
+import heapq
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Poller configuration
+POLL_INITIAL_INTERVAL = float(os.environ.get('POLL_INITIAL_INTERVAL', '1.0'))
+POLL_MAX_INTERVAL = float(os.environ.get('POLL_MAX_INTERVAL', '10.0'))
+POLL_BACKOFF = float(os.environ.get('POLL_BACKOFF', '1.5'))
+POLL_JITTER = float(os.environ.get('POLL_JITTER', '0.2'))
+POLL_WORKERS = int(os.environ.get('POLL_WORKERS', '4'))
+POLL_MAX_ERRORS = int(os.environ.get('POLL_MAX_ERRORS', '5'))
+
+SUCCESS_STATUS = 'Success'
+FAILED_STATUSES = ('ServiceError', 'ClientError')
+TERMINAL_STATUSES = (SUCCESS_STATUS,) + FAILED_STATUSES
+
+
+class InvocationFailed(Exception):
+    def __init__(self, invocation_arn, response):
+        self.invocation_arn = invocation_arn
+        self.response = response
+        status = response.get('status')
+        message = response.get('errorMessage') or response.get('errorType') or 'no error details'
+        super().__init__(f"Invocation {invocation_arn} ended with status {status}: {message}")
+
+
+class _Watch:
+    def __init__(self, invocation_arn):
+        self.invocation_arn = invocation_arn
+        self.future = Future()
+        self.attempts = 0
+        self.errors = 0
+
+
+class InvocationPoller:
+    def __init__(self, check_status, initial_interval=POLL_INITIAL_INTERVAL,
+                 max_interval=POLL_MAX_INTERVAL, backoff=POLL_BACKOFF,
+                 jitter=POLL_JITTER, workers=POLL_WORKERS, max_errors=POLL_MAX_ERRORS):
+        self.check_status = check_status
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.max_errors = max_errors
+        self._watches = {}
+        self._schedule = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bda-poll')
+        self._thread = threading.Thread(target=self._run, name='bda-poller', daemon=True)
+        self._thread.start()
+
+    def submit(self, invocation_arn):
+        # Every caller waiting on the same invocation shares one future and one status stream
+        with self._condition:
+            watch = self._watches.get(invocation_arn)
+            if watch is None:
+                watch = _Watch(invocation_arn)
+                self._watches[invocation_arn] = watch
+                self._push(watch, self.initial_interval)
+            return watch.future
+
+    def in_flight(self):
+        with self._condition:
+            return len(self._watches)
+
+    def _next_interval(self, attempts):
+        interval = min(self.max_interval, self.initial_interval * (self.backoff ** attempts))
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _push(self, watch, delay):
+        heapq.heappush(self._schedule, (time.monotonic() + delay, id(watch), watch))
+        self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._schedule or self._schedule[0][0] > time.monotonic():
+                    timeout = self._schedule[0][0] - time.monotonic() if self._schedule else None
+                    self._condition.wait(timeout)
+                _, _, watch = heapq.heappop(self._schedule)
+            self._executor.submit(self._check, watch)
+
+    def _check(self, watch):
+        try:
+            response = self.check_status(watch.invocation_arn)
+        except Exception as e:
+            watch.errors += 1
+            if watch.errors >= self.max_errors:
+                self._finish(watch, exception=e)
+            else:
+                with self._condition:
+                    self._push(watch, self._next_interval(watch.attempts + watch.errors))
+            return
+
+        watch.errors = 0
+        status = response.get('status')
+        if status == SUCCESS_STATUS:
+            self._finish(watch, result=response)
+        elif status in FAILED_STATUSES:
+            self._finish(watch, exception=InvocationFailed(watch.invocation_arn, response))
+        else:
+            watch.attempts += 1
+            with self._condition:
+                self._push(watch, self._next_interval(watch.attempts))
+
+    def _finish(self, watch, result=None, exception=None):
+        with self._condition:
+            self._watches.pop(watch.invocation_arn, None)
+        if watch.future.done():
+            return
+        if exception is not None:
+            watch.future.set_exception(exception)
+        else:
+            watch.future.set_result(result)
+
+
+_default_poller = None
+_default_poller_lock = threading.Lock()
+
+
+def get_invocation_poller(check_status):
+    # One poller per process multiplexes the status checks of every session
+    global _default_poller
+    with _default_poller_lock:
+        if _default_poller is None:
+            _default_poller = InvocationPoller(check_status)
+        return _default_poller
@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+# Preview configuration
+PREVIEW_CACHE_MAX_DOCUMENTS = int(os.environ.get('PREVIEW_CACHE_MAX_DOCUMENTS', '32'))
+PREVIEW_WORKERS = int(os.environ.get('PREVIEW_WORKERS', '4'))
+PREVIEW_THUMBNAIL_SIZE = (320, 320)
+
+
+def _thumbnail_png(image_bytes):
+    from PIL import Image
+    image = Image.open(BytesIO(image_bytes))
+    image.thumbnail(PREVIEW_THUMBNAIL_SIZE)
+    output = BytesIO()
+    image.save(output, format='PNG')
+    return output.getvalue()
+
+
+class DocumentPreview:
+    # Page index for one document. Nothing is extracted until a page is viewed,
+    # and each page is extracted at most once.
+    def __init__(self, document_hash, data, content_type):
+        self.document_hash = document_hash
+        self.data = data
+        self.content_type = content_type
+        self._reader = None
+        self._texts = {}
+        self._thumbnails = {}
+        self._lock = threading.Lock()
+
+    @property
+    def is_pdf(self):
+        return self.content_type == 'application/pdf'
+
+    def _pdf_reader(self):
+        # Only parses the cross-reference table; page content is decoded on demand
+        if self._reader is None:
+            # PyPDF2 is only imported when a PDF is previewed
+            import PyPDF2
+            self._reader = PyPDF2.PdfReader(BytesIO(self.data))
+        return self._reader
+
+    @property
+    def page_count(self):
+        if not self.is_pdf:
+            return 1
+        with self._lock:
+            return len(self._pdf_reader().pages)
+
+    def page_text(self, page_number):
+        if not self.is_pdf:
+            return ''
+        with self._lock:
+            if page_number not in self._texts:
+                self._texts[page_number] = self._pdf_reader().pages[page_number].extract_text()
+            return self._texts[page_number]
+
+    def page_thumbnail(self, page_number):
+        with self._lock:
+            if page_number not in self._thumbnails:
+                self._thumbnails[page_number] = self._render_thumbnail(page_number)
+            return self._thumbnails[page_number]
+
+    def _render_thumbnail(self, page_number):
+        if not self.is_pdf:
+            return _thumbnail_png(self.data)
+        # PyPDF2 cannot rasterize pages, so use the first embedded image (scanned payslips are one image per page)
+        try:
+            images = self._pdf_reader().pages[page_number].images
+            if images:
+                return _thumbnail_png(images[0].data)
+        except Exception as e:
+            print(f"Could not extract thumbnail for page {page_number + 1}: {e}")
+        return None
+
+    def render_page(self, page_number):
+        return self.page_text(page_number), self.page_thumbnail(page_number)
+
+
+class PreviewCache:
+    def __init__(self, max_documents=PREVIEW_CACHE_MAX_DOCUMENTS, workers=PREVIEW_WORKERS):
+        self.max_documents = max_documents
+        self._previews = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+
+    def get(self, document_hash, data, content_type):
+        with self._lock:
+            preview = self._previews.get(document_hash)
+            if preview is None:
+                preview = DocumentPreview(document_hash, data, content_type)
+                self._previews[document_hash] = preview
+            self._previews.move_to_end(document_hash)
+            while len(self._previews) > self.max_documents:
+                self._previews.popitem(last=False)
+            return preview
+
+    def render_async(self, preview, page_number):
+        # Returns a future of (text, thumbnail PNG bytes) so the caller can keep working
+        return self._executor.submit(preview.render_page, page_number)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_preview_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PreviewCache()
+        return _default_cache
@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_clients import AWS_INVOKE_MAX_ATTEMPTS, AWS_REGION, get_client
+from extraction import bucket_name
+
+# Prewarm configuration
+PREWARM_CONNECTIONS = int(os.environ.get('PREWARM_CONNECTIONS', '4'))
+PREWARM_IMPORTS = ('pandas', 'PyPDF2', 'PIL.Image')
+# Any well-formed ARN works: the request fails, but only after the TLS connection is pooled
+_PREWARM_INVOCATION_ARN = f'arn:aws:bedrock:{AWS_REGION}:000000000000:data-automation-invocation/prewarm'
+
+
+def _warm_s3():
+    if bucket_name:
+        get_client('s3').head_bucket(Bucket=bucket_name)
+
+
+def _warm_bda():
+    get_client('bedrock-data-automation-runtime').get_data_automation_status(invocationArn=_PREWARM_INVOCATION_ARN)
+
+
+def _warm_bda_invoke():
+    # Invocations admitted by the engine use a client of their own (see ExtractionEngine.invoke)
+    get_client('bedrock-data-automation-runtime', max_attempts=AWS_INVOKE_MAX_ATTEMPTS).get_data_automation_status(
+        invocationArn=_PREWARM_INVOCATION_ARN
+    )
+
+
+def warm_connections(connections=PREWARM_CONNECTIONS):
+    # Concurrent requests each open their own connection, so `connections` sockets per client stay pooled
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=connections * 3) as executor:
+        futures = [executor.submit(warm) for warm in (_warm_s3, _warm_bda, _warm_bda_invoke) for _ in range(connections)]
+    errors = {type(future.exception()).__name__ for future in futures if future.exception()}
+    print(f"Prewarmed S3 and BDA connections in {time.perf_counter() - started:.2f}s"
+          + (f" (ignored: {', '.join(sorted(errors))})" if errors else ""), flush=True)
+
+
+def warm_imports():
+    for module in PREWARM_IMPORTS:
+        __import__(module)
+
+
+def main():
+    # Runs in the Streamlit server process, so the pooled connections and imported modules
+    # are the ones the first session uses. The server (and its health check) only comes up
+    # once the connections are open.
+    warm_connections()
+    # Heavy modules the first table or PDF preview needs load while the server starts
+    threading.Thread(target=warm_imports, name='prewarm-imports', daemon=True).start()
+
+    from streamlit.web import cli
+    sys.argv = ['streamlit'] + sys.argv[1:]
+    sys.exit(cli.main())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+import time
+
+from admission import ADMISSION_ENABLED, ADMISSION_INITIAL_CONCURRENCY, AdmissionController
+from aws_clients import AWS_REGION, arn_region, set_bucket_region
+from blueprint_registry import get_data_automation_arns, validate_arns
+from extraction import bucket_name
+
+# Region configuration. BDA_REGIONS is a JSON list of {"region", "bucket"} (optionally with
+# "data_automation_arns"); each region needs its own bucket, since BDA only reads and writes S3 in
+# its own region. Without it everything runs in AWS_REGION as before.
+BDA_REGIONS = os.environ.get('BDA_REGIONS')
+# Written by create_bedrock_data_automation.py after provisioning every configured region
+DATA_AUTOMATION_REGIONS_PATH = os.environ.get(
+    'DATA_AUTOMATION_REGIONS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_automation_regions.json')
+)
+# Weight of the newest job in each region's moving average of BDA processing time
+REGION_LATENCY_SMOOTHING = float(os.environ.get('REGION_LATENCY_SMOOTHING', '0.2'))
+# A region that throttled is passed over for this long while another region can take the work
+REGION_COOLDOWN_SECONDS = float(os.environ.get('REGION_COOLDOWN_SECONDS', '10'))
+# Assumed job time for regions with no finished job yet, until one has been observed anywhere
+REGION_DEFAULT_LATENCY = float(os.environ.get('REGION_DEFAULT_LATENCY', '30'))
+
+
+class Region:
+    # One region/bucket/projects triple. Like AdmissionController, its methods other than
+    # load() must be called from the engine's event loop.
+    def __init__(self, name, bucket, data_automation_arns, admission=None):
+        self.name = name
+        self.bucket = bucket
+        self.data_automation_arns = dict(data_automation_arns)
+        self.admission = admission
+        self.latency = None
+        self.cooling_until = 0.0
+        self.invocations = 0
+        self.throttled = 0
+        self._running = {}
+
+    def load(self):
+        # (queued + running) jobs per unit of concurrency limit; above 1 new work waits here
+        if self.admission is not None:
+            return (self.admission.queue_depth() + self.admission.in_flight) / max(1, int(self.admission.limit))
+        return len(self._running) / ADMISSION_INITIAL_CONCURRENCY
+
+    def cooling(self, now=None):
+        return (now or time.monotonic()) < self.cooling_until
+
+    def holds(self, s3_uri):
+        return s3_uri.startswith(f"s3://{self.bucket}/")
+
+    async def acquire(self, lane):
+        if self.admission is not None:
+            await self.admission.acquire(lane)
+
+    def release(self):
+        if self.admission is not None:
+            self.admission.release()
+
+    def admitted(self, invocation_arn):
+        self.invocations += 1
+        self._running[invocation_arn] = time.monotonic()
+        if self.admission is not None:
+            self.admission.admitted(invocation_arn)
+
+    def finished(self, invocation_arn, succeeded):
+        started = self._running.pop(invocation_arn, None)
+        # Only jobs started here count towards latency; resumed ones were never timed
+        if started is not None and succeeded:
+            elapsed = time.monotonic() - started
+            self.latency = elapsed if self.latency is None else \
+                (1 - REGION_LATENCY_SMOOTHING) * self.latency + REGION_LATENCY_SMOOTHING * elapsed
+        if self.admission is not None:
+            self.admission.finished(invocation_arn)
+
+    def on_throttle(self):
+        self.throttled += 1
+        self.cooling_until = time.monotonic() + REGION_COOLDOWN_SECONDS
+        if self.admission is not None:
+            self.admission.on_throttle()
+
+    def to_dict(self):
+        return {
+            'region': self.name,
+            'bucket': self.bucket,
+            'latency_seconds': round(self.latency, 3) if self.latency is not None else None,
+            'load': round(self.load(), 3),
+            'cooling': self.cooling(),
+            'invocations': self.invocations,
+            'throttled': self.throttled,
+        }
+
+
+class RegionRouter:
+    # Spreads invocations over every region that has a project for the document type, picking the
+    # one expected to finish a new job soonest: observed job latency scaled by how full its
+    # concurrency limit is. Regions that throttled recently are skipped while another has headroom.
+    def __init__(self, regions):
+        if not regions:
+            raise ValueError("At least one region is required")
+        self.regions = {region.name: region for region in regions}
+        self.primary = self.regions.get(AWS_REGION, regions[0])
+        # Any region's project ARN -> document type, so callers can keep passing the primary ARN
+        self._document_types = {
+            arn: document_type
+            for region in regions
+            for document_type, arn in region.data_automation_arns.items()
+        }
+        for region in regions:
+            set_bucket_region(region.bucket, region.name)
+
+    @property
+    def multi_region(self):
+        return len(self.regions) > 1
+
+    def candidates(self, data_automation_arn):
+        # [(region, that region's project ARN)] for the project's document type
+        document_type = self._document_types.get(data_automation_arn)
+        candidates = [
+            (region, region.data_automation_arns[document_type])
+            for region in self.regions.values()
+            if document_type is not None and document_type in region.data_automation_arns
+        ]
+        if not candidates:
+            # A project the configuration does not know runs where it lives
+            region = self.regions.get(arn_region(data_automation_arn), self.primary)
+            candidates = [(region, data_automation_arn)]
+        return candidates
+
+    def _expected_seconds(self, region):
+        observed = [other.latency for other in self.regions.values() if other.latency is not None]
+        latency = region.latency
+        if latency is None:
+            latency = sum(observed) / len(observed) if observed else REGION_DEFAULT_LATENCY
+        return latency * (1 + region.load())
+
+    def choose(self, data_automation_arn):
+        now = time.monotonic()
+        candidates = self.candidates(data_automation_arn)
+        # When every region throttled recently, their (already reduced) limits decide alone
+        available = [candidate for candidate in candidates if not candidate[0].cooling(now)] or candidates
+        return min(available, key=lambda candidate: self._expected_seconds(candidate[0]))
+
+    def all_cooling(self, data_automation_arn):
+        now = time.monotonic()
+        return all(region.cooling(now) for region, _ in self.candidates(data_automation_arn))
+
+    def region_of(self, arn):
+        return self.regions.get(arn_region(arn))
+
+    def finished(self, invocation_arn, succeeded):
+        region = self.region_of(invocation_arn)
+        if region is not None:
+            region.finished(invocation_arn, succeeded)
+
+    def stats(self):
+        return [region.to_dict() for region in self.regions.values()]
+
+
+def load_region_settings():
+    # [{"region", "bucket", "data_automation_arns"}]. Sources: BDA_REGIONS, with project ARNs
+    # missing there taken from the published provisioning output, then the published file alone.
+    published = []
+    if os.path.exists(DATA_AUTOMATION_REGIONS_PATH):
+        with open(DATA_AUTOMATION_REGIONS_PATH) as f:
+            published = json.load(f)
+    settings = json.loads(BDA_REGIONS) if BDA_REGIONS else published
+    published_arns = {entry['region']: entry.get('data_automation_arns', {}) for entry in published}
+    regions = []
+    for entry in settings:
+        if not entry.get('region') or not entry.get('bucket'):
+            raise ValueError(f"BDA_REGIONS: every entry needs a region and a bucket: {entry!r}")
+        arns = entry.get('data_automation_arns') or published_arns.get(entry['region'], {})
+        regions.append({
+            'region': entry['region'],
+            'bucket': entry['bucket'],
+            'data_automation_arns': validate_arns(arns, f"BDA_REGIONS[{entry['region']}]"),
+        })
+    return regions
+
+
+def publish_region_settings(regions, path=DATA_AUTOMATION_REGIONS_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(regions, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_router(settings=None, admission=ADMISSION_ENABLED):
+    settings = load_region_settings() if settings is None else settings
+    if not settings:
+        settings = [{'region': AWS_REGION, 'bucket': bucket_name, 'data_automation_arns': get_data_automation_arns()}]
+    regions = []
+    for entry in settings:
+        arns = entry['data_automation_arns']
+        if entry['region'] == AWS_REGION and not arns:
+            # The home region falls back to the single-region configuration
+            arns = get_data_automation_arns()
+        controller = AdmissionController(region=entry['region']) if admission else None
+        regions.append(Region(entry['region'], entry['bucket'], arns, controller))
+    return RegionRouter(regions)
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_region_router():
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = build_router()
+        return _default_router
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from aws_clients import get_client
+
+# Cache configuration
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '256'))
+RESULT_CACHE_DIR = os.environ.get(
+    'RESULT_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'bda_results')
+)
+# When set, the persistent tier is an S3 manifest instead of local disk so
+# every container behind the load balancer shares the same results.
+RESULT_CACHE_S3_BUCKET = os.environ.get('RESULT_CACHE_S3_BUCKET')
+RESULT_CACHE_S3_PREFIX = os.environ.get('RESULT_CACHE_S3_PREFIX', 'result_cache')
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+# Bump when the shape of cached results changes so old entries are never misread
+RESULT_FORMAT_VERSION = 2
+
+
+def hash_document(file):
+    # Hash the document in chunks so large PDFs are never copied in full
+    digest = hashlib.sha256()
+    if isinstance(file, (bytes, bytearray, memoryview)):
+        digest.update(file)
+        return digest.hexdigest()
+
+    position = file.tell()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+def compute_cache_key(document_hash, data_automation_arn, stage='LIVE'):
+    # A result is only reusable for the same bytes run through the same project and stage
+    key = f"v{RESULT_FORMAT_VERSION}|{document_hash}|{data_automation_arn}|{stage}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DiskCache:
+    def __init__(self, directory=RESULT_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class S3ManifestCache:
+    def __init__(self, bucket, prefix=RESULT_CACHE_S3_PREFIX, s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/')
+        self.s3_client = s3_client or get_client('s3')
+
+    def _key(self, key):
+        return f"{self.prefix}/{key[:2]}/{key}.json"
+
+    def get(self, key):
+        try:
+            result = self.s3_client.get_object(Bucket=self.bucket, Key=self._key(key))
+            return json.loads(result['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key, value):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(key),
+            Body=json.dumps(value).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+
+class ResultCache:
+    def __init__(self, memory=None, persistent=None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.persistent = persistent
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.persistent is None:
+            return None
+        try:
+            value = self.persistent.get(key)
+        except Exception as e:
+            # A broken persistent tier only costs us a cache miss
+            print(f"Result cache read failed: {e}")
+            return None
+        if value is not None:
+            self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.persistent is None:
+            return
+        try:
+            self.persistent.put(key, value)
+        except Exception as e:
+            print(f"Result cache write failed: {e}")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    # One cache per process, shared by every Streamlit session
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            if RESULT_CACHE_S3_BUCKET:
+                persistent = S3ManifestCache(RESULT_CACHE_S3_BUCKET)
+            else:
+                persistent = DiskCache()
+            _default_cache = ResultCache(LRUCache(), persistent)
+        return _default_cache
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import re
+import time
+import uuid
+from datetime import date, datetime, timezone
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from blueprint_registry import get_blueprints
+
+# Result store configuration
+RESULT_STORE_DIR = os.environ.get('RESULT_STORE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'bda_result_store'))
+
+# Columns every row carries besides the blueprint fields
+METADATA_FIELDS = [
+    pa.field('document', pa.string()),
+    pa.field('segment', pa.int32()),
+    pa.field('page_indices', pa.list_(pa.int32())),
+    pa.field('document_class', pa.string()),
+    pa.field('extracted_at', pa.timestamp('ms', tz='UTC')),
+]
+
+_COMPARISONS = {
+    '>=': pc.greater_equal,
+    '>': pc.greater,
+    '<=': pc.less_equal,
+    '<': pc.less,
+    '==': pc.equal,
+}
+
+
+def _is_date_field(field):
+    # Blueprints ask for dates as strings "in YYYY-MM-DD Format"; those are stored as real dates
+    return field.get('type') == 'string' and 'YYYY-MM-DD' in field.get('description', '')
+
+
+def arrow_type(field):
+    if field.get('type') == 'number':
+        return pa.float64()
+    if field.get('type') == 'boolean':
+        return pa.bool_()
+    if _is_date_field(field):
+        return pa.date32()
+    return pa.string()
+
+
+def arrow_schema(definition):
+    return pa.schema(METADATA_FIELDS + [
+        pa.field(name, arrow_type(field)) for name, field in definition.fields.items()
+    ])
+
+
+def _coerce(value, arrow_data_type):
+    # BDA returns what the model read; anything that does not fit the declared type becomes null
+    if value is None or value == '':
+        return None
+    try:
+        if pa.types.is_floating(arrow_data_type):
+            if isinstance(value, str):
+                value = re.sub(r'[^0-9.\-]', '', value)
+            return float(value)
+        if pa.types.is_boolean(arrow_data_type):
+            if isinstance(value, str):
+                return {'true': True, 'yes': True, 'false': False, 'no': False}.get(value.strip().lower())
+            return bool(value)
+        if pa.types.is_date32(arrow_data_type):
+            return value if isinstance(value, date) else datetime.strptime(str(value).strip()[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def to_table(definition, results):
+    # results: iterable of (document, extraction result) with the {'segments': [...]} layout;
+    # every segment becomes one row
+    schema = arrow_schema(definition)
+    extracted_at = datetime.now(timezone.utc)
+    columns = {field.name: [] for field in schema}
+    for document, result in results:
+        for segment in result.get('segments', []):
+            inference_result = segment.get('inference_result') or {}
+            columns['document'].append(document)
+            columns['segment'].append(segment.get('segment'))
+            columns['page_indices'].append(segment.get('page_indices') or [])
+            columns['document_class'].append(segment.get('document_class'))
+            columns['extracted_at'].append(extracted_at)
+            for name in definition.fields:
+                columns[name].append(_coerce(inference_result.get(name), schema.field(name).type))
+    return pa.Table.from_pydict(columns, schema=schema)
+
+
+def check_table(definition, table):
+    # Vectorized consistency checks over a whole table: one boolean column per check, true when
+    # the row passes. Rows where either side is missing pass, since there is nothing to compare.
+    results = {}
+    for check in definition.checks:
+        compare = _COMPARISONS[check['op']]
+        passed = compare(table[check['left']], table[check['right']])
+        results[check['name']] = pc.fill_null(passed, True)
+    return pa.table(results) if results else pa.table({})
+
+
+def violation_counts(definition, table):
+    checks = check_table(definition, table)
+    return {
+        name: table.num_rows - (pc.sum(column.cast(pa.int64())).as_py() or 0)
+        for name, column in zip(checks.column_names, checks.columns)
+    }
+
+
+def _slug(document_type):
+    return re.sub(r'[^a-z0-9]+', '_', document_type.lower()).strip('_')
+
+
+class ResultStore:
+    # One directory per document type holding immutable Parquet parts; appending writes a new
+    # part and readers see every part as one dataset
+    def __init__(self, root=RESULT_STORE_DIR, definitions=None):
+        self.root = root
+        self.definitions = definitions if definitions is not None else get_blueprints()
+
+    def _definition(self, document_type):
+        if document_type not in self.definitions:
+            raise ValueError(f"No blueprint definition for document type {document_type!r}")
+        return self.definitions[document_type]
+
+    def directory(self, document_type):
+        return os.path.join(self.root, _slug(document_type))
+
+    def append(self, document_type, results):
+        definition = self._definition(document_type)
+        table = to_table(definition, results)
+        if table.num_rows == 0:
+            return None
+        directory = self.directory(document_type)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet")
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+        return path
+
+    def dataset(self, document_type):
+        return ds.dataset(self.directory(document_type), format='parquet', schema=arrow_schema(self._definition(document_type)))
+
+    def read(self, document_type, columns=None, filter=None):
+        # filter is a pyarrow.compute expression, e.g. pc.field('CurrentGrossPay') > 5000;
+        # only the requested columns and matching row groups are read
+        if not os.path.isdir(self.directory(document_type)):
+            return arrow_schema(self._definition(document_type)).empty_table()
+        return self.dataset(document_type).to_table(columns=columns, filter=filter)
+
+    def violations(self, document_type):
+        # Rows failing at least one consistency check, with a column per check
+        definition = self._definition(document_type)
+        table = self.read(document_type)
+        checks = check_table(definition, table)
+        if checks.num_columns == 0:
+            return table.slice(0, 0)
+        failed = pc.invert(checks.column(0))
+        for column in checks.columns[1:]:
+            failed = pc.or_(failed, pc.invert(column))
+        for name, column in zip(checks.column_names, checks.columns):
+            table = table.append_column(f"check_{name}", column)
+        return table.filter(failed)
+
+    def summary(self, document_type):
+        definition = self._definition(document_type)
+        table = self.read(document_type)
+        return {'rows': table.num_rows, 'violations': violation_counts(definition, table)}
+
+    def compact(self, document_type):
+        # Many small batch parts slow scans down; rewrite them as one part
+        directory = self.directory(document_type)
+        parts = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.parquet')]
+        if len(parts) < 2:
+            return None
+        # Only the parts listed above are merged, so a part appended meanwhile is left alone
+        table = ds.dataset(parts, format='parquet', schema=arrow_schema(self._definition(document_type))).to_table()
+        path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet")
+        tmp_path = f"{path}.tmp"
+        pq.write_table(table, tmp_path, compression='zstd', row_group_size=1024 * 1024)
+        os.replace(tmp_path, path)
+        for part in parts:
+            os.remove(part)
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the columnar extraction result store")
+    parser.add_argument('command', choices=('summary', 'violations', 'compact'))
+    parser.add_argument('--document-type', default='Payslip')
+    parser.add_argument('--root', default=RESULT_STORE_DIR)
+    parser.add_argument('--output', help="violations: write the failing rows to this Parquet file")
+    args = parser.parse_args()
+
+    store = ResultStore(args.root)
+    if args.command == 'summary':
+        summary = store.summary(args.document_type)
+        print(f"{summary['rows']} rows")
+        for name, count in summary['violations'].items():
+            print(f"  {name}: {count} violations")
+    elif args.command == 'violations':
+        violations = store.violations(args.document_type)
+        if args.output:
+            pq.write_table(violations, args.output)
+        check_columns = [name for name in violations.column_names if name.startswith('check_')]
+        print(f"{violations.num_rows} rows fail a check")
+        print(violations.select(['document', 'segment'] + check_columns).slice(0, 50).to_pandas().to_string())
+    else:
+        path = store.compact(args.document_type)
+        print(f"Compacted into {path}" if path else "Nothing to compact")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Key layout configuration
+S3_INPUT_PREFIX = os.environ.get('S3_INPUT_PREFIX', 'inputs')
+S3_OUTPUT_PREFIX = os.environ.get('S3_OUTPUT_PREFIX', 'outputs')
+# Leading hex characters of a hash used as a shard directory; 2 spreads keys over 256 prefixes,
+# each of which S3 can scale to its own request-rate partition
+S3_SHARD_CHARS = int(os.environ.get('S3_SHARD_CHARS', '2'))
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def _shard(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:S3_SHARD_CHARS]
+
+
+def input_key(document_hash, filename):
+    # Content-addressed: the same bytes always map to the same key, so they are stored once and
+    # two users uploading different files with the same name never collide. The extension is
+    # kept because BDA detects the file type from it.
+    extension = os.path.splitext(filename)[1].lower()
+    return f"{S3_INPUT_PREFIX}/{document_hash[:S3_SHARD_CHARS]}/{document_hash}{extension}"
+
+
+def output_prefix(job_id, when=None):
+    # One prefix per job, partitioned by day (for lifecycle rules and date-range queries)
+    # and sharded within the day so a batch run does not hammer a single prefix
+    day = datetime.fromtimestamp(when if when is not None else time.time(), timezone.utc).strftime('%Y-%m-%d')
+    return f"{S3_OUTPUT_PREFIX}/dt={day}/{_shard(job_id)}/{job_id}"
+
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+from blueprint_registry import get_data_automation_arns
+from extraction import DATA_AUTOMATION_STAGE, read_json
+from result_cache import compute_cache_key, hash_document
+from sqlite_local import ThreadLocalSQLite
+
+# Search index configuration
+SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', 'true').lower() == 'true'
+SEARCH_INDEX_PATH = os.environ.get(
+    'SEARCH_INDEX_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'bda_search.db')
+)
+SEARCH_RESULT_LIMIT = int(os.environ.get('SEARCH_RESULT_LIMIT', '50'))
+# WAL needs memory shared by every process using the file; an index on a network file system that
+# several hosts write (as in the CDK stack) uses DELETE instead
+SEARCH_INDEX_JOURNAL_MODE = os.environ.get('SEARCH_INDEX_JOURNAL_MODE', 'WAL')
+
+# One row per page of BDA standard output text. Only `text` is tokenized; the other columns
+# are stored alongside so a hit needs no second lookup.
+_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+    text,
+    document_id UNINDEXED,
+    document UNINDEXED,
+    document_type UNINDEXED,
+    page UNINDEXED,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS documents (
+    document_id TEXT PRIMARY KEY,
+    document TEXT NOT NULL,
+    document_type TEXT,
+    pages INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+"""
+
+
+def page_texts(standard_output, page_indices=(), page_offset=0):
+    # [(page index, text)] from one segment's standard output. Pages are used when the
+    # project emits them, otherwise the whole document text counts as its first page. Segments
+    # of a split bundle carry the offset of their chunk, since BDA numbers pages within the chunk.
+    pages = [
+        (page_offset + page.get('page_index', index), (page.get('representation') or {}).get('text') or '')
+        for index, page in enumerate(standard_output.get('pages') or [])
+    ]
+    if pages:
+        return pages
+    text = ((standard_output.get('document') or {}).get('representation') or {}).get('text') or ''
+    return [(page_indices[0] if page_indices else 0, text)] if text else []
+
+
+def to_match_query(query):
+    # User input becomes a conjunction of quoted terms, so FTS5 operators and punctuation in
+    # a search box cannot produce syntax errors; a trailing * keeps prefix search
+    terms = []
+    for term in re.findall(r'[\w*]+', query):
+        prefix = term.endswith('*')
+        term = term.strip('*')
+        if term:
+            terms.append(f'"{term}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+class SearchIndex:
+    def __init__(self, path=SEARCH_INDEX_PATH, journal_mode=SEARCH_INDEX_JOURNAL_MODE):
+        self.path = path
+        self._db = ThreadLocalSQLite(path, journal_mode)
+        self._db.connection().executescript(_SCHEMA)
+
+    def is_indexed(self, document_id):
+        return self._db.connection().execute(
+            "SELECT 1 FROM documents WHERE document_id = ?", (document_id,)
+        ).fetchone() is not None
+
+    def add(self, document_id, document, document_type, pages):
+        # Replaces whatever was indexed for the document, in one transaction
+        connection = self._db.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute("DELETE FROM pages WHERE document_id = ?", (document_id,))
+            connection.executemany(
+                "INSERT INTO pages (text, document_id, document, document_type, page) VALUES (?, ?, ?, ?, ?)",
+                [(text, document_id, document, document_type, page) for page, text in pages if text.strip()]
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO documents (document_id, document, document_type, pages, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (document_id, document, document_type, len(pages), time.time())
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def index_result(self, document_id, document, document_type, result):
+        # Reads the standard output of every segment of a finished extraction; documents that
+        # are already indexed are skipped, so re-running a batch or a cache hit costs one lookup
+        if self.is_indexed(document_id):
+            return 0
+        pages = []
+        for segment in result.get('segments', []):
+            if segment.get('standard_output_path'):
+                pages.extend(page_texts(
+                    read_json(segment['standard_output_path']), segment.get('page_indices'), segment.get('page_offset', 0)
+                ))
+        if pages:
+            self.add(document_id, document, document_type, pages)
+        return len(pages)
+
+    def search(self, query, document_type=None, limit=SEARCH_RESULT_LIMIT):
+        match = to_match_query(query)
+        if not match:
+            return []
+        sql = (
+            "SELECT document_id, document, document_type, page, "
+            "snippet(pages, 0, '**', '**', '...', 12) AS snippet, bm25(pages) AS rank "
+            "FROM pages WHERE pages MATCH ?"
+        )
+        parameters = [match]
+        if document_type:
+            sql += " AND document_type = ?"
+            parameters.append(document_type)
+        sql += " ORDER BY rank LIMIT ?"
+        parameters.append(limit)
+        return [dict(row) for row in self._db.connection().execute(sql, parameters)]
+
+    def stats(self):
+        row = self._db.connection().execute("SELECT COUNT(*) AS documents, COALESCE(SUM(pages), 0) AS pages FROM documents").fetchone()
+        return dict(row)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_search_index():
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = SearchIndex()
+        return _default_index
+
+
+def index_extraction(document_id, document, document_type, result):
+    # Called as jobs finish; indexing problems are logged and never fail the extraction
+    if not SEARCH_INDEX_ENABLED:
+        return 0
+    try:
+        return get_search_index().index_result(document_id, document, document_type, result)
+    except Exception as e:
+        print(f"Could not index {document}: {e}")
+        return 0
+
+
+def document_id(document, data_automation_arn, cache_key=None):
+    # The id batch_extract.py and the workers index a document under: the result cache key of a
+    # local document, so each one is indexed once however it was extracted. Documents in S3 keep
+    # their URI, as batch_extract.py does not download them.
+    if cache_key:
+        return cache_key
+    if not data_automation_arn or document.startswith('s3://') or not os.path.exists(document):
+        return document
+    with open(document, 'rb') as f:
+        return compute_cache_key(hash_document(f), data_automation_arn, DATA_AUTOMATION_STAGE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search BDA standard output text, or index batch results")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    search_parser = subparsers.add_parser('search', help="Full-text search over indexed pages")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--document-type')
+    search_parser.add_argument('--limit', type=int, default=SEARCH_RESULT_LIMIT)
+    index_parser = subparsers.add_parser('index', help="Index the documents of a batch_extract.py results file")
+    index_parser.add_argument('results', help="JSON lines written by batch_extract.py --output")
+    index_parser.add_argument('--document-type', default='Payslip', help="Type of records without one")
+    index_parser.add_argument('--data-automation-arn',
+                              help="Project ARN the batch ran with (default: the published one for --document-type)")
+    args = parser.parse_args()
+
+    index = get_search_index()
+    if args.command == 'search':
+        started = time.perf_counter()
+        hits = index.search(args.query, args.document_type, args.limit)
+        for hit in hits:
+            print(f"{hit['document']} (page {hit['page'] + 1}, {hit['document_type']}): {hit['snippet']}")
+        print(f"{len(hits)} hits in {(time.perf_counter() - started) * 1000:.1f} ms")
+    else:
+        arns = get_data_automation_arns()
+        default_arn = args.data_automation_arn or arns.get(args.document_type)
+        indexed = 0
+        with open(args.results) as f:
+            for line in f:
+                record = json.loads(line)
+                # Records carry a document type only when the classifier routed them to its project
+                document_type = record.get('document_type', args.document_type)
+                data_automation_arn = arns.get(document_type) if 'document_type' in record else default_arn
+                indexed += index_extraction(
+                    document_id(record['document'], data_automation_arn), record['document'], document_type, record
+                )
+        print(f"Indexed {indexed} pages; index holds {index.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalSQLite:
+    # One connection per thread to a SQLite file, for stores used from many threads.
+    # SQLite connections cannot be shared across threads, so each thread opens its own.
+    def __init__(self, path, journal_mode='WAL'):
+        self.path = path
+        self.journal_mode = journal_mode
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+from blueprint_registry import BlueprintDefinition
+
+
+def write_blueprint(tmp_path, op):
+    path = tmp_path / 'payslip.json'
+    path.write_text(json.dumps({
+        'document_type': 'Payslip',
+        'blueprint_name': 'payslip',
+        'project_name': 'payslip',
+        'schema': {'properties': {'GrossPay': {'type': 'number'}, 'NetPay': {'type': 'number'}}},
+        'checks': [{'name': 'net_below_gross', 'left': 'GrossPay', 'op': op, 'right': 'NetPay'}],
+    }))
+    return str(path)
+
+
+def test_check_with_known_op_loads(tmp_path):
+    blueprint = BlueprintDefinition.from_file(write_blueprint(tmp_path, '>='))
+    assert [check['op'] for check in blueprint.checks] == ['>=']
+
+
+def test_check_with_unknown_op_is_rejected(tmp_path):
+    path = write_blueprint(tmp_path, '=>')
+    with pytest.raises(ValueError, match=r"payslip\.json: check net_below_gross has unknown op '=>'"):
+        BlueprintDefinition.from_file(path)
@@ -0,0 +1,147 @@
+import re
+import time
+import uuid
+
+import pytest
+
+import jobs
+from aws_clients import set_client
+
+QUEUE_URL = 'https://sqs.test/jobs'
+ARN = 'arn:aws:bedrock:us-west-2:123456789012:data-automation-project/test'
+
+
+class FakeSQS:
+    # Messages stay receivable until deleted, so every receive is a redelivery after a dead worker
+    def __init__(self):
+        self.messages = {}
+
+    def send_message(self, QueueUrl, MessageBody):
+        self.messages.setdefault(QueueUrl, []).append({'Body': MessageBody, 'ReceiptHandle': None, 'count': 0})
+
+    def receive_message(self, QueueUrl, AttributeNames=(), **kwargs):
+        for message in self.messages.get(QueueUrl, []):
+            message['count'] += 1
+            message['ReceiptHandle'] = uuid.uuid4().hex
+            received = {'Body': message['Body'], 'ReceiptHandle': message['ReceiptHandle']}
+            if 'ApproximateReceiveCount' in AttributeNames:
+                received['Attributes'] = {'ApproximateReceiveCount': str(message['count'])}
+            return {'Messages': [received]}
+        return {}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.messages[QueueUrl] = [
+            message for message in self.messages[QueueUrl] if message['ReceiptHandle'] != ReceiptHandle
+        ]
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        pass
+
+
+def _value(attribute):
+    return float(attribute['N']) if 'N' in attribute else attribute['S']
+
+
+class FakeDynamoDB:
+    # Just enough of the expression syntax for the job store's queries
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, TableName, Item):
+        self.items[Item['id']['S']] = dict(Item)
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        item = self.items.get(Key['id']['S'])
+        return {'Item': dict(item)} if item else {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        item = self.items[Key['id']['S']]
+        for assignment in UpdateExpression[len('SET '):].split(', '):
+            name, value = assignment.split(' = ')
+            item[ExpressionAttributeNames[name]] = ExpressionAttributeValues[value]
+
+    def query(self, TableName, IndexName, KeyConditionExpression, FilterExpression, ExpressionAttributeNames,
+              ExpressionAttributeValues):
+        values = {name: _value(value) for name, value in ExpressionAttributeValues.items()}
+        condition = re.sub(r'#\w+', lambda m: f"row.get({ExpressionAttributeNames[m.group()]!r})", FilterExpression)
+        condition = re.sub(r'(?<![\w#.])(updated_at)\b', r"row.get('\1')", condition)
+        condition = re.sub(r':\w+', lambda m: f"values[{m.group()!r}]", condition)
+        condition = condition.replace(' = ', ' == ').replace(' AND ', ' and ').replace(' OR ', ' or ')
+        matches = []
+        for item in self.items.values():
+            row = {name: _value(value) for name, value in item.items()}
+            if row.get('cache_key') == values[':cache_key'] and eval(condition, {}, {'row': row, 'values': values}):
+                matches.append(dict(item))
+        return {'Items': matches}
+
+
+@pytest.fixture
+def sqs_store():
+    sqs, dynamodb = FakeSQS(), FakeDynamoDB()
+    set_client('sqs', sqs)
+    set_client('dynamodb', dynamodb)
+    yield jobs.SQSJobStore(queue_url=QUEUE_URL, table_name='jobs', spool_bucket='spool', max_receives=3), sqs, dynamodb
+    set_client('sqs', None)
+    set_client('dynamodb', None)
+
+
+def enqueue(store):
+    # Already in S3, so nothing is spooled
+    return store.enqueue('', 'doc.pdf', 'application/pdf', ARN, 'cache-key', input_s3_uri='s3://input/doc.pdf')
+
+
+def test_sqs_claim_fails_job_on_last_delivery(sqs_store):
+    store, sqs, _ = sqs_store
+    job_id = enqueue(store)
+    for delivery in range(2):
+        job = store.claim(f"worker-{delivery}")
+        assert job.id == job_id
+        store.update(job_id, status=jobs.RUNNING)
+
+    assert store.claim('worker-2') is None
+    job = store.get(job_id)
+    assert job.status == jobs.FAILED
+    assert job.error
+    assert sqs.messages[QUEUE_URL] == []
+    assert store.find_active('cache-key') is None
+
+
+def test_sqs_find_active_ignores_stale_running_job(sqs_store):
+    store, _, dynamodb = sqs_store
+    job_id = enqueue(store)
+    assert store.find_active('cache-key').id == job_id
+
+    store.claim('worker')
+    store.update(job_id, status=jobs.RUNNING)
+    dynamodb.items[job_id]['updated_at'] = {'N': repr(time.time() - 2 * jobs.JOB_LEASE_SECONDS)}
+    assert store.find_active('cache-key') is None
+
+    # A live worker's heartbeat keeps the job active
+    store.heartbeat([job_id])
+    assert store.find_active('cache-key').id == job_id
+
+
+def test_sqlite_find_active_ignores_stale_running_job(tmp_path):
+    store = jobs.SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    job_id = enqueue(store)
+    store.claim('worker')
+    store.update(job_id, status=jobs.RUNNING)
+    assert store.find_active('cache-key').id == job_id
+    assert store.find_active('cache-key', lease_seconds=-1) is None
+
+
+def test_sqlite_store_keeps_output_location(tmp_path):
+    store = jobs.SQLiteJobStore(str(tmp_path / 'jobs.db'))
+    job_id = enqueue(store)
+    store.update(job_id, invocation_arn='arn:invocation', output_s3_uri='s3://bucket/outputs/dt=2024-01-01/ab/job')
+    job = store.get(job_id)
+    assert (job.input_s3_uri, job.output_s3_uri) == ('s3://input/doc.pdf', 's3://bucket/outputs/dt=2024-01-01/ab/job')
+
+
+def test_incomplete_backend_fails_on_construction():
+    class Partial(jobs.JobStore):
+        def get(self, job_id):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
@@ -0,0 +1,163 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+
+from admission import INTERACTIVE, LANES
+from async_pipeline import get_engine
+from jobs import get_job_store, fetch_spooled, remove_spooled, RUNNING, SUCCEEDED, FAILED, JOB_LEASE_SECONDS
+from metrics import Trace, emit_emf_value, registry, start_metrics_server
+from result_cache import get_result_cache
+from search_index import document_id, index_extraction
+
+# Worker configuration
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', '16'))
+WORKER_IDLE_SECONDS = float(os.environ.get('WORKER_IDLE_SECONDS', '1.0'))
+# Slots batch jobs may not take, so an upload arriving during a backfill is claimed straight away
+WORKER_INTERACTIVE_RESERVE = int(os.environ.get('WORKER_INTERACTIVE_RESERVE', '4'))
+# Dimension of the JobsInFlight CloudWatch metric that the worker service scales on
+WORKER_SERVICE_NAME = os.environ.get('WORKER_SERVICE_NAME', 'worker')
+
+JOBS_IN_FLIGHT = registry.gauge('worker_jobs_in_flight', 'Jobs this worker process is running')
+
+
+async def process_job(engine, store, job, trace):
+    # A job that already has an invocation ARN was started by a worker that died; resume it
+    invocation_arn = job.invocation_arn
+    result = None
+    document_path = job.document_path
+    if not invocation_arn and not job.input_s3_uri:
+        # The document may have been spooled to S3 by another container
+        document_path = await engine.run_blocking(fetch_spooled, job.document_path)
+        # A bundle of documents runs as one invocation per document; a resumed bundle job starts
+        # over, with the chunks that already finished coming from the result cache
+        result = await engine.extract_bundle(
+            document_path, job.filename, job.content_type, job.data_automation_arn,
+            job.attributes.get('document_type'), lane=job.lane, trace=trace
+        )
+    if result is None:
+        if not invocation_arn:
+            input_s3_uri = job.input_s3_uri
+            if not input_s3_uri:
+                input_s3_uri = await engine.upload_file(document_path, job.filename, job.content_type, trace=trace)
+                await engine.run_blocking(store.update, job.id, status=RUNNING, input_s3_uri=input_s3_uri)
+            # Admitted in the job's lane, so uploads go ahead of batch documents in every worker
+            invocation_arn, output_s3_uri = await engine.invoke(
+                input_s3_uri, job.data_automation_arn, job_id=job.id, lane=job.lane, trace=trace
+            )
+            await engine.run_blocking(
+                store.update, job.id, status=RUNNING, invocation_arn=invocation_arn, output_s3_uri=output_s3_uri,
+                timings=trace.timings
+            )
+        result = await engine.collect(invocation_arn, trace=trace)
+
+    if job.cache_key:
+        await engine.run_blocking(get_result_cache().put, job.cache_key, result)
+    await engine.run_blocking(store.update, job.id, status=SUCCEEDED, result=result, timings=trace.timings)
+    # After the job is marked done, so the user never waits on the index. Indexed under the same
+    # id as batch_extract.py uses, so re-runs are not indexed twice.
+    indexed_id = await engine.run_blocking(
+        document_id, job.input_s3_uri or document_path, job.data_automation_arn, job.cache_key
+    )
+    await engine.run_blocking(
+        index_extraction, indexed_id, job.filename, job.attributes.get('document_type'), result
+    )
+    await engine.run_blocking(remove_spooled, job.document_path)
+
+
+async def run_worker(worker_id, concurrency=WORKER_CONCURRENCY, stop_event=None):
+    engine = get_engine()
+    store = get_job_store()
+    in_flight = {}
+    batch_slots = max(1, concurrency - WORKER_INTERACTIVE_RESERVE)
+
+    async def run_one(job):
+        trace = Trace(timings=job.timings, **job.attributes)
+        if 'queue' not in trace.timings:
+            trace.record('queue', time.time() - job.created_at)
+        try:
+            await process_job(engine, store, job, trace)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            await engine.run_blocking(store.update, job.id, status=FAILED, error=str(e), timings=trace.timings)
+        finally:
+            in_flight.pop(job.id, None)
+
+    # Store calls run on the engine's I/O threads: a shared store is a network round trip away
+    heartbeat_due = 0.0
+    while stop_event is None or not stop_event.is_set():
+        loop_time = asyncio.get_running_loop().time()
+        if loop_time >= heartbeat_due:
+            # Keep our leases alive and pick up jobs abandoned by dead workers
+            await engine.run_blocking(store.heartbeat, list(in_flight))
+            await engine.run_blocking(store.release_expired)
+            heartbeat_due = loop_time + JOB_LEASE_SECONDS / 4
+            # Sampled for the worker service's autoscaling on in-flight jobs
+            JOBS_IN_FLIGHT.set(len(in_flight))
+            emit_emf_value('JobsInFlight', len(in_flight), Service=WORKER_SERVICE_NAME)
+
+        job = None
+        if len(in_flight) < concurrency:
+            lanes = LANES if len(in_flight) < batch_slots else (INTERACTIVE,)
+            job = await engine.run_blocking(store.claim, worker_id, lanes)
+        if job is None:
+            await asyncio.sleep(WORKER_IDLE_SECONDS)
+            continue
+        await engine.run_blocking(store.update, job.id, status=RUNNING)
+        in_flight[job.id] = asyncio.ensure_future(run_one(job))
+
+
+def new_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def start_embedded_worker(concurrency=WORKER_CONCURRENCY):
+    # Runs a worker on the shared engine loop inside this process (used by the Streamlit app
+    # when no separate worker service is deployed)
+    stop_event = threading.Event()
+    get_engine().submit(run_worker(new_worker_id(), concurrency, stop_event))
+    return stop_event
+
+
+def _worker_process(concurrency, metrics_port=0):
+    start_metrics_server(metrics_port)
+    engine = get_engine()
+    engine.run(run_worker(new_worker_id(), concurrency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run extraction workers that drain the job store")
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('WORKER_PROCESSES', '1')),
+                        help="Worker processes to start")
+    parser.add_argument('--concurrency', type=int, default=WORKER_CONCURRENCY,
+                        help="Jobs each process keeps in flight")
+    parser.add_argument('--metrics-port', type=int, default=int(os.environ.get('METRICS_PORT', '0')),
+                        help="First Prometheus port (one per process, 0 disables)")
+    args = parser.parse_args()
+
+    metrics_port = args.metrics_port
+    if args.processes == 1:
+        _worker_process(args.concurrency, metrics_port)
+        return
+
+    # Each process exports its own metrics on consecutive ports
+    processes = [
+        multiprocessing.Process(
+            target=_worker_process,
+            args=(args.concurrency, metrics_port + index if metrics_port else 0),
+            daemon=True
+        )
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()